@@ -0,0 +1,241 @@
+"""
+A bounded cache on top of AVLTree.
+
+Entries are kept in an AVLTree ordered by key, so the cache can also be read
+in key order. Limits on the number of entries and on their total size in bytes
+are enforced by evicting one entry at a time, chosen by the eviction policy:
+
+	'lru'      the least recently used entry
+	'ttl'      the entry that expires first
+	'min_key'  the entry with the smallest key
+	'max_key'  the entry with the largest key
+
+The recency and expiry orders are kept in two more AVLTrees, whose nodes are
+referenced from the entries, so every eviction and every access costs O(log n).
+Expired entries are dropped lazily, when they are read and before every put.
+"""
+
+import sys
+import time
+
+from AVLTree import AVLTree
+
+
+POLICIES = ('lru', 'ttl', 'min_key', 'max_key')
+
+NO_EXPIRY = float('inf')
+
+
+"""The cached value of one key with its bookkeeping"""
+
+class _Entry(object):
+	__slots__ = ('value', 'nbytes', 'expires', 'recency_node', 'expiry_node')
+
+	def __init__(self, value, nbytes, expires):
+		self.value = value
+		self.nbytes = nbytes
+		self.expires = expires
+		self.recency_node = None  # node of the entry in the recency tree, keyed by access tick
+		self.expiry_node = None  # node of the entry in the expiry tree, keyed by (expires, tick)
+
+
+"""
+A class implementing a size-bounded ordered cache.
+"""
+
+class AVLCache(object):
+
+	"""Constructor
+
+	@type max_size: int
+	@param max_size: the largest number of entries, None for no limit
+	@type max_bytes: int
+	@param max_bytes: the largest total size of the values, None for no limit
+	@type policy: str
+	@param policy: which entry is evicted when a limit is exceeded, one of POLICIES
+	@type ttl: float
+	@param ttl: seconds an entry lives after it is put, None for no expiry
+	@type sizeof: callable
+	@param sizeof: returns the size in bytes of a value, sys.getsizeof by default
+	@type clock: callable
+	@param clock: returns the current time in seconds
+	"""
+	def __init__(self, max_size=None, max_bytes=None, policy='lru', ttl=None, sizeof=None, clock=time.monotonic):
+		if policy not in POLICIES:
+			raise ValueError("unknown eviction policy %r" % (policy,))
+		if max_size is not None and max_size < 0:
+			raise ValueError("max_size must not be negative")
+		if max_bytes is not None and max_bytes < 0:
+			raise ValueError("max_bytes must not be negative")
+		self.max_size = max_size
+		self.max_bytes = max_bytes
+		self.policy = policy
+		self.ttl = ttl
+		self.sizeof = sizeof if sizeof is not None else sys.getsizeof
+		self.clock = clock
+		self.tree = AVLTree()  # key -> _Entry
+		# the secondary orders map to the node of the entry in self.tree
+		self._recency = AVLTree()  # access tick -> node, kept only for the 'lru' policy
+		self._expiry = AVLTree()  # (expires, tick) -> node, for every entry that expires
+		self._tick = 0
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0  # entries removed to respect max_size or max_bytes
+		self.expirations = 0  # entries removed because their ttl ran out
+
+	"""returns the value of key, and marks it as recently used
+
+	@returns: the value, default if key is not cached or has expired
+	"""
+	def get(self, key, default=None):
+		node, edges = self.tree.search(key)
+		if node is not None and node.value.expires <= self.clock():
+			self._remove(node)
+			self.expirations += 1
+			node = None
+		if node is None:
+			self.misses += 1
+			return default
+		self.hits += 1
+		if self.policy == 'lru':
+			self._touch(node)
+		return node.value.value
+
+	"""caches value under key, replacing the current value, then evicts entries while a limit is exceeded
+
+	@type ttl: float
+	@param ttl: seconds this entry lives, the ttl of the cache if None
+	@rtype: None
+	"""
+	def put(self, key, value, ttl=None):
+		now = self.clock()
+		self.expire(now)
+		ttl = ttl if ttl is not None else self.ttl
+		expires = now + ttl if ttl is not None else NO_EXPIRY
+		nbytes = self.sizeof(value)
+
+		node, edges = self.tree.search(key)
+		if node is None:
+			node, edges, promotes = self.tree.insert(key, _Entry(value, nbytes, expires))
+		else:
+			entry = node.value
+			self.nbytes -= entry.nbytes
+			entry.value = value
+			entry.nbytes = nbytes
+			if entry.expiry_node is not None:
+				self._expiry.delete(entry.expiry_node)
+				entry.expiry_node = None
+			entry.expires = expires
+		self.nbytes += nbytes
+		self._touch(node)
+		self._evict()
+		return None
+
+	"""removes key from the cache
+
+	@rtype: bool
+	@returns: True if key was cached (even if it had expired)
+	"""
+	def remove(self, key):
+		node, edges = self.tree.search(key)
+		if node is None:
+			return False
+		self._remove(node)
+		return True
+
+	"""drops every entry that has expired, in O(log n) per entry
+
+	@type now: float
+	@param now: the current time, read from the clock if None
+	@rtype: int
+	@returns: the number of entries dropped
+	"""
+	def expire(self, now=None):
+		if now is None:
+			now = self.clock()
+		dropped = 0
+		while self._expiry.size() > 0:
+			first = self._expiry.min_node()
+			if first.key[0] > now:
+				break
+			self._remove(first.value)
+			dropped += 1
+		self.expirations += dropped
+		return dropped
+
+	"""lazily iterates over the live entries in increasing order of key, without marking them as used
+
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi
+	"""
+	def items(self, lo=None, hi=None):
+		now = self.clock()
+		for key, entry in self.tree.items(lo, hi):
+			if entry.expires > now:
+				yield key, entry.value
+
+	def __contains__(self, key):
+		node, edges = self.tree.search(key)
+		return node is not None and node.value.expires > self.clock()
+
+	def __len__(self):
+		return self.tree.size()
+
+	"""returns the hit, miss and removal counters
+
+	@rtype: dict
+	"""
+	def stats(self):
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'expirations': self.expirations,
+			'size': self.tree.size(),
+			'bytes': self.nbytes,
+		}
+
+	"""gives the entry of node a new access tick, and puts it in the expiry order if needed
+	"""
+	def _touch(self, node):
+		entry = node.value
+		self._tick += 1
+		if self.policy == 'lru':
+			if entry.recency_node is not None:
+				self._recency.delete(entry.recency_node)
+			# ticks only grow, so the new node goes next to the max
+			entry.recency_node = self._recency.finger_insert(self._tick, node)[0]
+		if entry.expiry_node is None and (entry.expires != NO_EXPIRY or self.policy == 'ttl'):
+			entry.expiry_node = self._expiry.insert((entry.expires, self._tick), node)[0]
+
+	"""removes the entry of node from the cache and from the secondary orders
+	"""
+	def _remove(self, node):
+		entry = node.value
+		if entry.recency_node is not None:
+			self._recency.delete(entry.recency_node)
+		if entry.expiry_node is not None:
+			self._expiry.delete(entry.expiry_node)
+		self.nbytes -= entry.nbytes
+		self.tree.delete(node)
+
+	"""evicts entries by the policy until both limits are respected
+	"""
+	def _evict(self):
+		while ((self.max_size is not None and self.tree.size() > self.max_size)
+				or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+			self._remove(self._victim())
+			self.evictions += 1
+
+	"""returns the node of the entry the policy evicts next
+	@pre: the cache is not empty
+	@rtype: AVLNode
+	"""
+	def _victim(self):
+		if self.policy == 'min_key':
+			return self.tree.min_node()
+		if self.policy == 'max_key':
+			return self.tree.max_node()
+		order = self._recency if self.policy == 'lru' else self._expiry
+		return order.min_node().value
@@ -5,10 +5,16 @@
 #name2: Mika Oren
 #username2: Mikaoren
 
+import array
+import functools
+import operator
+
 
 """A class represnting a node in an AVL tree"""
 
 class AVLNode(object):
+	__slots__ = ('key', 'value', 'left', 'right', 'parent', 'height', 'size')
+
 	"""Constructor, you are allowed to add more fields. 
 	
 	@type key: int
@@ -23,6 +29,7 @@ class AVLNode(object):
 		self.right = None
 		self.parent = None
 		self.height = 0
+		self.size = 1  # number of real nodes in the subtree of self
 
 	def __repr__(self):
 		return f"Node(k={self.key}, v={self.value}, h={self.height})"
@@ -31,9 +38,9 @@ class AVLNode(object):
 	@rtype: int
 	"""
 	def BF(self):
-		# treat missing children as virtual nodes with height = -1
-		left_height = self.left.height if (self.left is not None and self.left.is_real_node()) else -1
-		right_height = self.right.height if (self.right is not None and self.right.is_real_node()) else -1
+		# virtual children have height -1, missing ones (a detached node) count as virtual
+		left_height = self.left.height if self.left is not None else -1
+		right_height = self.right.height if self.right is not None else -1
 		return (left_height - right_height)
 
 	"""returns whether self is not a virtual node 
@@ -45,6 +52,253 @@ class AVLNode(object):
 		return self.height != -1
 
 
+# node.skey is the key the tree compares. without a key function that is the key itself, so
+# skey reads (and writes) the key slot, at the cost of a plain slot access
+AVLNode.skey = AVLNode.key
+
+
+# the fields a node carries only for the trees that use them: skey for a key function,
+# prev and next for a threaded tree, agg for an augmentation
+_NODE_FIELDS = (('skey',), ('prev', 'next'), ('agg',))
+_NODE_NAMES = ('Keyed', 'Threaded', 'Augmented')
+_node_classes = {}
+
+"""returns the AVLNode subclass with the fields of the chosen options, AVLNode itself for none
+@type keyed: bool
+@type threaded: bool
+@type augmented: bool
+@rtype: type
+"""
+def node_class(keyed=False, threaded=False, augmented=False):
+	flags = (bool(keyed), bool(threaded), bool(augmented))
+	cls = _node_classes.get(flags)
+	if cls is not None:
+		return cls
+	if not any(flags):
+		cls = AVLNode
+	else:
+		fields = tuple(field for flag, names in zip(flags, _NODE_FIELDS) if flag for field in names)
+		has_skey, has_links, has_agg = flags
+
+		def __init__(self, key, value):
+			AVLNode.__init__(self, key, value)
+			if has_skey:
+				self.skey = key
+			if has_links:
+				self.prev = None  # in-order neighbours, None at the ends
+				self.next = None
+			if has_agg:
+				self.agg = None  # summary of the subtree of self
+
+		name = ''.join(name for flag, name in zip(flags, _NODE_NAMES) if flag) + 'AVLNode'
+		cls = type(name, (AVLNode,), {'__slots__': fields, '__init__': __init__})
+	_node_classes[flags] = cls
+	return cls
+
+
+# the virtual node shared by all trees. its fields are never written, so a node can be tested
+# with "node is virtual" and moved between trees by join and split without relinking its leaves
+VIRTUAL_NODE = AVLNode(None, None)
+VIRTUAL_NODE.height = -1
+VIRTUAL_NODE.size = 0
+
+
+"""
+A monoid summarizing every subtree of an AVLTree (see the augment argument of AVLTree).
+The summary of a node is combine(combine(left summary, lift(key, value)), right summary),
+where an empty side is skipped, so combine must be associative but does not have to be
+commutative. identity is the summary of an empty range.
+"""
+
+class Augmentation(object):
+
+	"""Constructor
+
+	@type lift: callable
+	@param lift: maps the (key, value) of a node to its own summary
+	@type combine: callable
+	@param combine: an associative function merging the summaries of two adjacent key ranges
+	@param identity: the summary of no items at all
+	"""
+	def __init__(self, lift, combine, identity=None):
+		self.lift = lift
+		self.combine = combine
+		self.identity = identity
+
+	"""recomputes node.agg from node and the summaries of its children
+	@pre: the children of node have up to date summaries
+	"""
+	def update(self, node):
+		agg = self.lift(node.key, node.value)
+		left = node.left
+		if left is not VIRTUAL_NODE:
+			agg = self.combine(left.agg, agg)
+		right = node.right
+		if right is not VIRTUAL_NODE:
+			agg = self.combine(agg, right.agg)
+		node.agg = agg
+
+
+def _node_value(key, val):
+	return val
+
+# summaries of the values of a subtree
+VALUE_SUM = Augmentation(_node_value, operator.add, 0)
+VALUE_MIN = Augmentation(_node_value, min)
+VALUE_MAX = Augmentation(_node_value, max)
+
+
+# maps a key to what an AVLTree with the given key and cmp compares, None to compare keys as they are
+def _sort_key_function(key, cmp):
+	if cmp is None:
+		return key
+	wrap = functools.cmp_to_key(cmp)
+	if key is None:
+		return wrap
+	return lambda k: wrap(key(k))
+
+
+# the answers of the neighbour queries, picked from what AVLTree._bounds found
+
+def _floor_of(key, below, exact, above):
+	return exact if exact is not None else below
+
+def _ceiling_of(key, below, exact, above):
+	return exact if exact is not None else above
+
+def _upper_bound_of(key, below, exact, above):
+	if exact is None:
+		return above
+	node = exact
+	if node.right is not VIRTUAL_NODE:
+		node = node.right
+		while node.left is not VIRTUAL_NODE:
+			node = node.left
+		return node
+	if above is not None:
+		return above
+	# a walk from a finger may have started below the successor of exact
+	parent = node.parent
+	while parent is not VIRTUAL_NODE and node is parent.right:
+		node = parent
+		parent = node.parent
+	return parent if parent is not VIRTUAL_NODE else None
+
+def _nearest_of(key, below, exact, above):
+	if exact is not None or above is None:
+		return exact if exact is not None else below
+	if below is None or above.skey - key < key - below.skey:
+		return above
+	return below
+
+
+"""
+Counters and histograms of the work done by an AVLTree, collected only while enabled
+(see AVLTree.enable_stats). Histograms map a value to the number of times it was seen.
+"""
+
+class AVLStats(object):
+
+	def __init__(self):
+		self._exporters = []
+		self.reset()
+
+	"""clears every counter and histogram
+	"""
+	def reset(self):
+		self.searches = 0
+		self.search_path_lengths = {}
+		self.inserts = 0
+		self.insert_path_lengths = {}
+		self.deletes = 0
+		self.delete_rotations = 0
+		self.delete_height_changes = 0
+		self.delete_rotation_counts = {}
+		self.rotations = {'LL': 0, 'LR': 0, 'RR': 0, 'RL': 0}
+		self.height_changes = 0
+		self.rebalance_height_changes = {}
+		self.joins = 0
+		self.join_height_diffs = {}
+		self.splits = 0
+		self.split_join_counts = {}
+
+	def record_search(self, edges):
+		self.searches += 1
+		self.search_path_lengths[edges] = self.search_path_lengths.get(edges, 0) + 1
+
+	def record_insert(self, edges):
+		self.inserts += 1
+		self.insert_path_lengths[edges] = self.insert_path_lengths.get(edges, 0) + 1
+
+	def record_delete(self):
+		self.deletes += 1
+
+	def record_delete_rebalance(self, rotations, height_changes):
+		self.delete_rotations += rotations
+		self.delete_height_changes += height_changes
+		self.delete_rotation_counts[rotations] = self.delete_rotation_counts.get(rotations, 0) + 1
+
+	def record_rotation(self, kind):
+		self.rotations[kind] += 1
+
+	def record_rebalance(self, height_changes):
+		self.height_changes += height_changes
+		self.rebalance_height_changes[height_changes] = self.rebalance_height_changes.get(height_changes, 0) + 1
+
+	def record_join(self, height_diff):
+		self.joins += 1
+		self.join_height_diffs[height_diff] = self.join_height_diffs.get(height_diff, 0) + 1
+
+	def record_split(self, join_count):
+		self.splits += 1
+		self.split_join_counts[join_count] = self.split_join_counts.get(join_count, 0) + 1
+
+	"""returns a snapshot of all the counters and histograms
+
+	@rtype: dict
+	"""
+	def as_dict(self):
+		return {
+			'searches': self.searches,
+			'search_path_lengths': dict(self.search_path_lengths),
+			'inserts': self.inserts,
+			'insert_path_lengths': dict(self.insert_path_lengths),
+			'deletes': self.deletes,
+			'delete_rotations': self.delete_rotations,
+			'delete_height_changes': self.delete_height_changes,
+			'delete_rotation_counts': dict(self.delete_rotation_counts),
+			'rotations': dict(self.rotations),
+			'height_changes': self.height_changes,
+			'rebalance_height_changes': dict(self.rebalance_height_changes),
+			'joins': self.joins,
+			'join_height_diffs': dict(self.join_height_diffs),
+			'splits': self.splits,
+			'split_join_counts': dict(self.split_join_counts),
+		}
+
+	"""registers a callback that export() calls with as_dict()
+
+	@type exporter: callable
+	"""
+	def add_exporter(self, exporter):
+		self._exporters.append(exporter)
+
+	"""hands a snapshot to every registered exporter
+
+	@type reset: bool
+	@param reset: if True, clear the counters after exporting
+	@rtype: dict
+	@returns: the exported snapshot
+	"""
+	def export(self, reset=False):
+		snapshot = self.as_dict()
+		for exporter in self._exporters:
+			exporter(snapshot)
+		if reset:
+			self.reset()
+		return snapshot
+
+
 """
 A class implementing an AVL tree.
 """
@@ -53,16 +307,219 @@ class AVLTree(object):
 
 	"""
 	Constructor, you are allowed to add more fields.
+
+	@type track_finger: bool
+	@param track_finger: if True, the tree remembers the last node accessed by search, insert
+	and delete, and finger_search / finger_insert start from it instead of from the max
+	@type augment: Augmentation
+	@param augment: if given, every node keeps the summary of its subtree in node.agg,
+	which range_aggregate uses
+	@type threaded: bool
+	@param threaded: if True, every node keeps links to its in-order neighbours in node.prev
+	and node.next, so successor, predecessor and every step of an iteration are O(1)
+	@type key: callable
+	@param key: if given, keys are ordered by key(k), as in sorted(key=). key(k) is computed once,
+	when k enters the tree, and is kept in node.skey; queries compute it once per call
+	@type cmp: callable
+	@param cmp: if given, keys (or their key(k)) are ordered by the old-style comparison function
+	cmp(a, b), which returns a negative number, zero or a positive number
+	@type multimap: bool
+	@param multimap: if True, a key may be inserted many times. its node keeps all of its values
+	in a bucket, node.value, and inserting a present key appends to the bucket without a new node
+	@type typecode: str
+	@param typecode: with multimap, the array typecode of the buckets (e.g. 'q' or 'd'), so numeric
+	values are stored compactly. None for list buckets
+	@type wavl: bool
+	@param wavl: if True, delete rebalances by the rules of a weak AVL (rank-balanced) tree:
+	node.height holds a rank, which may exceed the height of the node, and a delete does O(1)
+	amortized rank changes and at most one single or double rotation. insert, join and split are
+	unchanged (on a rank-balanced tree they keep the ranks valid),
+	and the height stays below 2 log n
 	"""
-	def __init__(self):
+	def __init__(self, track_finger=False, augment=None, threaded=False, key=None, cmp=None,
+			multimap=False, typecode=None, wavl=False):
 		# a single shared virtual node with height -1
-		self.virtual_node = AVLNode(None, None)  # virtual node for easier handling
-		self.virtual_node.height = -1
+		self.virtual_node = VIRTUAL_NODE  # virtual node for easier handling
 		
 		#start with a virtual root
 		self.root = self.virtual_node  # virtual root
 		self._size = 0
 		self._max_node = self.virtual_node  # virtual max_node
+		self._min_node = self.virtual_node  # virtual min_node
+		self.track_finger = track_finger
+		self._last_node = self.virtual_node  # last accessed node, kept only if track_finger
+		self.stats = None  # an AVLStats while instrumentation is enabled
+		self.augment = augment
+		self.threaded = threaded
+		self.key = key
+		self.cmp = cmp
+		# maps a key to the value compared by the tree, None to compare the keys themselves
+		self.sort_key = _sort_key_function(key, cmp)
+		self.multimap = multimap
+		self.typecode = typecode
+		self.wavl = wavl
+		# nodes carry the fields of the options in use only
+		self._node_class = node_class(self.sort_key is not None, threaded, augment is not None)
+
+
+	"""starts collecting an AVLStats for this tree (the current one is kept if already enabled)
+
+	@rtype: AVLStats
+	@returns: the stats object, its counters are updated in place
+	"""
+	def enable_stats(self):
+		if self.stats is None:
+			self.stats = AVLStats()
+		return self.stats
+
+	"""stops collecting stats. with stats disabled every hook costs a single None check
+	per operation, none inside the search and rebalancing loops
+
+	@rtype: AVLStats
+	@returns: the stats collected so far, None if they were not enabled
+	"""
+	def disable_stats(self):
+		stats, self.stats = self.stats, None
+		return stats
+
+	"""builds a perfectly balanced tree from (key, value) pairs sorted by key, in O(n)
+
+	@type pairs: iterable
+	@pre: keys appear in strictly increasing order (of their sort keys, with a key function).
+	in a multimap they may repeat, and the values of a key are bucketed in the given order
+	@param pairs: (key, value) pairs to be loaded
+	@param options: keyword arguments for the constructor of the new tree
+	@rtype: AVLTree
+	@returns: a new AVLTree holding exactly the given pairs, built without rotations
+	"""
+	@classmethod
+	def from_sorted(cls, pairs, **options):
+		tree = cls(**options)
+		pairs = pairs if isinstance(pairs, list) else list(pairs)
+		tree._build(pairs)
+		return tree
+
+	"""builds a balanced tree from (key, value) pairs given in any order
+
+	@type pairs: iterable
+	@pre: keys are distinct, unless self is a multimap
+	@param pairs: (key, value) pairs to be loaded
+	@param options: keyword arguments for the constructor of the new tree
+	@rtype: AVLTree
+	@returns: a new AVLTree holding exactly the given pairs.
+	already sorted input is detected in O(n) and is not sorted again.
+	"""
+	@classmethod
+	def from_iterable(cls, pairs, **options):
+		tree = cls(**options)
+		pairs = list(pairs)
+		sort_key = tree.sort_key
+		if sort_key is None:
+			skeys = [pair[0] for pair in pairs]
+		else:
+			skeys = [sort_key(pair[0]) for pair in pairs]
+		for i in range(1, len(pairs)):
+			if not skeys[i - 1] < skeys[i]:
+				order = sorted(range(len(pairs)), key=skeys.__getitem__)
+				pairs = [pairs[j] for j in order]
+				skeys = [skeys[j] for j in order]
+				break
+		tree._build(pairs, skeys if sort_key is not None else None)
+		return tree
+
+	"""writes the dictionary to path in a compact binary format that can be memory-mapped
+
+	@type path: str
+	@pre: all keys are ints that fit in 64 bits
+	@pre: self has no key or cmp function and is not a multimap, a ValueError is raised otherwise
+	@rtype: None
+	"""
+	def save(self, path):
+		from MappedAVLTree import save_tree
+		return save_tree(self, path)
+
+	"""reads a dictionary written by save
+
+	@type path: str
+	@type mmap: bool
+	@param mmap: if True, return a read-only MappedAVLTree that serves lookups straight from
+	the mapped file, otherwise build a regular AVLTree in O(n)
+	@rtype: MappedAVLTree or AVLTree
+	"""
+	@classmethod
+	def load(cls, path, mmap=True):
+		from MappedAVLTree import load_tree
+		return load_tree(path, mmap)
+
+	"""replaces the content of self with a balanced tree built bottom-up from sorted pairs
+	@type pairs: list
+	@pre: keys of pairs are strictly increasing
+	@type skeys: list
+	@param skeys: the sort keys of pairs, computed here if None
+	@rtype: None
+	"""
+	def _build(self, pairs, skeys=None):
+		virtual = self.virtual_node
+		augment = self.augment
+		sort_key = self.sort_key
+		if self.multimap:
+			pairs, skeys = self._bucketed(pairs, skeys)
+		new_node = self._node_class
+		nodes = []
+		for key, val in pairs:
+			node = new_node(key, val)
+			node.left = virtual
+			node.right = virtual
+			node.parent = virtual
+			nodes.append(node)
+		# without a key function skey is the key itself
+		if sort_key is not None:
+			if skeys is None:
+				skeys = [sort_key(node.key) for node in nodes]
+			for node, skey in zip(nodes, skeys):
+				node.skey = skey
+
+		# the middle node of every range becomes the root of that range
+		def build(lo, hi, parent):
+			if lo > hi:
+				return virtual
+			mid = (lo + hi) // 2
+			node = nodes[mid]
+			node.parent = parent
+			node.left = build(lo, mid - 1, node)
+			node.right = build(mid + 1, hi, node)
+			node.height = 1 + max(node.left.height, node.right.height)
+			node.size = 1 + node.left.size + node.right.size
+			if augment is not None:
+				augment.update(node)
+			return node
+
+		self.root = build(0, len(nodes) - 1, virtual)
+		self._size = len(nodes)
+		self._max_node = nodes[-1] if nodes else virtual
+		self._min_node = nodes[0] if nodes else virtual
+		if self.threaded:
+			for i in range(1, len(nodes)):
+				nodes[i - 1].next = nodes[i]
+				nodes[i].prev = nodes[i - 1]
+		return None
+
+	"""groups sorted (key, value) pairs into one (key, bucket) pair per key
+	@rtype: (list, list)
+	@returns: the grouped pairs and their sort keys
+	"""
+	def _bucketed(self, pairs, skeys):
+		if skeys is None:
+			skeys = self._sort_keys([pair[0] for pair in pairs])
+		grouped = []
+		grouped_skeys = []
+		for (key, val), skey in zip(pairs, skeys):
+			if grouped_skeys and grouped_skeys[-1] == skey:
+				grouped[-1][1].append(val)
+			else:
+				grouped.append((key, self._bucket(val)))
+				grouped_skeys.append(skey)
+		return grouped, grouped_skeys
 
 
 	"""searches for a node in the dictionary corresponding to the key (starting at the root)
@@ -74,111 +531,170 @@ class AVLTree(object):
 	and e is the number of edges on the path between the starting node and ending node+1.
 	"""
 	def search(self, key):
+		virtual = self.virtual_node
+		if self.sort_key is not None:
+			key = self.sort_key(key)
 		node = self.root
 		edges = 1
-		while node is not None and node.is_real_node():
-			if key == node.key:
+		while node is not virtual:
+			node_key = node.skey
+			if key == node_key:
+				if self.track_finger:
+					self._last_node = node
+				if self.stats is not None:
+					self.stats.record_search(edges)
 				return node, edges
-			elif key < node.key:
-				node = node.left
-			else:
-				node = node.right
+			node = node.left if key < node_key else node.right
 			edges += 1
 			
+		if self.stats is not None:
+			self.stats.record_search(edges)
 		return None, edges
 
 	"""searches for a node in the dictionary corresponding to the key, starting at the max
+	(or at the given finger, or at the last accessed node when track_finger is set)
         
 	@type key: int
 	@param key: a key to be searched
+	@type finger: AVLNode
+	@param finger: a real node in self to start from, None for the default start
+	@type nearest_end: bool
+	@param nearest_end: if True, the default start is the min for keys smaller than the root's
+	key and the max otherwise
 	@rtype: (AVLNode,int)
 	@returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
 	and e is the number of edges on the path between the starting node and ending node+1.
+	starting from a finger costs O(log d), where d is the rank distance between finger and key.
 	"""
-	def finger_search(self, key):
+	def finger_search(self, key, finger=None, nearest_end=False):
+		virtual = self.virtual_node
+		if self.sort_key is not None:
+			key = self.sort_key(key)
+		if finger is None and self.track_finger and self._last_node is not virtual:
+			finger = self._last_node
+		if finger is not None:
+			node, last, edges = self._finger_walk(finger, key)
+			if self.track_finger:
+				self._last_node = last
+			if self.stats is not None:
+				self.stats.record_search(edges)
+			return node, edges
+
 		#empty tree case
-		if self._max_node is None or not self._max_node.is_real_node():
+		finger = self._max_node
+		if finger is virtual:
 			return None, 1
 
-		finger = self._max_node
 		edges = 1
 
-    	# going up the tree until we find a node with key <= search key
-		while finger.parent is not None and finger.parent.is_real_node() and key < finger.key:
-			finger = finger.parent
-			edges += 1
+		if nearest_end and key < self.root.skey:
+			# going up from the min until we find a node with key >= search key
+			finger = self._min_node
+			parent = finger.parent
+			while parent is not virtual and finger.skey < key:
+				finger = parent
+				parent = finger.parent
+				edges += 1
+		else:
+	    	# going up the tree until we find a node with key <= search key
+			parent = finger.parent
+			while parent is not virtual and key < finger.skey:
+				finger = parent
+				parent = finger.parent
+				edges += 1
 
     	# going down the tree to find the key
-		while finger is not None and finger.is_real_node():
+		while finger is not virtual:
 			edges += 1
-
-			if key == finger.key:
+			finger_key = finger.skey
+			if key == finger_key:
+				if self.stats is not None:
+					self.stats.record_search(edges)
 				return finger, edges
-
-			elif key < finger.key:
-				finger = finger.left
-			else:
-				finger = finger.right
+			finger = finger.left if key < finger_key else finger.right
 
     	# key not found
+		if self.stats is not None:
+			self.stats.record_search(edges)
 		return None, edges
 
 
 	"""inserts a new node into the dictionary with corresponding key and value (starting at the root)
 
 	@type key: int
-	@pre: key currently does not appear in the dictionary
+	@pre: key currently does not appear in the dictionary, unless self is a multimap
 	@param key: key of item that is to be inserted to self
 	@type val: string
 	@param val: the value of the item
 	@rtype: (AVLNode,int,int)
 	@returns: a 3-tuple (x,e,h) where x is the new node,
 	e is the number of edges on the path between the starting node and new node before rebalancing,
-	and h is the number of PROMOTE cases during the AVL rebalancing
+	and h is the number of PROMOTE cases during the AVL rebalancing.
+	in a multimap where key is present, x is its node, e its depth and h is 0
 	"""
 	def insert(self, key, val):
-		new_node = AVLNode(key, val)
-		new_node.height = 0
-		new_node.left = self.virtual_node
-		new_node.right = self.virtual_node
-		new_node.parent = self.virtual_node
+		virtual = self.virtual_node
+		skey = key if self.sort_key is None else self.sort_key(key)
+		if self.multimap:
+			node, edges = self._lookup(skey)
+			if node is not None:
+				self._append(node, val)
+				return node, edges, 0
+			val = self._bucket(val)
+		new_node = self._node_class(key, val)
+		new_node.left = virtual
+		new_node.right = virtual
+		new_node.parent = virtual
+		new_node.skey = skey
 		
-		parent = self.virtual_node
 		current = self.root
 		edges = 0
 		height_changes = 0
 
-		if self.root is None or not self.root.is_real_node(): # Tree was empty
+		if self.augment is not None:
+			self.augment.update(new_node)
+
+		if current is virtual: # Tree was empty
 			self.root = new_node
-			self._max_node = self.root
-			new_node.parent = self.virtual_node
+			self._max_node = new_node
+			self._min_node = new_node
 
 		else:
-			# Binary search to find place to insert
-			while current is not None and current.is_real_node():
-				parent = current
+			# Binary search to find place to insert, the new node is counted on the way down
+			while True:
+				current.size += 1
 				edges += 1
-				# Binary search to find place to insert
-				if key < current.key:
-					current = current.left
+				if skey < current.skey:
+					child = current.left
+					if child is virtual:
+						current.left = new_node
+						#update min_node if needed
+						if skey < self._min_node.skey:
+							self._min_node = new_node
+						break
 				else:
-					current = current.right
-		
-			new_node.parent = parent
-			
-			if key < parent.key:
-				parent.left = new_node
-
-			else:
-				parent.right = new_node			
-				#update max_node if needed
-				if new_node.key > self._max_node.key:
-					self._max_node = new_node
+					child = current.right
+					if child is virtual:
+						current.right = new_node
+						#update max_node if needed
+						if skey > self._max_node.skey:
+							self._max_node = new_node
+						break
+				current = child
 			
+			new_node.parent = current
+			if self.threaded:
+				self._thread_leaf(new_node)
+			if self.augment is not None:
+				self.update_sizes(current)
 			# Rebalance the tree
-			height_changes += self.rebalance_tree(parent)
+			height_changes += self.rebalance_tree(current)
 
 		self._size += 1
+		if self.track_finger:
+			self._last_node = new_node
+		if self.stats is not None:
+			self.stats.record_insert(edges)
 		return new_node, edges, height_changes
 	
 	"""rebalances the tree starting from parent node
@@ -190,174 +706,255 @@ class AVLTree(object):
 	
 	def rebalance_tree(self, node):
 		# Rebalance the tree
+		virtual = self.virtual_node
 		height_changes = 0
-		while node is not None and node.is_real_node():
-			bf = node.BF()
-			if abs(bf) < 2:
+		while node is not virtual:
+			left_height = node.left.height
+			right_height = node.right.height
+			bf = left_height - right_height
+			if -2 < bf < 2:
 				# Update height if needed
-				old_height = node.height
-				left_height = node.left.height if node.left is not None else -1
-				right_height = node.right.height if node.right is not None else -1
-				node.height = 1 + max(left_height, right_height)
-
-				if node.height != old_height:
+				height = 1 + (left_height if left_height > right_height else right_height)
+				if height != node.height:
+					node.height = height
 					height_changes += 1
 					node = node.parent
 				else:
 					break
 			else: #|bf| == 2 - will only happen once
 				# Perform rotations
-				new_root = self.rotate(node, bf)
-				node = new_root.parent
+				node = self.rotate(node, bf).parent
 				
+		if self.stats is not None:
+			self.stats.record_rebalance(height_changes)
+		return height_changes
+
+	"""rebalances a weak AVL tree after a delete, starting from the parent of the removed node.
+	ranks are kept in node.height, and every rank difference must be 1 or 2 with leaves of rank 0.
+	a removal leaves at most one violation: a leaf of rank 1, or a child of rank difference 3,
+	which demotions move up the tree until a single or a double rotation ends it
+
+	@type node: AVLNode
+	@rtype: int
+	@returns: number of demotions during rebalancing, as rebalance_tree the rank changes
+	done by a rotation are not counted
+	"""
+	def _wavl_rebalance(self, node):
+		virtual = self.virtual_node
+		height_changes = 0
+		if node is not virtual and node.height == 1 and node.left is virtual and node.right is virtual:
+			# a (2,2) leaf
+			node.height = 0
+			height_changes += 1
+			node = node.parent
+		while node is not virtual:
+			rank = node.height
+			left, right = node.left, node.right
+			if rank - left.height == 3:
+				sibling, outer, inner = right, right.right, right.left
+			elif rank - right.height == 3:
+				sibling, outer, inner = left, left.left, left.right
+			else:
+				break
+			if rank - sibling.height == 2:
+				# demote node, the violation moves to its parent
+				node.height = rank - 1
+				height_changes += 1
+				node = node.parent
+			elif sibling.height - outer.height == 2 and sibling.height - inner.height == 2:
+				# the sibling is a (2,2) node: demote both
+				node.height = rank - 1
+				sibling.height -= 1
+				height_changes += 2
+				node = node.parent
+			else:
+				# rotate picks the same single or double rotation and keeps sizes, the ranks are set here
+				single = sibling.height - outer.height == 1
+				self.rotate(node, left.height - right.height)
+				if single:
+					# single rotation: sibling is promoted, node is demoted (twice if it is now a leaf)
+					sibling.height = rank
+					node.height = rank - 2 if node.left is virtual and node.right is virtual else rank - 1
+				else:
+					# double rotation: inner takes the rank of node, sibling and node go down
+					inner.height = rank
+					sibling.height = rank - 2
+					node.height = rank - 2
+				break
+		if self.stats is not None:
+			self.stats.record_rebalance(height_changes)
 		return height_changes
 
 	"""performs a rotation on node depending on its balance factor
 	"""
 	def rotate(self, node, bf):  # node's |balance factor| would be 2  
-		new_root = self.virtual_node
-        # keep references to children that may need explicit height updates
-		left_child = self.virtual_node
-		right_child = self.virtual_node
+		virtual = self.virtual_node
+		lower = virtual  # the child moved under new_root in a double rotation
 	
 		if bf == 2: # Left heavy
-			if node.left.BF() >= 0:
+			left_child = node.left
+			if left_child.left.height >= left_child.right.height:
 				# Right rotation
-				new_root = node.left
-				node.left = new_root.right
-				if new_root.right is not None and new_root.right.is_real_node():
-					new_root.right.parent = node
+				new_root = left_child
+				inner = new_root.right
+				node.left = inner
+				if inner is not virtual:
+					inner.parent = node
 				new_root.right = node
+				kind = 'LL'
 
 			else: # Left-Right case
 				# Left rotation then right rotation
-				left_child = node.left
+				lower = left_child
 				new_root = left_child.right
-				left_child.right = new_root.left
-				if new_root.left is not None and new_root.left.is_real_node():
-					new_root.left.parent = left_child
-				node.left = new_root.right
-				if new_root.right is not None and new_root.right.is_real_node():
-					new_root.right.parent = node
+				inner = new_root.left
+				left_child.right = inner
+				if inner is not virtual:
+					inner.parent = left_child
+				inner = new_root.right
+				node.left = inner
+				if inner is not virtual:
+					inner.parent = node
 				new_root.right = node
 				new_root.left = left_child
 				left_child.parent = new_root
+				kind = 'LR'
 		
-		elif bf == -2: # Right heavy
-			if node.right.BF() <= 0:
+		else: # Right heavy
+			right_child = node.right
+			if right_child.left.height <= right_child.right.height:
 				# Left rotation
-				new_root = node.right
-				node.right = new_root.left
-				if new_root.left is not None and new_root.left.is_real_node():
-					new_root.left.parent = node
+				new_root = right_child
+				inner = new_root.left
+				node.right = inner
+				if inner is not virtual:
+					inner.parent = node
 				new_root.left = node
+				kind = 'RR'
 
 			else: # Right-Left case
 				# Right rotation then left rotation
-				right_child = node.right
+				lower = right_child
 				new_root = right_child.left
-				right_child.left = new_root.right
-				if new_root.right is not None and new_root.right.is_real_node():
-					new_root.right.parent = right_child
-				node.right = new_root.left
-				if new_root.left is not None and new_root.left.is_real_node():
-					new_root.left.parent = node
+				inner = new_root.right
+				right_child.left = inner
+				if inner is not virtual:
+					inner.parent = right_child
+				inner = new_root.left
+				node.right = inner
+				if inner is not virtual:
+					inner.parent = node
 				new_root.left = node
 				new_root.right = right_child
 				right_child.parent = new_root
+				kind = 'RL'
+
+		if self.stats is not None:
+			self.stats.record_rotation(kind)
 		
 		# Update parents
-		new_root.parent = node.parent
-		if node.parent is None or not node.parent.is_real_node(): #node is root
+		parent = node.parent
+		new_root.parent = parent
+		if parent is virtual: #node is root
 			self.root = new_root
+		elif parent.left is node:
+			parent.left = new_root
 		else:
-			if node == node.parent.left:
-				node.parent.left = new_root
-			else:
-				node.parent.right = new_root
+			parent.right = new_root
 		node.parent = new_root
 
-		# update heights for directly affected nodes
-		def get_h(node):
-			if node is not None and node.is_real_node():
-				return node.height
-			return -1
-        
-		# LR: left_child changed -> update left_child first
-		if left_child is not None and left_child.is_real_node():
-			left_child.height = 1 + max(get_h(left_child.left), get_h(left_child.right))
-        # RL: right_child changed -> update right_child first
-		if right_child is not None and right_child.is_real_node():
-			right_child.height = 1 + max(get_h(right_child.left) ,get_h(right_child.right))
-        # node was moved down -> update it
-		node.height = 1 + max(get_h(node.left), get_h(node.right))
-
-    	# then new_root
-		new_root.height = 1 + max(get_h(new_root.left), get_h(new_root.right))
+		# update heights and sizes bottom-up: the moved child of a double rotation, node, new_root
+		if lower is not virtual:
+			left, right = lower.left, lower.right
+			lower.height = 1 + (left.height if left.height > right.height else right.height)
+			lower.size = 1 + left.size + right.size
+		left, right = node.left, node.right
+		node.height = 1 + (left.height if left.height > right.height else right.height)
+		node.size = 1 + left.size + right.size
+		left, right = new_root.left, new_root.right
+		new_root.height = 1 + (left.height if left.height > right.height else right.height)
+		new_root.size = 1 + left.size + right.size
+
+		augment = self.augment
+		if augment is not None:
+			if lower is not virtual:
+				augment.update(lower)
+			augment.update(node)
+			augment.update(new_root)
 
 		return new_root
 	
 
 	"""inserts a new node into the dictionary with corresponding key and value, starting at the max
+	(or at the given finger, or at the last accessed node when track_finger is set)
 
 	@type key: int
-	@pre: key currently does not appear in the dictionary
+	@pre: key currently does not appear in the dictionary, unless self is a multimap (see insert)
 	@param key: key of item that is to be inserted to self
 	@type val: string
 	@param val: the value of the item
+	@type finger: AVLNode
+	@param finger: a real node in self to start from, None for the default start
+	@type nearest_end: bool
+	@param nearest_end: if True, the default start is the min for keys smaller than the root's
+	key and the max otherwise
 	@rtype: (AVLNode,int,int)
 	@returns: a 3-tuple (x,e,h) where x is the new node,
 	e is the number of edges on the path between the starting node and new node before rebalancing,
 	and h is the number of PROMOTE cases during the AVL rebalancing
 	"""
-	def finger_insert(self, key, val):
-		new_node = AVLNode(key, val)
-		new_node.height = 0
-		new_node.left = self.virtual_node
-		new_node.right = self.virtual_node
-		new_node.parent = self.virtual_node
-		
+	def finger_insert(self, key, val, finger=None, nearest_end=False):
+		virtual = self.virtual_node
+		skey = key if self.sort_key is None else self.sort_key(key)
+		if finger is None and self.track_finger and self._last_node is not virtual:
+			finger = self._last_node
+		if finger is None and self.multimap and self.root is not virtual:
+			# a present key has to be found, which the walk of _finger_walk does on the way
+			finger = self._min_node if nearest_end and skey < self.root.skey else self._max_node
+		if finger is not None:
+			node, parent, edges = self._finger_walk(finger, skey)
+			if node is not None and self.multimap:
+				self._append(node, val)
+				return node, edges - 1, 0
+			if self.multimap:
+				val = self._bucket(val)
+			new_node, height_changes = self._attach_leaf(key, val, skey, parent)
+			if self.stats is not None:
+				self.stats.record_insert(edges - 1)
+			return new_node, edges - 1, height_changes
+
 		current = self._max_node
-		parent = self.virtual_node
-		edges = 0
-		height_changes = 0
 		
 		#empty tree case
-		if self._max_node is None or not self._max_node.is_real_node():
-			self.root = new_node
-			self._max_node = self.root
-			new_node.parent = self.virtual_node
+		if current is virtual:
+			return self.insert(key, val)
+
+		edges = 0
+		if nearest_end and skey < self.root.skey:
+			# going up from the min until we find a node with key >= insert key
+			current = self._min_node
+			parent = current.parent
+			while parent is not virtual and current.skey < skey:
+				current = parent
+				parent = current.parent
+				edges += 1
 		else:
 			# going up the tree until we find a node with key <= insert key
-			while current.parent is not None and current.parent.is_real_node() and key < current.key:
-				current = current.parent
+			parent = current.parent
+			while parent is not virtual and skey < current.skey:
+				current = parent
+				parent = current.parent
 				edges += 1
 
-			# going down the tree to find the key
-			while current is not None and current.is_real_node():
-				parent = current
-				edges += 1
-				# Binary search to find place to insert
-				if key < current.key:
-					current = current.left
-				else:
-					current = current.right
-		
-			new_node.parent = parent
-			
-			if key < parent.key:
-				parent.left = new_node
-
-			else:
-				parent.right = new_node			
-				#update max_node if needed
-				if new_node.key > self._max_node.key:
-					self._max_node = new_node
-
-			# Rebalance the tree
-			height_changes += self.rebalance_tree(parent)
+		# going down the tree to find the key
+		while current is not virtual:
+			parent = current
+			edges += 1
+			current = current.left if skey < current.skey else current.right
 
-		self._size += 1
+		new_node, height_changes = self._attach_leaf(key, val, skey, parent)
+		if self.stats is not None:
+			self.stats.record_insert(edges)
 
 		return new_node, edges, height_changes
 
@@ -367,82 +964,91 @@ class AVLTree(object):
 	@pre: node is a real pointer to a node in self
 	"""
 	def delete(self, node):
-		if node is None or not node.is_real_node():
+		virtual = self.virtual_node
+		if node is None or node is virtual:
 			return
+		stats = self.stats
+		if stats is not None:
+			stats.record_delete()
+			rotations = sum(stats.rotations.values())
+		if self.track_finger:
+			# the in-order neighbour survives the deletion
+			self._last_node = self._next_node(node) or self._prev_node(node) or virtual
+
+		left = node.left
+		right = node.right
+		parent = node.parent
+		if self.threaded:
+			if node.prev is not None:
+				node.prev.next = node.next
+			if node.next is not None:
+				node.next.prev = node.prev
 		
-		# Case 1: node is a leaf
-		if (node.left is None or not node.left.is_real_node()) and (node.right is None or not node.right.is_real_node()):
-			if node.parent is None or not node.parent.is_real_node(): # node is root
-				self.root = self.virtual_node
-				self._max_node = self.virtual_node
-			else: # node has a parent 
-				if node == node.parent.left:
-					node.parent.left = self.virtual_node
-				else:
-					node.parent.right = self.virtual_node
-				# update max_node if needed
-				if node == self._max_node:
-					self.update_max()
-			parent_for_rebalance = node.parent
-			node.parent = self.virtual_node  # help garbage collection
-		
-		# Case 2: node has one child
-		elif (node.left is None or not node.left.is_real_node()) or (node.right is None or not node.right.is_real_node()):
-			child = node.left if node.left.is_real_node() else node.right
-			if node.parent is None or not node.parent.is_real_node(): # node is root
+		# Case 1 and 2: node is a leaf or has one child
+		if left is virtual or right is virtual:
+			child = right if left is virtual else left  # virtual for a leaf
+			if parent is virtual: # node is root
 				self.root = child
-				child.parent = self.virtual_node
-			else: # node has a parent
-				if node == node.parent.left:
-					node.parent.left = child
-				else:
-					node.parent.right = child
-				child.parent = node.parent
+			elif parent.left is node:
+				parent.left = child
+			else:
+				parent.right = child
+			if child is not virtual:
+				child.parent = parent
 			
-			# update max_node if needed
-			if node == self._max_node: #check for duplicates in other cases??? check w GPT that child is always new max!!!!!!!!!!!!!!!!!!
-				self._max_node = child if child.is_real_node() else self.virtual_node
-			parent_for_rebalance = node.parent
-			node.parent = self.virtual_node  # help garbage collection
+			# update max_node if needed: the max has no right child, so its left child is
+			# a leaf and the new max, or else its parent is
+			if node is self._max_node:
+				self._max_node = child if child is not virtual else parent
+			# and the same for the min, which has no left child
+			if node is self._min_node:
+				self._min_node = child if child is not virtual else parent
+			parent_for_rebalance = parent
 
 		# Case 3: node has two children
 		else:
-			succ = self.successor(node) # we know succ has at most one child (right)
-			parent_for_rebalance = succ.parent
-			if succ == node.right:
-				parent_for_rebalance = succ  # since succ will move to node's place
+			# the successor has at most one child (right)
+			if self.threaded:
+				succ = node.next
+			else:
+				succ = right
+				while succ.left is not virtual:
+					succ = succ.left
 
-			# delete successor
-			if succ.parent.left == succ:
-				succ.parent.left = succ.right
+			if succ is right:
+				parent_for_rebalance = succ  # since succ will move to node's place
 			else:
-				succ.parent.right = succ.right
-			if succ.right.is_real_node():
-				succ.right.parent = succ.parent
+				# delete successor
+				parent_for_rebalance = succ.parent
+				parent_for_rebalance.left = succ.right
+				if succ.right is not virtual:
+					succ.right.parent = parent_for_rebalance
+				succ.right = right
+				right.parent = succ
 			
 			#replace node with successor
-			succ.parent = node.parent
-			if node.parent is None or not node.parent.is_real_node(): # node is root
+			succ.parent = parent
+			if parent is virtual: # node is root
 				self.root = succ
+			elif parent.left is node:
+				parent.left = succ
 			else:
-				if node == node.parent.left:
-					node.parent.left = succ
-				else:
-					node.parent.right = succ
-			succ.left = node.left
-			succ.right = node.right
-			if node.left is not None and node.left.is_real_node():
-				node.left.parent = succ
-			if node.right is not None and node.right.is_real_node():
-				node.right.parent = succ
-			
+				parent.right = succ
+			succ.left = left
+			left.parent = succ
 			succ.height = node.height  # successor takes node's height
-			node.parent = self.virtual_node  # help garbage collection
 		
+		node.parent = virtual  # help garbage collection
 		self._size -= 1
+		self.update_sizes(parent_for_rebalance)
 			
 		# Rebalance the tree
-		self.rebalance_tree(parent_for_rebalance)
+		if self.wavl:
+			height_changes = self._wavl_rebalance(parent_for_rebalance)
+		else:
+			height_changes = self.rebalance_tree(parent_for_rebalance)
+		if stats is not None:
+			stats.record_delete_rebalance(sum(stats.rotations.values()) - rotations, height_changes)
 
 		return None
 
@@ -453,22 +1059,271 @@ class AVLTree(object):
 	@rtype: AVLNode
 	"""
 	def successor(self, node):
-		if (node is None) or (not node.is_real_node()) or (self._size == 1) or (node is self._max_node):
+		if node is None or node is self.virtual_node or node is self._max_node:
 			return None
-		elif node.right is not None and node.right.is_real_node():
-			# go to leftmost node in right subtree
-			current = node.right
-			while current.left is not None and current.left.is_real_node():
-				current = current.left
-			return current
-		else:
-			# go up until we find a node that is a left child
-			current = node
-			while current.parent is not None and current.parent.is_real_node() and current == current.parent.right:
-				current = current.parent
-			return current.parent if current.parent is not None and current.parent.is_real_node() else None
+		return self._next_node(node)
+
+	""" finds the in-order predecessor of a given node
+	@type node: AVLNode
+	@param node: the node to find the predecessor of
+	@pre: node is a real pointer to a node in self
+	@rtype: AVLNode
+	@returns: the predecessor, None if node is the minimal node
+	"""
+	def predecessor(self, node):
+		if node is None or node is self.virtual_node or node is self._min_node:
+			return None
+		return self._prev_node(node)
+
+	"""returns the number of values of key: the size of its bucket in a multimap, otherwise 1
+	if key is in the dictionary
+
+	@rtype: int
+	@returns: the count, 0 if key is not in the dictionary
+	"""
+	def count(self, key):
+		node, edges = self._lookup(self._sort_key(key))
+		if node is None:
+			return 0
+		return len(node.value) if self.multimap else 1
+
+	"""returns the values of key
+
+	@rtype: list
+	@returns: a copy of the bucket of key in a multimap (an array with a typecode), otherwise
+	a list holding its value. empty if key is not in the dictionary
+	"""
+	def get_all(self, key):
+		node, edges = self._lookup(self._sort_key(key))
+		if node is None:
+			return array.array(self.typecode) if self.multimap and self.typecode is not None else []
+		return node.value[:] if self.multimap else [node.value]
+
+	"""removes one occurrence of val from the bucket of key, and the node of key with its last value
+
+	@pre: self is a multimap
+	@rtype: bool
+	@returns: True if val was found and removed
+	"""
+	def delete_value(self, key, val):
+		if not self.multimap:
+			raise ValueError("delete_value needs a tree created with multimap=True")
+		node, edges = self._lookup(self._sort_key(key))
+		if node is None:
+			return False
+		try:
+			node.value.remove(val)
+		except ValueError:
+			return False
+		if len(node.value) == 0:
+			self.delete(node)
+		elif self.augment is not None:
+			self.update_sizes(node)
+		return True
 
 	
+	"""searches for many keys at once
+
+	@type keys: list
+	@param keys: the keys to be searched, in any order
+	@rtype: list
+	@returns: a list of (x,e) tuples aligned with keys, as returned by finger_search.
+	the keys are visited in sorted order and each search starts at the node reached by the
+	previous one, so neighbouring keys share most of their path.
+	"""
+	def search_many(self, keys):
+		results = [None] * len(keys)
+		skeys = self._sort_keys(keys)
+		finger = self.root
+		for i in sorted(range(len(keys)), key=skeys.__getitem__):
+			if not finger.is_real_node():
+				results[i] = (None, 1)
+				continue
+			node, last, edges = self._finger_walk(finger, skeys[i])
+			results[i] = (node, edges)
+			finger = last
+		return results
+
+	"""inserts many items at once
+
+	@type pairs: list
+	@pre: the keys are distinct and currently do not appear in the dictionary, unless self is a multimap
+	@param pairs: (key, value) pairs to be inserted, in any order
+	@rtype: list
+	@returns: a list of (x,e,h) tuples aligned with pairs, as returned by finger_insert.
+	the items are inserted in sorted order, each one starting at the previously inserted node.
+	"""
+	def insert_many(self, pairs):
+		results = [None] * len(pairs)
+		skeys = self._sort_keys([pair[0] for pair in pairs])
+		finger = self.root
+		for i in sorted(range(len(pairs)), key=skeys.__getitem__):
+			key, val = pairs[i]
+			if not finger.is_real_node():
+				results[i] = self.insert(key, val)
+			else:
+				node, parent, edges = self._finger_walk(finger, skeys[i])
+				if node is not None and self.multimap:
+					self._append(node, val)
+					results[i] = (node, edges - 1, 0)
+				else:
+					if self.multimap:
+						val = self._bucket(val)
+					new_node, height_changes = self._attach_leaf(key, val, skeys[i], parent)
+					results[i] = (new_node, edges - 1, height_changes)
+					if self.stats is not None:
+						self.stats.record_insert(edges - 1)
+			finger = results[i][0]
+		return results
+
+	"""deletes many keys at once
+
+	@type keys: list
+	@param keys: the keys to be deleted, in any order. keys that are not in the dictionary are ignored
+	@rtype: list
+	@returns: a list of (x,e) tuples aligned with keys, where x is the deleted node (None if
+	the key was missing) and e is the length of the finger search that located it.
+	"""
+	def delete_many(self, keys):
+		results = [None] * len(keys)
+		skeys = self._sort_keys(keys)
+		finger = self.root
+		for i in sorted(range(len(keys)), key=skeys.__getitem__):
+			if not finger.is_real_node():
+				results[i] = (None, 1)
+				continue
+			node, last, edges = self._finger_walk(finger, skeys[i])
+			results[i] = (node, edges)
+			if node is None:
+				finger = last
+				continue
+			# the in-order neighbour survives the deletion, continue from it
+			finger = self._next_node(node) or self._prev_node(node) or self.virtual_node
+			self.delete(node)
+		return results
+
+	"""links a new leaf holding key and val under parent, then rebalances
+
+	@param skey: the sort key of key
+	@type parent: AVLNode
+	@pre: parent is a real node in self whose child slot on the side of key is virtual
+	@rtype: (AVLNode,int)
+	@returns: the new node and the number of PROMOTE cases during the AVL rebalancing
+	"""
+	def _attach_leaf(self, key, val, skey, parent):
+		new_node = self._node_class(key, val)
+		new_node.skey = skey
+		new_node.left = self.virtual_node
+		new_node.right = self.virtual_node
+		new_node.parent = parent
+		if skey < parent.skey:
+			parent.left = new_node
+			if skey < self._min_node.skey:
+				self._min_node = new_node
+		else:
+			parent.right = new_node
+			if skey > self._max_node.skey:
+				self._max_node = new_node
+		if self.threaded:
+			self._thread_leaf(new_node)
+		self._size += 1
+		if self.augment is not None:
+			self.augment.update(new_node)
+		self.update_sizes(parent)
+		if self.track_finger:
+			self._last_node = new_node
+		return new_node, self.rebalance_tree(parent)
+
+	"""finds the node of a sort key, without the bookkeeping of search
+	@rtype: (AVLNode,int)
+	@returns: the node (None if not found) and its depth
+	"""
+	def _lookup(self, key):
+		virtual = self.virtual_node
+		node = self.root
+		edges = 0
+		while node is not virtual:
+			node_key = node.skey
+			if key == node_key:
+				return node, edges
+			node = node.left if key < node_key else node.right
+			edges += 1
+		return None, edges
+
+	"""returns a new multimap bucket holding val
+	"""
+	def _bucket(self, val):
+		if self.typecode is None:
+			return [val]
+		return array.array(self.typecode, (val,))
+
+	"""appends val to the bucket of node in a multimap
+	@rtype: None
+	"""
+	def _append(self, node, val):
+		node.value.append(val)
+		if self.augment is not None:
+			# the summary of the node depends on its whole bucket
+			self.update_sizes(node)
+		if self.track_finger:
+			self._last_node = node
+		return None
+
+	"""links a new leaf into the in-order thread, next to its parent
+	@pre: node is a leaf of a threaded tree
+	@rtype: None
+	"""
+	def _thread_leaf(self, node):
+		parent = node.parent
+		if node is parent.left:
+			node.next = parent
+			node.prev = parent.prev
+			if parent.prev is not None:
+				parent.prev.next = node
+			parent.prev = node
+		else:
+			node.prev = parent
+			node.next = parent.next
+			if parent.next is not None:
+				parent.next.prev = node
+			parent.next = node
+		return None
+
+	"""walks from finger to key: up until the subtree of the current node may hold key, then down
+
+	@type finger: AVLNode
+	@pre: finger is a real node in self
+	@param key: a sort key, as kept in node.skey
+	@rtype: (AVLNode,AVLNode,int)
+	@returns: a 3-tuple (x,p,e) where x is the node holding key (None if not found), p is the
+	last real node visited and e is the number of edges walked+1
+	"""
+	def _finger_walk(self, finger, key):
+		virtual = self.virtual_node
+		edges = 1
+		if key < finger.skey:
+			parent = finger.parent
+			while parent is not virtual and not parent.skey < key:
+				finger = parent
+				parent = finger.parent
+				edges += 1
+		elif finger.skey < key:
+			parent = finger.parent
+			while parent is not virtual and not key < parent.skey:
+				finger = parent
+				parent = finger.parent
+				edges += 1
+
+		last = finger
+		while finger is not virtual:
+			finger_key = finger.skey
+			if key == finger_key:
+				return finger, finger, edges
+			last = finger
+			finger = finger.left if key < finger_key else finger.right
+			edges += 1
+		return None, last, edges
+
 	"""joins self with item and another AVLTree
 
 	@type tree2: AVLTree 
@@ -476,178 +1331,115 @@ class AVLTree(object):
 	@type key: int 
 	@param key: the key separting self and tree2
 	@type val: string
-	@param val: the value corresponding to key
+	@param val: the value corresponding to key (its bucket, in a multimap)
 	@pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
 	or the opposite way
 	"""
 	def join(self, tree2, key, val):
-		new_node = AVLNode(key, val)
-		h1 = self.root.height if self.root.is_real_node() else -1
-		h2 = tree2.root.height if tree2.root.is_real_node() else -1
-		parent_for_rebalance = self.virtual_node
-		
-		self_empty = self.root is None or not self.root.is_real_node()
-		tree2_empty = tree2.root is None or not tree2.root.is_real_node()
-		if self_empty or tree2_empty:
-			if self_empty and tree2_empty:
-				self.root = new_node
-				new_node.left = self.virtual_node
-				new_node.right = self.virtual_node
-				self._max_node = new_node
-				self._size = 1
-			elif self_empty:
-				tree2.insert(key, val)  # insert into tree2
-				self.root = tree2.root
-				self._max_node = tree2._max_node
-				self._size = tree2._size
-			else:  # tree2 is empty
-				self.insert(key, val)  # insert into self
-			tree2.root = tree2.virtual_node  # empty tree2
-			return
-
-		if self._max_node.key < key:  # self's keys are smaller than tree2's keys
-			if h1 == h2:
-				# heights are equal
-				new_node.left = self.root
-				new_node.right = tree2.root
-				if self.root.is_real_node():
-					self.root.parent = new_node
-				if tree2.root.is_real_node():
-					tree2.root.parent = new_node
-				self.root = new_node
-				parent_for_rebalance = new_node
-			
-			elif h1 > h2:
-				# self is taller
-				current = self.root
-				while current.height > h2:
-					current = current.right
-				
-				original_parent = current.parent
-				if original_parent is None:
-					original_parent = self.virtual_node
-				
-				# insert new_node here
-				new_node.parent = original_parent
-				if original_parent is None or not original_parent.is_real_node():
-					self.root = new_node
-				else:
-					original_parent.right = new_node
-				new_node.left = current
-				new_node.right = tree2.root
-				current.parent = new_node
-				if tree2.root.is_real_node():
-					tree2.root.parent = new_node
-				parent_for_rebalance = original_parent
-				if not parent_for_rebalance.is_real_node():
-					parent_for_rebalance = new_node
-			
-			else:
-				# tree2 is taller
-				current = tree2.root
-				while current.height > h1:
-					current = current.left
-				
-				original_parent = current.parent
-				if original_parent is None:
-					original_parent = self.virtual_node
-				
-				# insert new_node here
-				new_node.parent = original_parent
-				if original_parent is None or not original_parent.is_real_node():
-					self.root = new_node
-				else:
-					original_parent.left = new_node
-				new_node.right = current
-				new_node.left = self.root
-				current.parent = new_node
-				if self.root.is_real_node():
-					self.root.parent = new_node
-				if current.parent is not None and current.parent.is_real_node():
-					self.root = tree2.root
-				parent_for_rebalance = original_parent
-				if not parent_for_rebalance.is_real_node():
-					parent_for_rebalance = new_node
-
-			self._max_node = tree2._max_node
-			
-		else:  # tree2's keys are smaller than self's keys
-			if h2 == h1:
-				# heights are equal
-				new_node.left = tree2.root
-				new_node.right = self.root
-				if tree2.root.is_real_node():
-					tree2.root.parent = new_node
-				if self.root.is_real_node():
-					self.root.parent = new_node
-				self.root = new_node
-				parent_for_rebalance = new_node
-			
-			elif h2 > h1:
-				# tree2 is taller
-				current = tree2.root
-				while current.height > h1:
-					current = current.right
-				
-				original_parent = current.parent
-				if original_parent is None:
-					original_parent = self.virtual_node
-				
-				# insert new_node here
-				new_node.parent = original_parent
-				if original_parent is None or not original_parent.is_real_node():
-					self.root = new_node
-				else:
-					original_parent.right = new_node
-				new_node.left = current
-				new_node.right = self.root
-				current.parent = new_node
-				if self.root.is_real_node():
-					self.root.parent = new_node
-				if current.parent is not None and current.parent.is_real_node():
-					self.root = tree2.root
-				parent_for_rebalance = original_parent
-				if not parent_for_rebalance.is_real_node():
-					parent_for_rebalance = new_node
-			
-			else:
-				# self is taller
-				current = self.root
-				while current.height > h2:
-					current = current.left
-				
-				original_parent = current.parent
-				if original_parent is None:
-					original_parent = self.virtual_node
-				# insert new_node here
-				new_node.parent = original_parent
-				if original_parent is None or not original_parent.is_real_node():
-					self.root = new_node
-				else:
-					original_parent.left = new_node
-				new_node.right = current
-				new_node.left = tree2.root
-				current.parent = new_node
-				if tree2.root.is_real_node():
-					tree2.root.parent = new_node
-				parent_for_rebalance = original_parent
-				if not parent_for_rebalance.is_real_node():
-					parent_for_rebalance = new_node
-		
-		
-		def get_h(node):
-			if node is not None and node.is_real_node():
-				return node.height
-			return -1
-		new_node.height = 1 + max(get_h(new_node.left), get_h(new_node.right))
-		
-		tree2.root = tree2.virtual_node  # empty tree2		
+		virtual = self.virtual_node
+		new_node = self._node_class(key, val)
+		if self.sort_key is not None:
+			new_node.skey = self.sort_key(key)
+		skey = new_node.skey
+		if self.stats is not None:
+			self.stats.record_join(abs(self.root.height - tree2.root.height))
+
+		# order the two trees by key
+		if self.root is not virtual:
+			self_smaller = self._max_node.skey < skey
+		else:
+			self_smaller = tree2.root is virtual or skey < tree2.root.skey
+		left, right = (self, tree2) if self_smaller else (tree2, self)
+		max_node = right._max_node if right.root is not virtual else new_node
+		min_node = left._min_node if left.root is not virtual else new_node
+
+		if self.threaded:
+			if left.root is not virtual:
+				left._max_node.next = new_node
+				new_node.prev = left._max_node
+			if right.root is not virtual:
+				right._min_node.prev = new_node
+				new_node.next = right._min_node
+
+		self.root = self._join_roots(left.root, new_node, right.root)
+		self._max_node = max_node
+		self._min_node = min_node
 		self._size += tree2._size + 1
-		
-		# Rebalance the tree
-		self.rebalance_tree(parent_for_rebalance)
+
+		tree2.root = virtual  # empty tree2
+		tree2._max_node = virtual
+		tree2._min_node = virtual
+		tree2._size = 0
+		tree2._last_node = virtual
 		return
 
+	"""joins two detached subtrees and a node between them, in O(|h1-h2|+1)
+
+	@type left: AVLNode
+	@param left: root of the subtree with the smaller keys, may be virtual
+	@type node: AVLNode
+	@param node: the separating node, its current links are ignored
+	@type right: AVLNode
+	@param right: root of the subtree with the larger keys, may be virtual
+	@pre: keys(left) < node.skey < keys(right)
+	@rtype: AVLNode
+	@returns: the root of the joined subtree, which has no parent
+	"""
+	def _join_roots(self, left, node, right):
+		virtual = self.virtual_node
+		if left is not virtual:
+			left.parent = virtual
+		if right is not virtual:
+			right.parent = virtual
+		left_height = left.height
+		right_height = right.height
+
+		if left_height > right_height + 1:
+			# left is taller: go down its right spine to a subtree as high as right
+			parent = left
+			current = left.right
+			while current.height > right_height:
+				parent = current
+				current = current.right
+			parent.right = node
+			node.left = current
+			node.right = right
+			node.parent = parent
+			top = left
+		elif right_height > left_height + 1:
+			# right is taller: go down its left spine to a subtree as high as left
+			parent = right
+			current = right.left
+			while current.height > left_height:
+				parent = current
+				current = current.left
+			parent.left = node
+			node.left = left
+			node.right = current
+			node.parent = parent
+			top = right
+		else:
+			node.left = left
+			node.right = right
+			node.parent = virtual
+			top = node
+
+		left, right = node.left, node.right
+		if left is not virtual:
+			left.parent = node
+		if right is not virtual:
+			right.parent = node
+		node.height = 1 + (left.height if left.height > right.height else right.height)
+
+		# rebalance the spine above node, with top standing in for the root meanwhile
+		saved_root = self.root
+		self.root = top
+		self.update_sizes(node)
+		self.rebalance_tree(node.parent)
+		top = self.root
+		self.root = saved_root
+		return top
+
 
 	"""splits the dictionary at a given node
 
@@ -657,99 +1449,775 @@ class AVLTree(object):
 	@rtype: (AVLTree, AVLTree)
 	@returns: a tuple (left, right), where left is an AVLTree representing the keys in the 
 	dictionary smaller than node.key, and right is an AVLTree representing the keys in the 
-	dictionary larger than node.key.
+	dictionary larger than node.key. self is left empty.
 	"""
 	def split(self, node):
-		left_tree = AVLTree()
-		right_tree = AVLTree()
-		
-		# special case: split at max
-		if node == self._max_node:
-			if self.root.is_real_node():
-				left_tree.root = self.root
-				left_tree.root.parent = left_tree.virtual_node
-				left_tree.delete(node)
-				left_tree.update_max()
-			return left_tree, AVLTree()
-
-		# left subtree of node
-		if node.left is not None and node.left.is_real_node():
-			left_tree.root = node.left
-			# node.left = self.virtual_node
-			left_tree.root.parent = left_tree.virtual_node
-			left_tree.update_max()
-
-		# right subtree of node
-		if node.right is not None and node.right.is_real_node():
-			right_tree.root = node.right
-			# node.right = self.virtual_node
-			right_tree.root.parent = right_tree.virtual_node
-			right_tree.update_max()
-
-		# node.height = 0   # node is now a leaf
-		# go up the tree from node to root
-		current = node.parent
-		prev = node
-		while current is not None and current.is_real_node():	
-			# original_parent = current.parent
-
-			if prev == current.left:
-				# prev was left child -> current and its right subtree go to right_tree
-				# right_subtree = current.right
-				# current.right = self.virtual_node
-
-				temp_tree = AVLTree()
-				
-				if current.right is not None and current.right.is_real_node():
-					temp_tree.root = current.right
-					temp_tree.root.parent = temp_tree.virtual_node
-					temp_tree.update_max()
-				
-				# current.left = self.virtual_node
-				# current.height = 0  # current is now a leaf
-				right_tree.join(temp_tree, current.key, current.value)
-			
-			else:
-				# prev was right child -> current and its left subtree go to left_tree
-				# left_subtree = current.left
-				# current.left = self.virtual_node
-
-				temp_tree = AVLTree()
-				if current.left is not None and current.left.is_real_node():
-					temp_tree.root = current.left
-					temp_tree.root.parent = temp_tree.virtual_node
-					temp_tree.update_max()
-				
-				# current.right = self.virtual_node
-				# current.height = 0  # current is now a leaf
-				temp_tree.join(left_tree, current.key, current.value)
-				left_tree = temp_tree
-			
-			prev = current
-			current = current.parent
-		
-		# if not self.root.is_real_node():
-		# 	self._max_node = self.virtual_node
-		
+		left_tree, node, right_tree = self._split_tree(node.skey)
 		return left_tree, right_tree
 
+	"""splits the dictionary around a key that does not have to appear in it, in O(log n)
+
+	@type key: int
+	@rtype: (AVLTree, AVLNode, AVLTree)
+	@returns: a 3-tuple (left, x, right) where left and right hold the keys smaller and larger
+	than key, and x is the node of key (None if key is not in the dictionary), detached from
+	both trees. self is left empty.
+	"""
+	def split_key(self, key):
+		return self._split_tree(self._sort_key(key))
+
+	"""split_key for a sort key
+	@rtype: (AVLTree, AVLNode, AVLTree)
+	"""
+	def _split_tree(self, key):
+		left, node, right = self._split_roots(key)
+		if node is not None and self.threaded:
+			node.prev = node.next = None
+		left_tree = self._from_subtree(left)
+		right_tree = self._from_subtree(right)
+		self.root = self.virtual_node
+		self._max_node = self.virtual_node
+		self._min_node = self.virtual_node
+		self._size = 0
+		self._last_node = self.virtual_node
+		return left_tree, node, right_tree
+
+	"""cuts the tree of self around key without touching self's fields
+
+	the nodes on the search path of key are joined back one by one, bottom-up, into the
+	side they belong to. the height difference of every join is bounded by the height
+	difference of two consecutive path nodes, so all the joins together cost O(log n).
+
+	in a threaded tree the in-order links into x and across the cut are removed, while x keeps
+	its own links to its old neighbours, so a caller can thread it back into either side
+
+	@param key: a sort key, as kept in node.skey
+	@rtype: (AVLNode, AVLNode, AVLNode)
+	@returns: a 3-tuple (l, x, r) of the detached roots of the keys smaller and larger
+	than key, and the detached node of key (None if key is not in the dictionary)
+	"""
+	def _split_roots(self, key):
+		virtual = self.virtual_node
+		path = []
+		node = self.root
+		while node is not virtual and key != node.skey:
+			path.append(node)
+			node = node.left if key < node.skey else node.right
+
+		if self.threaded:
+			if node is not virtual:
+				before, after = node.prev, node.next
+			elif not path:
+				before = after = None
+			elif key < path[-1].skey:
+				before, after = path[-1].prev, path[-1]
+			else:
+				before, after = path[-1], path[-1].next
+			if before is not None:
+				before.next = None
+			if after is not None:
+				after.prev = None
+
+		if node is virtual:
+			node = None
+			left = right = virtual
+		else:
+			left, right = node.left, node.right
+			node.left = node.right = node.parent = virtual
+
+		for current in reversed(path):
+			if key < current.skey:
+				# current and its right subtree go to the right side
+				right = self._join_roots(right, current, current.right)
+			else:
+				# current and its left subtree go to the left side
+				left = self._join_roots(current.left, current, left)
+
+		if left is not virtual:
+			left.parent = virtual
+		if right is not virtual:
+			right.parent = virtual
+		if self.stats is not None:
+			self.stats.record_split(len(path))
+		return left, node, right
+
+	"""removes the items with lo <= key <= hi and returns them as a new tree, in O(log n)
+
+	@type lo: int
+	@param lo: smallest key to extract, None for no lower bound
+	@type hi: int
+	@param hi: largest key to extract, None for no upper bound
+	@rtype: AVLTree
+	@returns: a tree holding the extracted items
+	"""
+	def extract_range(self, lo=None, hi=None):
+		virtual = self.virtual_node
+		lo, hi = self._sort_range(lo, hi)
+		if lo is not None and hi is not None and hi < lo:
+			return self._spawn()
+
+		below = virtual
+		if lo is not None:
+			below, node, rest = self._split_roots(lo)
+			if node is not None:
+				self._rethread(node, True)
+				rest = self._join_roots(virtual, node, rest)
+			self.root = rest
+		above = virtual
+		if hi is not None:
+			middle, node, above = self._split_roots(hi)
+			if node is not None:
+				self._rethread(node, False)
+				middle = self._join_roots(middle, node, virtual)
+		else:
+			middle = self.root
+
+		self._set_root(self._concat_roots(below, above))
+		return self._from_subtree(middle)
+
+	"""removes the items with lo <= key <= hi, in O(log n)
+
+	@type lo: int
+	@param lo: smallest key to remove, None for no lower bound
+	@type hi: int
+	@param hi: largest key to remove, None for no upper bound
+	@rtype: int
+	@returns: the number of items removed
+	"""
+	def delete_range(self, lo=None, hi=None):
+		return self.extract_range(lo, hi).size()
+
+	"""removes the items with a key smaller than key, in O(log n)
+
+	@rtype: int
+	@returns: the number of items removed
+	"""
+	def truncate_below(self, key):
+		below, node, rest = self._split_roots(self._sort_key(key))
+		if node is not None:
+			self._rethread(node, True)
+			rest = self._join_roots(self.virtual_node, node, rest)
+		self._set_root(rest)
+		return below.size
+
+	"""removes the items with a key larger than key, in O(log n)
+
+	@rtype: int
+	@returns: the number of items removed
+	"""
+	def truncate_above(self, key):
+		rest, node, above = self._split_roots(self._sort_key(key))
+		if node is not None:
+			self._rethread(node, False)
+			rest = self._join_roots(rest, node, self.virtual_node)
+		self._set_root(rest)
+		return above.size
+
+	"""makes the detached subtree of root the whole content of self
+	@rtype: None
+	"""
+	def _set_root(self, root):
+		self.root = root
+		self._size = root.size
+		self._last_node = self.virtual_node
+		self.update_max()
+		self.update_min()
+		return None
+
+	"""joins two detached subtrees, using the max of left as the separating node.
+	self.root is used as scratch space and must be set by the caller afterwards
+
+	@pre: all keys of left are smaller than all keys of right
+	@rtype: AVLNode
+	@returns: the root of the joined subtree
+	"""
+	def _concat_roots(self, left, right):
+		virtual = self.virtual_node
+		if left is virtual:
+			return right
+		if right is virtual:
+			return left
+		last = left
+		while last.right is not virtual:
+			last = last.right
+		self.root = left
+		left, last, rest = self._split_roots(last.skey)
+		if self.threaded:
+			self._rethread(last, False)
+			first = right
+			while first.left is not virtual:
+				first = first.left
+			last.next = first
+			first.prev = last
+		return self._join_roots(left, last, right)
+
+	"""threads a node cut out by _split_roots back in as the first node of the larger keys
+	(first=True) or as the last node of the smaller keys, using its old neighbour on that side
+	@rtype: None
+	"""
+	def _rethread(self, node, first):
+		if not self.threaded:
+			return None
+		if first:
+			node.prev = None
+			if node.next is not None:
+				node.next.prev = node
+		else:
+			node.next = None
+			if node.prev is not None:
+				node.prev.next = node
+		return None
+
+	"""returns the union of self and tree2, keeping self's value for keys found in both
+	(in a multimap, the bucket of self followed by the values of tree2)
+
+	@type tree2: AVLTree
+	@rtype: AVLTree
+	@returns: a tree holding every key of self and tree2. self and tree2 must not be used afterwards.
+	the work is O(m log(n/m + 1)) for sizes m <= n, using only split and join.
+	"""
+	def union(self, tree2):
+		if not tree2.root.is_real_node():
+			return self
+		if not self.root.is_real_node():
+			return tree2
+		left1, key, val, right1 = self._take_root()
+		left2, node, right2 = tree2.split_key(key)
+		if node is not None and self.multimap:
+			val.extend(node.value)
+		left = left1.union(left2)
+		right = right1.union(right2)
+		left.join(right, key, val)
+		return left
+
+	"""returns the intersection of self and tree2, with self's values
+
+	@type tree2: AVLTree
+	@rtype: AVLTree
+	@returns: a tree holding the keys found in both self and tree2.
+	self and tree2 must not be used afterwards.
+	"""
+	def intersection(self, tree2):
+		if not self.root.is_real_node() or not tree2.root.is_real_node():
+			return self._spawn()
+		left1, key, val, right1 = self._take_root()
+		left2, node, right2 = tree2.split_key(key)
+		left = left1.intersection(left2)
+		right = right1.intersection(right2)
+		if node is None:
+			return left.concat(right)
+		left.join(right, key, val)
+		return left
+
+	"""returns the difference of self and tree2
+
+	@type tree2: AVLTree
+	@rtype: AVLTree
+	@returns: a tree holding the keys of self that are not in tree2.
+	self and tree2 must not be used afterwards.
+	"""
+	def difference(self, tree2):
+		if not self.root.is_real_node() or not tree2.root.is_real_node():
+			return self
+		left2, key, val, right2 = tree2._take_root()
+		left1, node, right1 = self.split_key(key)
+		left = left1.difference(left2)
+		right = right1.difference(right2)
+		return left.concat(right)
+
+	"""joins self with another AVLTree without a separating item
+
+	@type tree2: AVLTree
+	@pre: all keys in self are smaller than all keys in tree2
+	@rtype: AVLTree
+	@returns: the joined tree (self or tree2). tree2 must not be used afterwards.
+	"""
+	def concat(self, tree2):
+		if not tree2.root.is_real_node():
+			return self
+		if not self.root.is_real_node():
+			return tree2
+		first = tree2._min_node
+		key, val = first.key, first.value
+		tree2.delete(first)
+		self.join(tree2, key, val)
+		return self
+
+	"""detaches the root of self from its subtrees
+
+	@pre: self is not empty
+	@rtype: (AVLTree, int, string, AVLTree)
+	@returns: a 4-tuple (left, key, val, right) of the two subtrees and the root item.
+	self must not be used afterwards.
+	"""
+	def _take_root(self):
+		root = self.root
+		if self.threaded:
+			if root.prev is not None:
+				root.prev.next = None
+			if root.next is not None:
+				root.next.prev = None
+		return self._from_subtree(root.left), root.key, root.value, self._from_subtree(root.right)
+
+	"""returns a new empty AVLTree configured like self
+	@rtype: AVLTree
+	"""
+	def _spawn(self):
+		return AVLTree(augment=self.augment, threaded=self.threaded, key=self.key, cmp=self.cmp,
+			multimap=self.multimap, typecode=self.typecode, wavl=self.wavl)
+
+	"""wraps the subtree rooted at node in a new AVLTree configured like self
+	@type node: AVLNode
+	@rtype: AVLTree
+	"""
+	def _from_subtree(self, node):
+		tree = self._spawn()
+		if node.is_real_node():
+			tree.root = node
+			node.parent = tree.virtual_node
+			tree._size = node.size
+			tree.update_max()
+			tree.update_min()
+		return tree
+
+	"""returns the number of keys in the dictionary that are smaller than or equal to key
+
+	@type key: int
+	@param key: the key to rank, it does not have to appear in the dictionary
+	@rtype: int
+	@returns: the rank of key, so that select(rank(key)) is key when key is in the dictionary
+	"""
+	def rank(self, key):
+		return self._count_below(self._sort_key(key), True)
+
+	"""returns the number of keys in the dictionary that are smaller than the sort key key
+	(or equal to it, if inclusive)
+	@rtype: int
+	"""
+	def _count_below(self, key, inclusive):
+		virtual = self.virtual_node
+		node = self.root
+		count = 0
+		while node is not virtual:
+			if key < node.skey or (key == node.skey and not inclusive):
+				node = node.left
+			else:
+				count += node.left.size + 1
+				if key == node.skey:
+					break
+				node = node.right
+		return count
+
+	"""finds the node holding the k-th smallest key in the dictionary
+
+	@type k: int
+	@param k: the rank to look for, 1 <= k <= size
+	@rtype: AVLNode
+	@returns: the node of rank k, None if k is out of range
+	"""
+	def select(self, k):
+		if k < 1 or k > self._size:
+			return None
+		node = self.root
+		while True:
+			left_size = node.left.size
+			if k == left_size + 1:
+				return node
+			elif k <= left_size:
+				node = node.left
+			else:
+				k -= left_size + 1
+				node = node.right
+
+	"""returns the number of keys in the dictionary between lo and hi (both included)
+
+	@rtype: int
+	"""
+	def count_range(self, lo, hi):
+		lo, hi = self._sort_range(lo, hi)
+		if hi < lo:
+			return 0
+		return self._count_below(hi, True) - self._count_below(lo, False)
+
+	"""combines the summaries of the items with lo <= key <= hi, in O(log n)
+
+	@type lo: int
+	@param lo: smallest key to include, None for no lower bound
+	@type hi: int
+	@param hi: largest key to include, None for no upper bound
+	@pre: self was created with an augmentation
+	@returns: the combined summary in key order, the identity of the augmentation if the range is empty
+	"""
+	def range_aggregate(self, lo=None, hi=None):
+		augment = self.augment
+		if augment is None:
+			raise ValueError("range_aggregate needs a tree created with an augmentation")
+		lift, combine = augment.lift, augment.combine
+		virtual = self.virtual_node
+		lo, hi = self._sort_range(lo, hi)
+
+		# find the highest node inside the range, where the paths to lo and hi part
+		node = self.root
+		while node is not virtual:
+			if hi is not None and hi < node.skey:
+				node = node.left
+			elif lo is not None and node.skey < lo:
+				node = node.right
+			else:
+				break
+		if node is virtual:
+			return augment.identity
+		result = lift(node.key, node.value)
+
+		# towards lo: every node in range brings itself and its whole right subtree
+		current = node.left
+		while current is not virtual:
+			if lo is None or not current.skey < lo:
+				if current.right is not virtual:
+					result = combine(current.right.agg, result)
+				result = combine(lift(current.key, current.value), result)
+				if lo is None:
+					if current.left is not virtual:
+						result = combine(current.left.agg, result)
+					break
+				current = current.left
+			else:
+				current = current.right
+
+		# towards hi: every node in range brings its whole left subtree and itself
+		current = node.right
+		while current is not virtual:
+			if hi is None or not hi < current.skey:
+				if current.left is not virtual:
+					result = combine(result, current.left.agg)
+				result = combine(result, lift(current.key, current.value))
+				if hi is None:
+					if current.right is not virtual:
+						result = combine(result, current.right.agg)
+					break
+				current = current.right
+			else:
+				current = current.left
+		return result
+
+	"""returns the node holding the median key of the dictionary (the lower one for an even size)
+
+	@rtype: AVLNode
+	@returns: the median node, None if the dictionary is empty
+	"""
+	def median(self):
+		return self.select((self._size + 1) // 2)
+
+	"""returns the node with the largest key <= key, in one root-to-leaf pass
+
+	@type key: int
+	@param key: the key to look up, it does not have to appear in the dictionary
+	@type from_max: bool
+	@param from_max: if True, walk from the max node as finger_search does
+	@rtype: AVLNode
+	@returns: the node, None if every key is larger than key
+	"""
+	def floor(self, key, from_max=False):
+		return self._bounds(key, self._max_node if from_max else None, _floor_of)
+
+	"""returns the node with the smallest key >= key, in one root-to-leaf pass
+
+	@type from_max: bool
+	@param from_max: if True, walk from the max node as finger_search does
+	@rtype: AVLNode
+	@returns: the node, None if every key is smaller than key
+	"""
+	def ceiling(self, key, from_max=False):
+		return self._bounds(key, self._max_node if from_max else None, _ceiling_of)
+
+	"""returns the first node whose key is not smaller than key (the same node as ceiling)
+
+	@rtype: AVLNode
+	"""
+	def lower_bound(self, key, from_max=False):
+		return self.ceiling(key, from_max)
+
+	"""returns the first node whose key is larger than key, in one root-to-leaf pass
+
+	@rtype: AVLNode
+	@returns: the node, None if no key is larger than key
+	"""
+	def upper_bound(self, key, from_max=False):
+		return self._bounds(key, self._max_node if from_max else None, _upper_bound_of)
+
+	"""returns the node whose key is closest to key, in one root-to-leaf pass
+
+	@pre: keys (or their sort keys, with a key function) support subtraction
+	@rtype: AVLNode
+	@returns: the node, the smaller key on a tie, None if the dictionary is empty
+	"""
+	def nearest(self, key, from_max=False):
+		return self._bounds(key, self._max_node if from_max else None, _nearest_of)
+
+	"""floor for many keys at once
+
+	@type keys: list
+	@param keys: the keys to look up. when they are sorted, each walk starts where the previous
+	one ended, like a merge of keys with the tree; any other order gives the same results, slower
+	@rtype: list
+	@returns: the floor nodes (or None) aligned with keys
+	"""
+	def floor_many(self, keys):
+		return self._bounds_many(keys, _floor_of)
+
+	"""ceiling (lower_bound) for many keys at once, see floor_many
+
+	@rtype: list
+	"""
+	def ceiling_many(self, keys):
+		return self._bounds_many(keys, _ceiling_of)
+
+	"""upper_bound for many keys at once, see floor_many
+
+	@rtype: list
+	"""
+	def upper_bound_many(self, keys):
+		return self._bounds_many(keys, _upper_bound_of)
+
+	"""nearest for many keys at once, see floor_many
+
+	@rtype: list
+	"""
+	def nearest_many(self, keys):
+		return self._bounds_many(keys, _nearest_of)
+
+	"""answers one bound query per key, each walk starting at the last node of the previous one
+	@rtype: list
+	"""
+	def _bounds_many(self, keys, pick):
+		results = []
+		finger = None
+		for key in self._sort_keys(keys):
+			below, exact, above, last = self._bound_walk(finger, key)
+			results.append(pick(key, below, exact, above))
+			finger = last
+		return results
+
+	"""walks to key from finger (or from the root) and collects its neighbours on the way
+	@type pick: callable
+	@param pick: one of the pickers above, called as pick(k, b, x, a) with the sort key k of key,
+	the nodes b and a with the largest key < key and the smallest key > key seen on the walk,
+	and the node x of key. x is None if key is missing, in which case b and a are the floor
+	and ceiling of key; otherwise they are the nearest ancestors of x on either side
+	@rtype: AVLNode
+	@returns: the node picked
+	"""
+	def _bounds(self, key, finger, pick):
+		key = self._sort_key(key)
+		below, exact, above, last = self._bound_walk(finger, key)
+		return pick(key, below, exact, above)
+
+	"""the walk of _bounds for a sort key, returning (b, x, a) and the last real node visited
+	@rtype: (AVLNode, AVLNode, AVLNode, AVLNode)
+	"""
+	def _bound_walk(self, finger, key):
+		virtual = self.virtual_node
+		below = above = None
+		if finger is None or finger is virtual:
+			node = self.root
+		else:
+			# climb as in _finger_walk; the parent where the climb stops bounds key on that side
+			node = finger
+			parent = node.parent
+			if key < node.skey:
+				while parent is not virtual and not parent.skey < key:
+					node = parent
+					parent = node.parent
+				if parent is not virtual:
+					below = parent
+			elif node.skey < key:
+				while parent is not virtual and not key < parent.skey:
+					node = parent
+					parent = node.parent
+				if parent is not virtual:
+					above = parent
+
+		last = None
+		while node is not virtual:
+			node_key = node.skey
+			last = node
+			if key < node_key:
+				above = node
+				node = node.left
+			elif node_key < key:
+				below = node
+				node = node.right
+			else:
+				return below, node, above, node
+		return below, None, above, last
+
 	"""returns an array representing dictionary 
 
 	@rtype: list
 	@returns: a sorted list according to key of touples (key, value) representing the data structure
 	"""
 	def avl_to_array(self):
-		result = []
-
-		def in_order(node):
-			if node is None or not node.is_real_node():
-				return
-			in_order(node.left)
-			result.append((node.key, node.value))
-			in_order(node.right)
-		
-		in_order(self.root)
-		return result
+		return list(self.items())
+
+	"""iterates over the keys of the dictionary in increasing order
+	"""
+	def __iter__(self):
+		return self.keys()
+
+	"""iterates over the keys of the dictionary in decreasing order
+	"""
+	def __reversed__(self):
+		for key, val in self.reversed():
+			yield key
+
+	"""lazily iterates over the items of the dictionary in increasing order of key
+
+	@type lo: int
+	@param lo: smallest key to report, None for no lower bound
+	@type hi: int
+	@param hi: largest key to report, None for no upper bound
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi. the first item is found in O(log n),
+	every following one in O(1) amortized, without recursion.
+	"""
+	def items(self, lo=None, hi=None):
+		virtual = self.virtual_node
+		threaded = self.threaded
+		lo, hi = self._sort_range(lo, hi)
+		node = self._first_from(lo)
+		while node is not None and (hi is None or not hi < node.skey):
+			yield node.key, node.value
+			if threaded:
+				node = node.next
+				continue
+			# the in-order step of _next_node, inlined
+			child = node.right
+			if child is not virtual:
+				while child is not virtual:
+					node = child
+					child = node.left
+			else:
+				parent = node.parent
+				while parent is not virtual and node is parent.right:
+					node = parent
+					parent = node.parent
+				node = parent if parent is not virtual else None
+
+	"""lazily iterates over the keys of the dictionary in increasing order
+
+	@rtype: generator
+	@returns: keys with lo <= key <= hi, as in items
+	"""
+	def keys(self, lo=None, hi=None):
+		for key, val in self.items(lo, hi):
+			yield key
+
+	"""lazily iterates over the items of the dictionary in decreasing order of key
+
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi, largest key first
+	"""
+	def reversed(self, lo=None, hi=None):
+		lo, hi = self._sort_range(lo, hi)
+		node = self._last_until(hi)
+		while node is not None and (lo is None or not node.skey < lo):
+			yield node.key, node.value
+			node = self._prev_node(node)
+
+	"""finds the node with the smallest sort key >= lo (the minimal node if lo is None)
+	@rtype: AVLNode
+	@returns: the node, None if there is no such node
+	"""
+	def _first_from(self, lo):
+		if lo is None:
+			return self.min_node()
+		virtual = self.virtual_node
+		node = self.root
+		found = None
+		while node is not virtual:
+			if not node.skey < lo:
+				found = node
+				node = node.left
+			else:
+				node = node.right
+		return found
+
+	"""finds the node with the largest sort key <= hi (the maximal node if hi is None)
+	@rtype: AVLNode
+	@returns: the node, None if there is no such node
+	"""
+	def _last_until(self, hi):
+		if hi is None:
+			return self.max_node()
+		virtual = self.virtual_node
+		node = self.root
+		found = None
+		while node is not virtual:
+			if not hi < node.skey:
+				found = node
+				node = node.right
+			else:
+				node = node.left
+		return found
+
+	"""returns what the tree compares for key: key itself, or its sort key with a key function
+	"""
+	def _sort_key(self, key):
+		return key if self.sort_key is None else self.sort_key(key)
+
+	"""returns the sort keys of a list of keys
+	@rtype: list
+	"""
+	def _sort_keys(self, keys):
+		sort_key = self.sort_key
+		return keys if sort_key is None else [sort_key(key) for key in keys]
+
+	"""returns the sort keys of the bounds of a range, each bound may be None
+	@rtype: tuple
+	"""
+	def _sort_range(self, lo, hi):
+		sort_key = self.sort_key
+		if sort_key is None:
+			return lo, hi
+		return (lo if lo is None else sort_key(lo)), (hi if hi is None else sort_key(hi))
+
+	"""returns the node following node in key order, None if node is the last one
+	@rtype: AVLNode
+	"""
+	def _next_node(self, node):
+		if self.threaded:
+			return node.next
+		virtual = self.virtual_node
+		child = node.right
+		if child is not virtual:
+			while child is not virtual:
+				node = child
+				child = node.left
+			return node
+		parent = node.parent
+		while parent is not virtual and node is parent.right:
+			node = parent
+			parent = node.parent
+		return parent if parent is not virtual else None
+
+	"""returns the node preceding node in key order, None if node is the first one
+	@rtype: AVLNode
+	"""
+	def _prev_node(self, node):
+		if self.threaded:
+			return node.prev
+		virtual = self.virtual_node
+		child = node.left
+		if child is not virtual:
+			while child is not virtual:
+				node = child
+				child = node.right
+			return node
+		parent = node.parent
+		while parent is not virtual and node is parent.left:
+			node = parent
+			parent = node.parent
+		return parent if parent is not virtual else None
 
 	"""returns the node with the maximal key in the dictionary
 
@@ -757,22 +2225,89 @@ class AVLTree(object):
 	@returns: the maximal node, None if the dictionary is empty
 	"""
 	def max_node(self):
-		return None if (self.root is None or not self.root.is_real_node()) else self._max_node
+		return None if self.root is self.virtual_node else self._max_node
+
+	"""returns the node with the minimal key in the dictionary
+
+	@rtype: AVLNode
+	@returns: the minimal node, None if the dictionary is empty
+	"""
+	def min_node(self):
+		return None if self.root is self.virtual_node else self._min_node
+
+	"""removes the item with the minimal key in O(log n): the node is found in O(1), but delete
+	updates the sizes on the path to the root. peek with min_node() for O(1)
+
+	@rtype: (int, string)
+	@returns: the removed (key, value), None if the dictionary is empty
+	"""
+	def pop_min(self):
+		node = self._min_node
+		if node is self.virtual_node:
+			return None
+		self.delete(node)
+		return node.key, node.value
+
+	"""removes the item with the maximal key in O(log n): the node is found in O(1), but delete
+	updates the sizes on the path to the root. peek with max_node() for O(1)
+
+	@rtype: (int, string)
+	@returns: the removed (key, value), None if the dictionary is empty
+	"""
+	def pop_max(self):
+		node = self._max_node
+		if node is self.virtual_node:
+			return None
+		self.delete(node)
+		return node.key, node.value
+
+	"""updates the min_node field of the AVLTree
+	@rtype: None
+	"""
+	def update_min(self):
+		virtual = self.virtual_node
+		node = self.root
+		if node is virtual:
+			self._min_node = virtual
+			return None
+		while node.left is not virtual:
+			node = node.left
+		self._min_node = node
+		return None
 
 	"""updates the max_node field of the AVLTree
 	@rtype: None
 	"""
 	def update_max(self):
 		# recompute max_node (rightmost)
+		virtual = self.virtual_node
 		node = self.root
-		if node is None or not node.is_real_node():
-			self._max_node = self.virtual_node
+		if node is virtual:
+			self._max_node = virtual
 			return None
-		while node.right is not None and node.right.is_real_node():
+		while node.right is not virtual:
 			node = node.right
 		self._max_node = node
 		return None
 	
+	"""recomputes the subtree sizes (and summaries, with an augmentation) of node and all of its ancestors
+	@type node: AVLNode
+	@rtype: None
+	"""
+	def update_sizes(self, node):
+		virtual = self.virtual_node
+		augment = self.augment
+		if augment is not None:
+			while node is not virtual:
+				node.size = 1 + node.left.size + node.right.size
+				augment.update(node)
+				node = node.parent
+			return None
+		while node is not virtual:
+			node.size = 1 + node.left.size + node.right.size
+			node = node.parent
+		return None
+
 	"""returns the number of items in dictionary 
 
 	@rtype: int
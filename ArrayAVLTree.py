@@ -0,0 +1,543 @@
+"""
+A struct-of-arrays AVL tree backend.
+
+Instead of one AVLNode object per entry, every node is an integer index into
+parallel buffers (keys, values, children, parent, height and subtree size)
+owned by a NodePool. Index 0 plays the role of the shared virtual node.
+"""
+
+from array import array
+import sys
+
+
+"""A pool of nodes stored in parallel buffers, shared by every ArrayAVLTree built on it"""
+
+class NodePool(object):
+
+	"""Constructor
+
+	@type key_type: str
+	@param key_type: an array typecode (for example 'q') to store keys in a compact
+	typed buffer, or None to store arbitrary keys in a list
+	"""
+	def __init__(self, key_type=None):
+		# index 0 is the virtual node: height -1, size 0
+		self.keys = array(key_type, [0]) if key_type is not None else [None]
+		self.values = [None]
+		self.left = array('i', [0])
+		self.right = array('i', [0])
+		self.parent = array('i', [0])
+		self.height = array('b', [-1])
+		self.size = array('i', [0])
+		self._free = 0  # head of the free list, chained through right
+
+	"""allocates a leaf node holding key and val
+
+	@rtype: int
+	@returns: the index of the new node
+	"""
+	def alloc(self, key, val):
+		node = self._free
+		if node:
+			self._free = self.right[node]
+			self.keys[node] = key
+			self.values[node] = val
+			self.left[node] = 0
+			self.right[node] = 0
+			self.parent[node] = 0
+			self.height[node] = 0
+			self.size[node] = 1
+		else:
+			node = len(self.values)
+			self.keys.append(key)
+			self.values.append(val)
+			self.left.append(0)
+			self.right.append(0)
+			self.parent.append(0)
+			self.height.append(0)
+			self.size.append(1)
+		return node
+
+	"""returns a node to the free list
+	@type node: int
+	@pre: node is allocated and no longer linked into any tree
+	"""
+	def release(self, node):
+		self.values[node] = None  # drop the reference to the value
+		self.right[node] = self._free
+		self._free = node
+
+	"""returns the number of bytes used by the node buffers, excluding the key and value objects
+
+	@rtype: int
+	"""
+	def nbytes(self):
+		total = sys.getsizeof(self.values)
+		for buf in (self.keys, self.left, self.right, self.parent, self.height, self.size):
+			total += sys.getsizeof(buf)
+		return total
+
+
+"""
+A class implementing an AVL tree on top of a NodePool.
+Nodes are represented by their integer index, None stands for a missing node.
+"""
+
+class ArrayAVLTree(object):
+
+	"""Constructor
+
+	@type pool: NodePool
+	@param pool: the pool to allocate nodes from, a new one is created if None
+	@type key_type: str
+	@param key_type: typecode for the keys buffer of a newly created pool
+	"""
+	def __init__(self, pool=None, key_type=None):
+		self.pool = pool if pool is not None else NodePool(key_type)
+		self.root = 0
+		self._max_node = 0
+
+	"""returns the key stored in node
+	@type node: int
+	"""
+	def key(self, node):
+		return self.pool.keys[node]
+
+	"""returns the value stored in node
+	@type node: int
+	"""
+	def value(self, node):
+		return self.pool.values[node]
+
+	"""searches for a node in the dictionary corresponding to the key (starting at the root)
+
+	@rtype: (int,int)
+	@returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+	and e is the number of edges on the path between the starting node and ending node+1.
+	"""
+	def search(self, key):
+		keys, left, right = self.pool.keys, self.pool.left, self.pool.right
+		node = self.root
+		edges = 1
+		while node:
+			node_key = keys[node]
+			if key == node_key:
+				return node, edges
+			node = left[node] if key < node_key else right[node]
+			edges += 1
+		return None, edges
+
+	"""searches for a node in the dictionary corresponding to the key, starting at the max
+
+	@rtype: (int,int)
+	@returns: a tuple (x,e) as in search
+	"""
+	def finger_search(self, key):
+		pool = self.pool
+		keys, left, right, parent = pool.keys, pool.left, pool.right, pool.parent
+		finger = self._max_node
+		if not finger:
+			return None, 1
+		edges = 1
+		# going up the tree until we find a node with key <= search key
+		while parent[finger] and key < keys[finger]:
+			finger = parent[finger]
+			edges += 1
+		# going down the tree to find the key
+		while finger:
+			edges += 1
+			if key == keys[finger]:
+				return finger, edges
+			finger = left[finger] if key < keys[finger] else right[finger]
+		return None, edges
+
+	"""inserts a new node into the dictionary with corresponding key and value (starting at the root)
+
+	@pre: key currently does not appear in the dictionary
+	@rtype: (int,int,int)
+	@returns: a 3-tuple (x,e,h) where x is the new node, e is the number of edges on the
+	path before rebalancing, and h is the number of PROMOTE cases during rebalancing
+	"""
+	def insert(self, key, val):
+		return self._insert_from(self.root, 0, key, val)
+
+	"""inserts a new node into the dictionary with corresponding key and value, starting at the max
+
+	@pre: key currently does not appear in the dictionary
+	@rtype: (int,int,int)
+	@returns: a 3-tuple (x,e,h) as in insert
+	"""
+	def finger_insert(self, key, val):
+		pool = self.pool
+		keys, parent = pool.keys, pool.parent
+		current = self._max_node
+		edges = 0
+		# going up the tree until we find a node with key <= insert key
+		while current and parent[current] and key < keys[current]:
+			current = parent[current]
+			edges += 1
+		return self._insert_from(current, edges, key, val)
+
+	"""descends from current, links a new leaf and rebalances
+	@rtype: (int,int,int)
+	"""
+	def _insert_from(self, current, edges, key, val):
+		pool = self.pool
+		keys, left, right, parent, size = pool.keys, pool.left, pool.right, pool.parent, pool.size
+		new_node = pool.alloc(key, val)
+		if not self.root:
+			self.root = new_node
+			self._max_node = new_node
+			return new_node, edges, 0
+
+		parent_node = 0
+		while current:
+			parent_node = current
+			edges += 1
+			current = left[current] if key < keys[current] else right[current]
+
+		parent[new_node] = parent_node
+		if key < keys[parent_node]:
+			left[parent_node] = new_node
+		else:
+			right[parent_node] = new_node
+			if key > keys[self._max_node]:
+				self._max_node = new_node
+
+		node = parent_node
+		while node:
+			size[node] += 1
+			node = parent[node]
+		return new_node, edges, self._rebalance(parent_node)
+
+	"""rebalances the tree going up from node, updating heights and rotating where needed
+
+	@rtype: int
+	@returns: number of height changes during rebalancing
+	"""
+	def _rebalance(self, node):
+		pool = self.pool
+		left, right, parent, height = pool.left, pool.right, pool.parent, pool.height
+		height_changes = 0
+		while node:
+			bf = height[left[node]] - height[right[node]]
+			if bf == 2:
+				child = left[node]
+				if height[left[child]] < height[right[child]]:
+					self._rotate_left(child)
+				node = self._rotate_right(node)
+			elif bf == -2:
+				child = right[node]
+				if height[right[child]] < height[left[child]]:
+					self._rotate_right(child)
+				node = self._rotate_left(node)
+			else:
+				new_height = 1 + max(height[left[node]], height[right[node]])
+				if new_height == height[node]:
+					return height_changes
+				height[node] = new_height
+				height_changes += 1
+			node = parent[node]
+		return height_changes
+
+	"""rotates node down to the left, returns the node that took its place
+	@rtype: int
+	"""
+	def _rotate_left(self, node):
+		pool = self.pool
+		left, right, parent, height, size = pool.left, pool.right, pool.parent, pool.height, pool.size
+		new_root = right[node]
+		inner = left[new_root]
+		right[node] = inner
+		if inner:
+			parent[inner] = node
+		self._replace_child(node, new_root)
+		left[new_root] = node
+		parent[node] = new_root
+		height[node] = 1 + max(height[left[node]], height[inner])
+		height[new_root] = 1 + max(height[node], height[right[new_root]])
+		size[new_root] = size[node]
+		size[node] = size[left[node]] + size[inner] + 1
+		return new_root
+
+	"""rotates node down to the right, returns the node that took its place
+	@rtype: int
+	"""
+	def _rotate_right(self, node):
+		pool = self.pool
+		left, right, parent, height, size = pool.left, pool.right, pool.parent, pool.height, pool.size
+		new_root = left[node]
+		inner = right[new_root]
+		left[node] = inner
+		if inner:
+			parent[inner] = node
+		self._replace_child(node, new_root)
+		right[new_root] = node
+		parent[node] = new_root
+		height[node] = 1 + max(height[inner], height[right[node]])
+		height[new_root] = 1 + max(height[left[new_root]], height[node])
+		size[new_root] = size[node]
+		size[node] = size[inner] + size[right[node]] + 1
+		return new_root
+
+	"""puts new in the place of old under old's parent (or as the root)
+	"""
+	def _replace_child(self, old, new):
+		pool = self.pool
+		parent_node = pool.parent[old]
+		if new:
+			pool.parent[new] = parent_node
+		if not parent_node:
+			self.root = new
+		elif pool.left[parent_node] == old:
+			pool.left[parent_node] = new
+		else:
+			pool.right[parent_node] = new
+
+	"""deletes node from the dictionary
+
+	@type node: int
+	@pre: node is a real pointer to a node in self
+	"""
+	def delete(self, node):
+		if not node:
+			return None
+		pool = self.pool
+		left, right, parent, height, size = pool.left, pool.right, pool.parent, pool.height, pool.size
+
+		if node == self._max_node:
+			# the new max is the rightmost node of the left subtree, or the parent
+			new_max = left[node]
+			if new_max:
+				while right[new_max]:
+					new_max = right[new_max]
+			else:
+				new_max = parent[node]
+			self._max_node = new_max
+
+		if left[node] and right[node]:
+			succ = right[node]
+			while left[succ]:
+				succ = left[succ]
+			start = parent[succ]
+			if start == node:
+				start = succ
+			else:
+				# unlink the successor and give it node's right subtree
+				left[start] = right[succ]
+				if right[succ]:
+					parent[right[succ]] = start
+				right[succ] = right[node]
+				parent[right[node]] = succ
+			left[succ] = left[node]
+			parent[left[node]] = succ
+			height[succ] = height[node]
+			size[succ] = size[node]
+			self._replace_child(node, succ)
+		else:
+			start = parent[node]
+			self._replace_child(node, left[node] or right[node])
+
+		current = start
+		while current:
+			size[current] -= 1
+			current = parent[current]
+		pool.release(node)
+		self._rebalance(start)
+		return None
+
+	""" finds the in-order successor of a given node
+	@type node: int
+	@rtype: int
+	@returns: the successor, None if node is the max
+	"""
+	def successor(self, node):
+		pool = self.pool
+		left, right, parent = pool.left, pool.right, pool.parent
+		if not node or node == self._max_node:
+			return None
+		if right[node]:
+			node = right[node]
+			while left[node]:
+				node = left[node]
+			return node
+		while parent[node] and right[parent[node]] == node:
+			node = parent[node]
+		return parent[node] or None
+
+	"""joins the subtrees rooted at small and big with a middle node, returns the new root
+	@pre: small and big have parent 0, keys(small) < key(middle) < keys(big)
+	@rtype: int
+	"""
+	def _join_roots(self, small, middle, big):
+		pool = self.pool
+		left, right, parent, height, size = pool.left, pool.right, pool.parent, pool.height, pool.size
+		h_small, h_big = height[small], height[big]
+		parent[middle] = 0
+		if abs(h_small - h_big) <= 1:
+			left[middle] = small
+			right[middle] = big
+			if small:
+				parent[small] = middle
+			if big:
+				parent[big] = middle
+			height[middle] = 1 + max(h_small, h_big)
+			size[middle] = size[small] + size[big] + 1
+			return middle
+
+		if h_small > h_big:
+			# go down the right spine of small to a node of height <= h_big
+			top, current, hang = small, small, big
+			attach = 0
+			while height[current] > h_big:
+				attach = current
+				current = right[current]
+			left[middle] = current
+			right[middle] = big
+			right[attach] = middle
+		else:
+			# go down the left spine of big to a node of height <= h_small
+			top, current, hang = big, big, small
+			attach = 0
+			while height[current] > h_small:
+				attach = current
+				current = left[current]
+			right[middle] = current
+			left[middle] = small
+			left[attach] = middle
+		parent[middle] = attach
+		if current:
+			parent[current] = middle
+		if hang:
+			parent[hang] = middle
+		height[middle] = 1 + max(height[current], height[hang])
+		size[middle] = size[current] + size[hang] + 1
+		node = attach
+		while node:
+			size[node] += size[hang] + 1
+			node = parent[node]
+
+		saved_root = self.root
+		self.root = top
+		self._rebalance(attach)
+		top, self.root = self.root, saved_root
+		return top
+
+	"""joins self with item and another ArrayAVLTree
+
+	@type tree2: ArrayAVLTree
+	@pre: tree2 uses the same pool as self
+	@pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+	or the opposite way
+	"""
+	def join(self, tree2, key, val):
+		pool = self.pool
+		middle = pool.alloc(key, val)
+		if (self.root and pool.keys[self.root] < key) or (tree2.root and key < pool.keys[tree2.root]):
+			small, big = self, tree2
+		else:
+			small, big = tree2, self
+		self._max_node = big._max_node if big.root else middle
+		self.root = self._join_roots(small.root, middle, big.root)
+		tree2.root = 0
+		tree2._max_node = 0
+		return None
+
+	"""splits the dictionary at a given node
+
+	@type node: int
+	@pre: node is in self
+	@rtype: (ArrayAVLTree, ArrayAVLTree)
+	@returns: a tuple (left, right) of trees sharing self's pool, holding the keys smaller
+	and larger than key(node). self and node must not be used afterwards.
+	"""
+	def split(self, node):
+		pool = self.pool
+		left, right, parent = pool.left, pool.right, pool.parent
+		small, big = left[node], right[node]
+		if small:
+			parent[small] = 0
+		if big:
+			parent[big] = 0
+		current = parent[node]
+		prev = node
+		while current:
+			up = parent[current]
+			if right[current] == prev:
+				sub = left[current]
+				if sub:
+					parent[sub] = 0
+				small = self._join_roots(sub, current, small)
+			else:
+				sub = right[current]
+				if sub:
+					parent[sub] = 0
+				big = self._join_roots(big, current, sub)
+			prev = current
+			current = up
+		big_max = self._max_node if big else 0
+		pool.release(node)
+
+		left_tree = ArrayAVLTree(pool)
+		left_tree.root = small
+		left_tree.update_max()
+		right_tree = ArrayAVLTree(pool)
+		right_tree.root = big
+		right_tree._max_node = big_max
+		self.root = 0
+		self._max_node = 0
+		return left_tree, right_tree
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	@returns: a sorted list according to key of touples (key, value) representing the data structure
+	"""
+	def avl_to_array(self):
+		pool = self.pool
+		keys, values, left, right = pool.keys, pool.values, pool.left, pool.right
+		result = []
+		stack = []
+		node = self.root
+		while stack or node:
+			while node:
+				stack.append(node)
+				node = left[node]
+			node = stack.pop()
+			result.append((keys[node], values[node]))
+			node = right[node]
+		return result
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: int
+	@returns: the maximal node, None if the dictionary is empty
+	"""
+	def max_node(self):
+		return self._max_node if self.root else None
+
+	"""updates the max_node field of the ArrayAVLTree
+	@rtype: None
+	"""
+	def update_max(self):
+		right = self.pool.right
+		node = self.root
+		while node and right[node]:
+			node = right[node]
+		self._max_node = node
+		return None
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		return self.pool.size[self.root]
+
+	"""returns the root of the tree representing the dictionary
+
+	@rtype: int
+	@returns: the root, None if the dictionary is empty
+	"""
+	def get_root(self):
+		return self.root or None
@@ -0,0 +1,185 @@
+"""
+An asyncio front-end for AVLTree with write coalescing.
+
+Every put/remove is queued and handled by a single writer task. The writer
+collects whatever has queued up, keeps only the last write per key (keys
+the tree orders as equal, under its key function, count as one), and
+applies the batch in sorted order with the batched tree operations. Reads
+are answered straight from the tree, without yielding to the event loop,
+whenever no writes are queued; otherwise they wait for the queued writes
+so that a coroutine always reads its own writes.
+"""
+
+import asyncio
+
+from AVLTree import AVLTree
+
+
+"""
+A class serving an AVLTree to coroutines of one event loop.
+"""
+
+class AsyncAVLTree(object):
+
+	"""Constructor
+
+	@type tree: AVLTree
+	@param tree: the tree to serve, a new empty one if None. it must not be used directly afterwards.
+	a multimap tree is rejected: put sets the one value of a key, and writes to a key are coalesced.
+	a tree ordered by cmp is rejected too, since writes are merged by hashing their sort keys
+	@type max_batch: int
+	@param max_batch: the largest number of queued writes applied in one pass
+	@type delay: float
+	@param delay: seconds the writer waits for more writes before applying a batch
+	"""
+	def __init__(self, tree=None, max_batch=10000, delay=0.0):
+		if tree is not None and tree.multimap:
+			raise ValueError("AsyncAVLTree does not support multimap trees")
+		if tree is not None and tree.cmp is not None:
+			raise ValueError("AsyncAVLTree does not support trees ordered by cmp")
+		self.tree = tree if tree is not None else AVLTree()
+		self.max_batch = max_batch
+		self.delay = delay
+		self._pending = []  # (key, is_put, val, future) in arrival order
+		self._writer = None
+		self.batches = 0
+		self.writes = 0
+		self.coalesced = 0  # writes overridden by a later write to the same key in their batch
+
+	"""returns the value of key
+
+	@rtype: string
+	@returns: the value, default if key is not in the dictionary
+	"""
+	async def get(self, key, default=None):
+		if self._pending:
+			await self.flush()
+		node, edges = self.tree.search(key)
+		return default if node is None else node.value
+
+	"""returns the items with lo <= key <= hi
+
+	@rtype: list
+	"""
+	async def range(self, lo=None, hi=None):
+		if self._pending:
+			await self.flush()
+		return list(self.tree.items(lo, hi))
+
+	"""sets the value of key, adding it if needed. completes once the write is applied
+	"""
+	async def put(self, key, val):
+		await self._submit(key, True, val)
+
+	"""removes key from the dictionary. completes once the write is applied
+
+	@rtype: bool
+	@returns: True if key was in the dictionary
+	"""
+	async def remove(self, key):
+		return await self._submit(key, False, None)
+
+	"""waits until every write queued so far is applied. a write that failed is reported to
+	the coroutine that made it, not here
+	"""
+	async def flush(self):
+		while self._pending:
+			await asyncio.wait([self._pending[-1][3]])
+
+	"""queues a write and makes sure the writer task runs
+	@rtype: asyncio.Future
+	"""
+	def _submit(self, key, is_put, val):
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		self._pending.append((key, is_put, val, future))
+		if self._writer is None or self._writer.done():
+			self._writer = loop.create_task(self._write_loop())
+		return future
+
+	"""the single writer: applies queued writes in batches until the queue is empty
+	"""
+	async def _write_loop(self):
+		while self._pending:
+			# let the other coroutines queue their writes first
+			await asyncio.sleep(self.delay)
+			batch = self._pending[:self.max_batch]
+			del self._pending[:self.max_batch]
+			self.batches += 1
+			self.writes += len(batch)
+			try:
+				results = self._apply(batch)
+			except Exception:
+				# a failed batch left the tree unchanged: apply its writes one at a time,
+				# so that only the writes that fail on their own report an error
+				for write in batch:
+					self._apply_alone(write)
+				continue
+			for (key, is_put, val, future), result in zip(batch, results):
+				if not future.done():
+					future.set_result(result)
+
+	"""applies a single write, reporting its result or its error to its future
+	"""
+	def _apply_alone(self, write):
+		future = write[3]
+		try:
+			result, = self._apply([write])
+		except Exception as e:
+			if not future.done():
+				future.set_exception(e)
+		else:
+			if not future.done():
+				future.set_result(result)
+
+	"""applies a batch of writes to the tree in one sorted pass
+
+	@rtype: list
+	@returns: the result of every write in the batch: None for a put, and for a remove
+	whether the key was present at that point of the batch. a key that cannot be hashed or
+	compared raises before the tree is changed
+	"""
+	def _apply(self, batch):
+		tree = self.tree
+		# writes are merged by sort key: keys the tree orders as equal name the same item
+		skeys = tree._sort_keys([write[0] for write in batch])
+		first = {}
+		for skey, write in zip(skeys, batch):
+			first.setdefault(skey, write[0])
+		found = dict(zip(first, (node for node, edges in tree.search_many(list(first.values())))))
+
+		# replay the batch per item to get every result and the final state of every item.
+		# like a dict, a put on a present item keeps its key, a put that adds it brings its own
+		present = {skey: node is not None for skey, node in found.items()}
+		final = {}
+		results = []
+		coalesced = 0
+		for skey, (key, is_put, val, future) in zip(skeys, batch):
+			if skey in final:
+				coalesced += 1
+			if is_put and present[skey]:
+				key = final[skey][1] if skey in final else found[skey].key
+			final[skey] = (is_put, key, val)
+			results.append(None if is_put else present[skey])
+			present[skey] = is_put
+
+		inserts = []
+		deletes = []
+		for skey, (is_put, key, val) in final.items():
+			node = found[skey]
+			if not is_put:
+				if node is not None:
+					deletes.append(node.key)
+			elif node is not None:
+				node.key = key
+				node.value = val
+				if tree.augment is not None:
+					tree.update_sizes(node)
+			else:
+				inserts.append((key, val))
+		if deletes:
+			tree.delete_many(deletes)
+		if inserts:
+			tree.insert_many(inserts)
+		self.coalesced += coalesced
+		return results
@@ -0,0 +1,255 @@
+"""
+A thread-safe wrapper around AVLTree.
+
+Readers share a readers-writer lock; writers (and rotations inside them) run
+alone. Lookups can optionally run without any lock: a sequence counter is
+bumped before and after every write, and an optimistic search is accepted
+only if the counter was even and unchanged around it. Otherwise the search
+is repeated under the read lock.
+
+Reads under the shared lock must not write to the tree, so the wrapped tree
+cannot track a finger (AVLTree.search would move it) or collect AVLStats
+(every search updates the histograms): stats are disabled when the tree is
+wrapped and must not be enabled on it afterwards.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from AVLTree import AVLTree
+
+
+# an AVL tree of 2**64 nodes is lower than this, a longer walk saw a torn update
+MAX_OPTIMISTIC_EDGES = 96
+
+
+"""A writer-preferring readers-writer lock"""
+
+class RWLock(object):
+
+	def __init__(self):
+		self._cond = threading.Condition(threading.Lock())
+		self._readers = 0
+		self._writer = False
+		self._waiting_writers = 0
+
+	def acquire_read(self):
+		with self._cond:
+			while self._writer or self._waiting_writers:
+				self._cond.wait()
+			self._readers += 1
+
+	def release_read(self):
+		with self._cond:
+			self._readers -= 1
+			if self._readers == 0:
+				self._cond.notify_all()
+
+	def acquire_write(self):
+		with self._cond:
+			self._waiting_writers += 1
+			while self._writer or self._readers:
+				self._cond.wait()
+			self._waiting_writers -= 1
+			self._writer = True
+
+	def release_write(self):
+		with self._cond:
+			self._writer = False
+			self._cond.notify_all()
+
+	@contextmanager
+	def read_locked(self):
+		self.acquire_read()
+		try:
+			yield
+		finally:
+			self.release_read()
+
+	@contextmanager
+	def write_locked(self):
+		self.acquire_write()
+		try:
+			yield
+		finally:
+			self.release_write()
+
+
+"""
+A class wrapping an AVLTree for use from many threads.
+"""
+
+class ConcurrentAVLTree(object):
+
+	"""Constructor
+
+	@type tree: AVLTree
+	@param tree: the tree to wrap, a new empty one if None. it must not be used directly afterwards.
+	a tree with track_finger is rejected, and the stats of the tree are disabled
+	@type optimistic: bool
+	@param optimistic: if True, search runs without the lock and is validated by the sequence counter.
+	optimistic_hits and optimistic_retries are then counted without a lock, so they are approximate
+	"""
+	def __init__(self, tree=None, optimistic=False):
+		if tree is not None and tree.track_finger:
+			raise ValueError("ConcurrentAVLTree does not support track_finger trees")
+		self.tree = tree if tree is not None else AVLTree()
+		self.tree.disable_stats()
+		self.optimistic = optimistic
+		self.lock = RWLock()
+		self._seq = 0  # odd while a write is in progress
+		self.optimistic_hits = 0
+		self.optimistic_retries = 0
+
+	"""runs a write under the write lock, with the sequence counter odd meanwhile
+	"""
+	@contextmanager
+	def _writing(self):
+		self.lock.acquire_write()
+		self._seq += 1
+		try:
+			yield
+		finally:
+			self._seq += 1
+			self.lock.release_write()
+
+	"""searches for a node in the dictionary corresponding to the key
+
+	@rtype: (AVLNode,int)
+	@returns: a tuple (x,e) as in AVLTree.search
+	"""
+	def search(self, key):
+		if self.optimistic:
+			result = self._optimistic_search(key)
+			if result is not None:
+				self.optimistic_hits += 1
+				return result
+			self.optimistic_retries += 1
+		with self.lock.read_locked():
+			return self.tree.search(key)
+
+	"""searches without taking the lock
+
+	@rtype: (AVLNode,int)
+	@returns: the search result, None if a concurrent write may have disturbed it
+	"""
+	def _optimistic_search(self, key):
+		seq = self._seq
+		if seq & 1:
+			return None
+		try:
+			key = self.tree._sort_key(key)
+			node = self.tree.root
+			edges = 1
+			while node.is_real_node():
+				if key == node.skey:
+					break
+				node = node.left if key < node.skey else node.right
+				edges += 1
+				if edges > MAX_OPTIMISTIC_EDGES:
+					return None
+		except AttributeError:
+			# a half-linked node was reached
+			return None
+		if self._seq != seq:
+			return None
+		return (node if node.is_real_node() else None), edges
+
+	"""searches for a node in the dictionary corresponding to the key, starting at the max
+
+	@rtype: (AVLNode,int)
+	"""
+	def finger_search(self, key):
+		with self.lock.read_locked():
+			return self.tree.finger_search(key)
+
+	"""inserts a new item, see AVLTree.insert
+
+	@rtype: (AVLNode,int,int)
+	"""
+	def insert(self, key, val):
+		with self._writing():
+			return self.tree.insert(key, val)
+
+	"""inserts a new item starting at the max, see AVLTree.finger_insert
+
+	@rtype: (AVLNode,int,int)
+	"""
+	def finger_insert(self, key, val):
+		with self._writing():
+			return self.tree.finger_insert(key, val)
+
+	"""deletes node from the dictionary
+
+	@pre: node is a real pointer to a node in the tree
+	"""
+	def delete(self, node):
+		with self._writing():
+			return self.tree.delete(node)
+
+	"""deletes the node of key, if there is one
+
+	@rtype: bool
+	@returns: True if key was found and deleted
+	"""
+	def delete_key(self, key):
+		with self._writing():
+			node, edges = self.tree.search(key)
+			if node is None:
+				return False
+			self.tree.delete(node)
+			return True
+
+	"""applies a batch of writes atomically: readers see either none or all of them
+
+	@type ops: list
+	@param ops: tuples ('insert', key, val) or ('delete', key)
+	@rtype: list
+	@returns: the result of every operation, as returned by insert and delete_key
+	"""
+	def apply_batch(self, ops):
+		for op in ops:
+			if op[0] not in ('insert', 'delete'):
+				raise ValueError("unknown operation %r" % (op[0],))
+		results = []
+		with self._writing():
+			for op in ops:
+				if op[0] == 'insert':
+					results.append(self.tree.insert(op[1], op[2]))
+				else:
+					node, edges = self.tree.search(op[1])
+					if node is not None:
+						self.tree.delete(node)
+					results.append(node is not None)
+		return results
+
+	"""returns the items with lo <= key <= hi, read under one lock
+
+	@rtype: list
+	"""
+	def items(self, lo=None, hi=None):
+		with self.lock.read_locked():
+			return list(self.tree.items(lo, hi))
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	"""
+	def avl_to_array(self):
+		with self.lock.read_locked():
+			return self.tree.avl_to_array()
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: AVLNode
+	"""
+	def max_node(self):
+		with self.lock.read_locked():
+			return self.tree.max_node()
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		return self.tree.size()
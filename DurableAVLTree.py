@@ -0,0 +1,392 @@
+"""
+A crash-safe dictionary: a PersistentAVLTree in memory, with an append-only
+operation log and snapshots on disk.
+
+The directory holds
+
+	log.<generation>        groups of operations, appended in order
+	snapshot.<generation>   the sorted items, covering every log older than <generation>
+
+Both are sequences of frames: a header (payload length, crc32 of the payload)
+followed by a pickled list. A torn or corrupt tail is detected on replay and
+dropped, together with the operations in it, which were never acknowledged.
+
+Updates are applied to the tree and queued. A group commit writes the queued
+operations as one frame, with one write and, depending on the sync policy, one
+fsync. snapshot() starts a new log generation and writes the current version of
+the tree from a background thread while updates go on: the version is frozen,
+since the tree is persistent. Once the snapshot is in place, the logs and the
+snapshots it covers are removed. On startup the newest snapshot is read, the
+later logs are folded into it and the tree is built by one bulk load.
+"""
+
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from PersistentAVLTree import PersistentAVLTree, PersistentNode
+
+
+FRAME = struct.Struct('<II')  # payload length, crc32 of the payload
+SYNC_POLICIES = ('always', 'interval', 'never')
+SNAPSHOT_CHUNK = 4096  # items per snapshot frame
+
+# operations in the log
+OP_INSERT = 0
+OP_DELETE = 1
+
+_DELETED = object()  # marks a key deleted by the log while replaying
+
+
+def _frame(obj):
+	payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+	return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+"""reads the frames of a log or snapshot file, stopping at the first torn or corrupt one
+
+@type path: str
+@rtype: (list, int)
+@returns: the unpickled frames and the length of the valid prefix of the file
+"""
+def read_frames(path):
+	with open(path, 'rb') as f:
+		data = f.read()
+	frames = []
+	end = 0
+	while end + FRAME.size <= len(data):
+		length, crc = FRAME.unpack_from(data, end)
+		start = end + FRAME.size
+		payload = data[start:start + length]
+		if len(payload) < length or zlib.crc32(payload) != crc:
+			break
+		frames.append(pickle.loads(payload))
+		end = start + length
+	return frames, end
+
+def _sync_directory(directory):
+	# makes created, renamed and removed files durable, where directories can be opened
+	if not hasattr(os, 'O_DIRECTORY'):
+		return None
+	fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+	return None
+
+"""merges the sorted items of a snapshot with the changes folded from the logs
+
+@type pairs: list
+@param pairs: (key, value) tuples in increasing order of key
+@type changes: dict
+@param changes: the last value logged for every key, _DELETED for a deleted key
+@rtype: list
+@returns: the merged (key, value) tuples in increasing order of key
+"""
+def _merge(pairs, changes):
+	if not changes:
+		return pairs
+	merged = []
+	i = 0
+	for key in sorted(changes):
+		while i < len(pairs) and pairs[i][0] < key:
+			merged.append(pairs[i])
+			i += 1
+		if i < len(pairs) and pairs[i][0] == key:
+			i += 1
+		val = changes[key]
+		if val is not _DELETED:
+			merged.append((key, val))
+	merged.extend(pairs[i:])
+	return merged
+
+
+"""
+A dictionary that survives crashes, logging every update and compacting the log with snapshots.
+Keys must be hashable, and keys and values must be picklable.
+"""
+
+class DurableAVLTree(object):
+
+	"""Constructor, recovers the dictionary stored in directory (created if missing)
+
+	@type directory: str
+	@type sync: str
+	@param sync: when group commits are fsynced: 'always', 'interval' (the first group commit once
+	sync_interval seconds have passed since the last fsync) or 'never' (left to the operating
+	system; close and snapshot still fsync)
+	@type group_size: int
+	@param group_size: the number of queued operations that triggers a group commit. an operation
+	is durable once its group is committed and synced; commit() forces it
+	@type sync_interval: float
+	@param sync_interval: seconds between fsyncs with sync='interval'
+	@type snapshot_every: int
+	@param snapshot_every: if given, a background snapshot is started after this many logged operations
+	"""
+	def __init__(self, directory, sync='always', group_size=1, sync_interval=1.0, snapshot_every=None):
+		if sync not in SYNC_POLICIES:
+			raise ValueError("sync must be one of %s" % (', '.join(SYNC_POLICIES),))
+		if group_size < 1:
+			raise ValueError("group_size must be at least 1")
+		self.directory = directory
+		self.sync = sync
+		self.group_size = group_size
+		self.sync_interval = sync_interval
+		self.snapshot_every = snapshot_every
+		self._pending = []
+		self._last_sync = time.monotonic()
+		self._logged = 0  # operations logged since the last snapshot started
+		self._snapshot_thread = None
+		self._snapshot_error = None
+		self.commits = 0
+		self.syncs = 0
+		self.snapshots = 0
+		os.makedirs(directory, exist_ok=True)
+		self.tree, self._generation, self.replayed = self._recover()
+		self._log = open(self._path('log', self._generation), 'ab', buffering=0)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+		return False
+
+	"""searches for a node in the dictionary corresponding to the key
+
+	@rtype: (PersistentNode,int)
+	@returns: a tuple (x,e) as in PersistentAVLTree.search
+	"""
+	def search(self, key):
+		return self.tree.search(key)
+
+	"""inserts an item into the dictionary, replacing the value if key is present, and logs it
+
+	@rtype: None
+	"""
+	def insert(self, key, val):
+		self.tree = self.tree.insert(key, val)
+		self._queue((OP_INSERT, key, val))
+		return None
+
+	"""deletes key from the dictionary and logs it
+
+	@type key: int
+	@param key: the key to remove (a node returned by search is accepted too)
+	@rtype: None
+	"""
+	def delete(self, key):
+		if isinstance(key, PersistentNode):
+			key = key.key
+		self.tree = self.tree.delete(key)
+		self._queue((OP_DELETE, key))
+		return None
+
+	"""writes the queued operations to the log as one group
+
+	@type sync: bool
+	@param sync: if True, fsync the log whatever the sync policy
+	@rtype: int
+	@returns: the number of operations written
+	"""
+	def commit(self, sync=False):
+		count = len(self._pending)
+		if count:
+			self._log.write(_frame(self._pending))
+			self._pending = []
+			self.commits += 1
+		if sync or (count and self.sync == 'always') or (
+				self.sync == 'interval' and time.monotonic() - self._last_sync >= self.sync_interval):
+			os.fsync(self._log.fileno())
+			self._last_sync = time.monotonic()
+			self.syncs += 1
+		return count
+
+	"""starts a snapshot of the current version in a background thread. the log moves to a new
+	generation, and the logs before it are removed once the snapshot is written.
+	a snapshot still running is waited for first
+
+	@type wait: bool
+	@param wait: if True, return only after the snapshot is written
+	@rtype: None
+	"""
+	def snapshot(self, wait=False):
+		self.wait_snapshot()
+		self.commit(sync=True)
+		self._log.close()
+		self._generation += 1
+		self._log = open(self._path('log', self._generation), 'ab', buffering=0)
+		_sync_directory(self.directory)
+		self._logged = 0
+		self._snapshot_thread = threading.Thread(target=self._write_snapshot,
+			args=(self.tree.snapshot(), self._generation), daemon=True)
+		self._snapshot_thread.start()
+		if wait:
+			self.wait_snapshot()
+		return None
+
+	"""waits for the running snapshot, if any, and raises the error it failed with
+
+	@rtype: None
+	"""
+	def wait_snapshot(self):
+		thread = self._snapshot_thread
+		if thread is not None:
+			thread.join()
+			self._snapshot_thread = None
+		error, self._snapshot_error = self._snapshot_error, None
+		if error is not None:
+			raise error
+		return None
+
+	"""commits and syncs the queued operations, waits for a running snapshot and closes the log
+
+	@rtype: None
+	"""
+	def close(self):
+		if self._log.closed:
+			return None
+		try:
+			self.commit(sync=True)
+			self.wait_snapshot()
+		finally:
+			self._log.close()
+		return None
+
+	"""returns the current version, which later updates do not change
+
+	@rtype: PersistentAVLTree
+	"""
+	def version(self):
+		return self.tree.snapshot()
+
+	"""lazily iterates over the items of the dictionary in increasing order of key
+
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi
+	"""
+	def items(self, lo=None, hi=None):
+		return self.tree.items(lo, hi)
+
+	def __iter__(self):
+		return iter(self.tree)
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	"""
+	def avl_to_array(self):
+		return self.tree.avl_to_array()
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: PersistentNode
+	"""
+	def max_node(self):
+		return self.tree.max_node()
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		return self.tree.size()
+
+	"""queues an operation, committing the group when it is full
+	@rtype: None
+	"""
+	def _queue(self, op):
+		pending = self._pending
+		pending.append(op)
+		if len(pending) >= self.group_size:
+			self.commit()
+		self._logged += 1
+		if self.snapshot_every is not None and self._logged >= self.snapshot_every:
+			thread = self._snapshot_thread
+			if thread is None or not thread.is_alive():
+				self.snapshot()
+		return None
+
+	"""returns the path of a log or snapshot file
+	@rtype: str
+	"""
+	def _path(self, kind, generation):
+		return os.path.join(self.directory, '%s.%d' % (kind, generation))
+
+	"""lists the generations of the log or snapshot files in the directory
+	@rtype: list
+	"""
+	def _generations(self, kind):
+		generations = []
+		for name in os.listdir(self.directory):
+			prefix, dot, suffix = name.partition('.')
+			if prefix == kind and suffix.isdigit():
+				generations.append(int(suffix))
+		return sorted(generations)
+
+	"""rebuilds the dictionary from the newest snapshot and the logs after it, in one bulk load.
+	the torn tail of the last log is cut off, so new groups follow the last valid one
+	@rtype: (PersistentAVLTree, int, int)
+	@returns: the tree, the generation of the log to append to and the number of replayed operations
+	"""
+	def _recover(self):
+		for name in os.listdir(self.directory):
+			if name.endswith('.tmp'):
+				os.remove(os.path.join(self.directory, name))
+		snapshots = self._generations('snapshot')
+		base = snapshots[-1] if snapshots else 0
+		pairs = []
+		if snapshots:
+			frames, end = read_frames(self._path('snapshot', base))
+			for chunk in frames:
+				pairs.extend(chunk)
+
+		changes = {}
+		replayed = 0
+		logs = [generation for generation in self._generations('log') if generation >= base]
+		for generation in logs:
+			path = self._path('log', generation)
+			frames, end = read_frames(path)
+			for group in frames:
+				for op in group:
+					changes[op[1]] = op[2] if op[0] == OP_INSERT else _DELETED
+				replayed += len(group)
+			if generation == logs[-1] and end < os.path.getsize(path):
+				with open(path, 'r+b') as f:
+					f.truncate(end)
+					os.fsync(f.fileno())
+		generation = logs[-1] if logs else base
+		return PersistentAVLTree.from_sorted(_merge(pairs, changes)), generation, replayed
+
+	"""writes the items of a frozen version to the snapshot of generation, then removes the
+	files it covers. runs in the snapshot thread
+	@rtype: None
+	"""
+	def _write_snapshot(self, version, generation):
+		try:
+			path = self._path('snapshot', generation)
+			temp_path = path + '.tmp'
+			with open(temp_path, 'wb') as f:
+				chunk = []
+				for item in version.items():
+					chunk.append(item)
+					if len(chunk) == SNAPSHOT_CHUNK:
+						f.write(_frame(chunk))
+						chunk = []
+				if chunk:
+					f.write(_frame(chunk))
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(temp_path, path)
+			_sync_directory(self.directory)
+			for kind in ('log', 'snapshot'):
+				for old in self._generations(kind):
+					if old < generation:
+						os.remove(self._path(kind, old))
+			self.snapshots += 1
+		except Exception as error:
+			self._snapshot_error = error
+		return None
@@ -0,0 +1,375 @@
+"""
+A fat-node backend with the interface of AVLTree.
+
+Items are packed into chunks of up to chunk_size sorted keys, kept in two
+parallel lists. The chunks are the values of an ordinary AVLTree, the spine,
+keyed by the first key of every chunk. A lookup walks the spine to the last
+chunk starting at or before the key and finishes with a bisect inside the
+chunk, so a descent touches about log2(n / chunk_size) node objects instead
+of log2(n). Edge counts are reported for the spine walk, which is the number
+of node objects visited.
+
+Every spine node also keeps the number of items in its subtree (an
+augmentation), so size is O(1) and split and join stay O(log n).
+Nodes returned by search and friends are detached AVLNodes carrying the key
+and the value, as in MappedAVLTree; delete and split look them up by key.
+"""
+
+from array import array
+from bisect import bisect_left
+import operator
+
+from AVLTree import AVLNode, AVLTree, Augmentation, VIRTUAL_NODE
+
+
+CHUNK_SIZE = 128
+BULK_FILL = 0.75  # from_sorted leaves a quarter of every chunk free, so inserts do not split at once
+
+
+"""A run of consecutive items, the value of one spine node"""
+
+class _Chunk(object):
+	__slots__ = ('keys', 'values')
+
+	def __init__(self, keys, values):
+		self.keys = keys
+		self.values = values
+
+
+def _chunk_length(key, chunk):
+	return len(chunk.keys)
+
+# the number of items in the chunks of a spine subtree
+ITEM_COUNT = Augmentation(_chunk_length, operator.add, 0)
+
+
+"""
+A class implementing a dictionary on top of an AVLTree of sorted chunks.
+"""
+
+class FatAVLTree(object):
+
+	"""Constructor
+
+	@type chunk_size: int
+	@param chunk_size: the largest number of items in a chunk, a full chunk is split in halves
+	@type key_type: str
+	@param key_type: an array typecode (for example 'q') to keep the keys of every chunk in a
+	compact typed buffer, or None to keep arbitrary keys in lists
+	"""
+	def __init__(self, chunk_size=CHUNK_SIZE, key_type=None):
+		if chunk_size < 2:
+			raise ValueError("chunk_size must be at least 2")
+		self.chunk_size = chunk_size
+		self.key_type = key_type
+		self.spine = AVLTree(augment=ITEM_COUNT)
+
+	"""builds a tree from (key, value) pairs sorted by key, in O(n)
+
+	@type pairs: iterable
+	@pre: keys appear in strictly increasing order
+	@param options: chunk_size and key_type, as for the constructor
+	@rtype: FatAVLTree
+	"""
+	@classmethod
+	def from_sorted(cls, pairs, **options):
+		tree = cls(**options)
+		pairs = pairs if isinstance(pairs, list) else list(pairs)
+		fill = max(int(tree.chunk_size * BULK_FILL), 1)
+		chunks = []
+		for i in range(0, len(pairs), fill):
+			run = pairs[i:i + fill]
+			chunk = tree._chunk([key for key, val in run], [val for key, val in run])
+			chunks.append((chunk.keys[0], chunk))
+		tree.spine = AVLTree.from_sorted(chunks, augment=ITEM_COUNT)
+		return tree
+
+	"""searches for a node in the dictionary corresponding to the key (starting at the root)
+
+	@rtype: (AVLNode,int)
+	@returns: a tuple (x,e) where x is a detached node holding key and its value (None if not found),
+	and e is the number of edges on the spine path to the chunk of key +1
+	"""
+	def search(self, key):
+		# the walk of _locate and the lookup of _item, inlined
+		virtual = VIRTUAL_NODE
+		node = self.spine.root
+		found = None
+		edges = 1
+		while node is not virtual:
+			node_key = node.key
+			if key < node_key:
+				node = node.left
+			elif key == node_key:
+				chunk = node.value
+				return AVLNode(key, chunk.values[0]), edges
+			else:
+				found = node
+				node = node.right
+			edges += 1
+		if found is None:
+			return None, edges
+		chunk = found.value
+		keys = chunk.keys
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key:
+			return AVLNode(key, chunk.values[i]), edges
+		return None, edges
+
+	"""searches for a node in the dictionary corresponding to the key, starting at the chunk of the max
+
+	@rtype: (AVLNode,int)
+	@returns: a tuple (x,e) as in search, e counting the spine edges walked up and down +1
+	"""
+	def finger_search(self, key):
+		virtual = VIRTUAL_NODE
+		finger = self.spine._max_node
+		if finger is virtual:
+			return None, 1
+		edges = 1
+		# going up the spine until we find a chunk starting at or before key, which the
+		# walk down then passes first
+		parent = finger.parent
+		while parent is not virtual and key < finger.key:
+			finger = parent
+			parent = finger.parent
+			edges += 1
+		node, edges = self._locate(finger, key, None, edges)
+		return self._item(node, key), edges
+
+	"""inserts a new item into the dictionary
+
+	@pre: key currently does not appear in the dictionary
+	@rtype: (AVLNode,int,int)
+	@returns: a 3-tuple (x,e,h) where x is a detached node holding the new item, e is the number of
+	edges on the spine path to its chunk, and h is the number of PROMOTE cases in the spine
+	(0 unless the chunk was split)
+	"""
+	def insert(self, key, val):
+		spine = self.spine
+		node, edges = self._locate(spine.root, key, None, 0)
+		if node is None:
+			if spine.root is VIRTUAL_NODE:
+				new_node, edges, height_changes = spine.insert(key, self._chunk([key], [val]))
+				return AVLNode(key, val), edges, height_changes
+			# key is below every chunk: it becomes the first key of the first chunk
+			node = spine._min_node
+			node.key = node.skey = key
+		chunk = node.value
+		i = bisect_left(chunk.keys, key)
+		chunk.keys.insert(i, key)
+		chunk.values.insert(i, val)
+		self._adjust(node, 1)
+		height_changes = 0
+		if len(chunk.keys) > self.chunk_size:
+			height_changes = self._split_chunk(node)
+		return AVLNode(key, val), edges, height_changes
+
+	"""deletes the item of node from the dictionary
+
+	@type node: AVLNode
+	@pre: the key of node is in self
+	"""
+	def delete(self, node):
+		if node is None:
+			return None
+		key = node.key
+		node, edges = self._locate(self.spine.root, key, None, 0)
+		if node is None:
+			return None
+		chunk = node.value
+		i = bisect_left(chunk.keys, key)
+		if i == len(chunk.keys) or chunk.keys[i] != key:
+			return None
+		del chunk.keys[i]
+		del chunk.values[i]
+		if not chunk.keys:
+			self.spine.delete(node)
+			return None
+		self._adjust(node, -1)
+		if i == 0:
+			# the next key is still below the first key of the next chunk
+			node.key = node.skey = chunk.keys[0]
+		if len(chunk.keys) <= self.chunk_size // 4:
+			self._absorb(self.spine, node)
+		return None
+
+	"""joins self with item and another FatAVLTree
+
+	@type tree2: FatAVLTree
+	@pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+	or the opposite way
+	"""
+	def join(self, tree2, key, val):
+		spine = self.spine
+		spine.join(tree2.spine, key, self._chunk([key], [val]))
+		tree2.spine = AVLTree(augment=ITEM_COUNT)
+		# the chunk of the separating item is merged into a neighbour when there is room
+		node, edges = self._locate(spine.root, key, None, 0)
+		self._absorb(spine, node)
+		return None
+
+	"""splits the dictionary at a given node
+
+	@type node: AVLNode
+	@pre: the key of node is in self
+	@rtype: (FatAVLTree, FatAVLTree)
+	@returns: a tuple (left, right) holding the keys smaller and larger than node.key.
+	self is left empty.
+	"""
+	def split(self, node):
+		key = node.key
+		node, edges = self._locate(self.spine.root, key, None, 0)
+		left, node, right = self.spine.split_key(node.key)
+		chunk = node.value
+		i = bisect_left(chunk.keys, key)
+		if i > 0:
+			left.join(AVLTree(augment=ITEM_COUNT), chunk.keys[0], _Chunk(chunk.keys[:i], chunk.values[:i]))
+			self._absorb(left, left._max_node)
+		if i + 1 < len(chunk.keys):
+			right.join(AVLTree(augment=ITEM_COUNT), chunk.keys[i + 1], _Chunk(chunk.keys[i + 1:], chunk.values[i + 1:]))
+			self._absorb(right, right._min_node)
+		left_tree = FatAVLTree(self.chunk_size, self.key_type)
+		left_tree.spine = left
+		right_tree = FatAVLTree(self.chunk_size, self.key_type)
+		right_tree.spine = right
+		self.spine = AVLTree(augment=ITEM_COUNT)
+		return left_tree, right_tree
+
+	"""lazily iterates over the items of the dictionary in increasing order of key
+
+	@rtype: generator
+	@returns: (key, value) tuples
+	"""
+	def items(self):
+		for first, chunk in self.spine.items():
+			yield from zip(chunk.keys, chunk.values)
+
+	def __iter__(self):
+		for first, chunk in self.spine.items():
+			yield from chunk.keys
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	@returns: a sorted list according to key of touples (key, value) representing the data structure
+	"""
+	def avl_to_array(self):
+		result = []
+		for first, chunk in self.spine.items():
+			result.extend(zip(chunk.keys, chunk.values))
+		return result
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: AVLNode
+	@returns: a detached node holding the maximal item, None if the dictionary is empty
+	"""
+	def max_node(self):
+		node = self.spine.max_node()
+		if node is None:
+			return None
+		return AVLNode(node.value.keys[-1], node.value.values[-1])
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		root = self.spine.root
+		return root.agg if root is not VIRTUAL_NODE else 0
+
+	"""returns the number of spine nodes, one per chunk
+
+	@rtype: int
+	"""
+	def chunk_count(self):
+		return self.spine.size()
+
+	"""walks down from node to the spine node of the last chunk starting at or before key
+
+	@type found: AVLNode
+	@param found: the best spine node known before the walk, None if there is none
+	@rtype: (AVLNode,int)
+	@returns: the spine node (None if every chunk starts after key) and edges plus the edges walked
+	"""
+	def _locate(self, node, key, found, edges):
+		virtual = VIRTUAL_NODE
+		while node is not virtual:
+			node_key = node.key
+			if key < node_key:
+				node = node.left
+			else:
+				found = node
+				if key == node_key:
+					break
+				node = node.right
+			edges += 1
+		return found, edges
+
+	"""returns a new chunk holding keys and values
+	@rtype: _Chunk
+	"""
+	def _chunk(self, keys, values):
+		if self.key_type is not None:
+			keys = array(self.key_type, keys)
+		return _Chunk(keys, values)
+
+	"""returns a detached node for the item of key in the chunk of node, None if it is missing
+	@rtype: AVLNode
+	"""
+	def _item(self, node, key):
+		if node is None:
+			return None
+		chunk = node.value
+		i = bisect_left(chunk.keys, key)
+		if i < len(chunk.keys) and chunk.keys[i] == key:
+			return AVLNode(key, chunk.values[i])
+		return None
+
+	"""adds delta to the item counts of node and its ancestors, after its chunk changed size
+	@rtype: None
+	"""
+	def _adjust(self, node, delta):
+		virtual = VIRTUAL_NODE
+		while node is not virtual:
+			node.agg += delta
+			node = node.parent
+		return None
+
+	"""moves the upper half of the full chunk of node into a new spine node
+	@rtype: int
+	@returns: the number of PROMOTE cases in the spine
+	"""
+	def _split_chunk(self, node):
+		chunk = node.value
+		half = len(chunk.keys) // 2
+		upper = _Chunk(chunk.keys[half:], chunk.values[half:])
+		del chunk.keys[half:]
+		del chunk.values[half:]
+		self._adjust(node, -len(upper.keys))
+		new_node, edges, height_changes = self.spine.insert(upper.keys[0], upper)
+		return height_changes
+
+	"""merges the chunk of node into its predecessor or successor chunk, if one has room for it
+	@type spine: AVLTree
+	@pre: node is a spine node of spine
+	@rtype: None
+	"""
+	def _absorb(self, spine, node):
+		chunk = node.value
+		limit = self.chunk_size - len(chunk.keys)
+		prev = spine.predecessor(node)
+		if prev is not None and len(prev.value.keys) <= limit:
+			prev.value.keys.extend(chunk.keys)
+			prev.value.values.extend(chunk.values)
+			self._adjust(prev, len(chunk.keys))
+			spine.delete(node)
+			return None
+		after = spine.successor(node)
+		if after is not None and len(after.value.keys) <= limit:
+			chunk.keys.extend(after.value.keys)
+			chunk.values.extend(after.value.values)
+			self._adjust(node, len(after.value.keys))
+			spine.delete(after)
+		return None
@@ -0,0 +1,150 @@
+"""
+An interval tree on top of an augmented AVLTree.
+
+Intervals are closed, [start, end], and are kept in an AVLTree keyed by
+(start, end). Every node also keeps the largest end in its subtree, so a
+subtree whose largest end is before the query can be skipped as a whole and
+an overlap query costs O(log n) plus O(log n) per reported interval.
+"""
+
+from AVLTree import AVLTree, Augmentation
+
+
+def _interval_end(key, val):
+	return key[1]
+
+# the largest end point of the intervals of a subtree
+MAX_END = Augmentation(_interval_end, max)
+
+
+"""
+A class implementing a dictionary from closed intervals to values.
+"""
+
+class IntervalTree(object):
+
+	"""Constructor
+
+	@type intervals: iterable
+	@param intervals: (start, end, value) triples to start with, loaded in O(n log n)
+	@pre: the intervals are distinct
+	"""
+	def __init__(self, intervals=()):
+		pairs = [(_checked(start, end), val) for start, end, val in intervals]
+		self.tree = AVLTree.from_iterable(pairs, augment=MAX_END)
+
+	"""adds the interval [start, end], replacing its value if it is already present
+
+	@pre: start <= end
+	@rtype: None
+	"""
+	def insert(self, start, end, val):
+		key = _checked(start, end)
+		node, edges = self.tree.search(key)
+		if node is not None:
+			node.value = val
+		else:
+			self.tree.insert(key, val)
+		return None
+
+	"""removes the interval [start, end]
+
+	@rtype: bool
+	@returns: True if the interval was found and removed
+	"""
+	def remove(self, start, end):
+		node, edges = self.tree.search((start, end))
+		if node is None:
+			return False
+		self.tree.delete(node)
+		return True
+
+	"""returns the value of the interval [start, end]
+
+	@returns: the value, default if the interval is not in the dictionary
+	"""
+	def get(self, start, end, default=None):
+		node, edges = self.tree.search((start, end))
+		return default if node is None else node.value
+
+	"""lazily iterates over the intervals that overlap [lo, hi], ordered by start
+
+	@type hi: int
+	@param hi: end of the query, None for the single point lo
+	@rtype: generator
+	@returns: (start, end, value) triples with start <= hi and lo <= end
+	"""
+	def overlapping(self, lo, hi=None):
+		if hi is None:
+			hi = lo
+		virtual = self.tree.virtual_node
+		stack = []
+		node = self.tree.root
+		while True:
+			# a subtree ending before lo holds no overlapping interval
+			while node is not virtual and not node.agg < lo:
+				stack.append(node)
+				node = node.left
+			if not stack:
+				return
+			node = stack.pop()
+			start, end = node.key
+			if hi < start:
+				# every interval left to visit starts after hi
+				return
+			if not end < lo:
+				yield start, end, node.value
+			node = node.right
+
+	"""returns the intervals that contain the point t
+
+	@rtype: list
+	@returns: (start, end, value) triples ordered by start
+	"""
+	def stabbing(self, t):
+		return list(self.overlapping(t))
+
+	"""returns whether any interval overlaps [lo, hi], in O(log n)
+
+	@rtype: bool
+	"""
+	def overlaps(self, lo, hi=None):
+		for interval in self.overlapping(lo, hi):
+			return True
+		return False
+
+	"""returns the largest end point of all the intervals
+
+	@returns: the end point, None if there are no intervals
+	"""
+	def max_end(self):
+		return self.tree.range_aggregate()
+
+	"""lazily iterates over the intervals ordered by (start, end)
+
+	@rtype: generator
+	@returns: (start, end, value) triples
+	"""
+	def items(self):
+		for (start, end), val in self.tree.items():
+			yield start, end, val
+
+	def __iter__(self):
+		for (start, end), val in self.tree.items():
+			yield start, end
+
+	def __len__(self):
+		return self.tree.size()
+
+	"""returns the number of intervals
+
+	@rtype: int
+	"""
+	def size(self):
+		return self.tree.size()
+
+
+def _checked(start, end):
+	if end < start:
+		raise ValueError("interval end %r is before its start %r" % (end, start))
+	return (start, end)
@@ -0,0 +1,295 @@
+"""
+A compact on-disk format for AVLTree and a read-only tree served straight from a memory map.
+
+The file stores the items in key order:
+
+	header   magic, format version, number of items        (struct HEADER)
+	keys     count signed 64-bit keys                        (array 'q')
+	offsets  count + 1 offsets into the value area           (array 'Q')
+	values   one tag byte followed by the encoded value, per item
+
+The keys are the in-order layout of the perfectly balanced tree that
+AVLTree.from_sorted builds, so a MappedAVLTree searches it with the same
+descent (and reports the same edge counts) without creating any nodes.
+Every process that maps the same file shares the pages with zero copies.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+from AVLTree import AVLNode, AVLTree
+
+
+MAGIC = b'AVLT'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+
+# value encodings
+TAG_NONE = 0
+TAG_STR = 1
+TAG_BYTES = 2
+TAG_PICKLE = 3
+
+
+"""writes the items of tree to path in the binary format, replacing the file atomically
+
+@type tree: AVLTree
+@pre: all keys are ints that fit in 64 bits
+@param tree: a tree in the natural order of its keys, holding one value per key. the file is
+searched by raw key and loaded as a plain AVLTree, so a ValueError is raised for a tree with a
+key or cmp function and for a multimap
+@type path: str
+@rtype: None
+"""
+def save_tree(tree, path):
+	if tree.sort_key is not None:
+		raise ValueError("only trees ordered by their keys can be saved, not by a key or cmp function")
+	if tree.multimap:
+		raise ValueError("multimap trees cannot be saved")
+	keys = array('q')
+	offsets = array('Q', [0])
+	blob = bytearray()
+	for key, val in tree.items():
+		keys.append(key)
+		blob += _encode(val)
+		offsets.append(len(blob))
+	if sys.byteorder != 'little':
+		keys.byteswap()
+		offsets.byteswap()
+
+	temp_path = path + '.tmp'
+	with open(temp_path, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+		keys.tofile(f)
+		offsets.tofile(f)
+		f.write(blob)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(temp_path, path)
+	return None
+
+"""reads a file written by save_tree
+
+@type path: str
+@type use_mmap: bool
+@param use_mmap: if True, return a MappedAVLTree over the file, otherwise build an AVLTree
+@rtype: MappedAVLTree or AVLTree
+"""
+def load_tree(path, use_mmap=True):
+	mapped = MappedAVLTree(path)
+	if use_mmap:
+		return mapped
+	try:
+		return AVLTree.from_sorted(list(mapped.items()))
+	finally:
+		mapped.close()
+
+def _encode(val):
+	if val is None:
+		return bytes((TAG_NONE,))
+	if isinstance(val, str):
+		return bytes((TAG_STR,)) + val.encode('utf-8')
+	if isinstance(val, (bytes, bytearray)):
+		return bytes((TAG_BYTES,)) + val
+	return bytes((TAG_PICKLE,)) + pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+
+def _decode(data):
+	tag = data[0]
+	if tag == TAG_NONE:
+		return None
+	if tag == TAG_STR:
+		return str(data[1:], 'utf-8')
+	if tag == TAG_BYTES:
+		return bytes(data[1:])
+	return pickle.loads(data[1:])
+
+
+"""
+A read-only dictionary backed by a memory-mapped file written by save_tree.
+Keys are read from the map on demand; nodes are only created for results.
+"""
+
+class MappedAVLTree(object):
+
+	"""Constructor
+
+	@type path: str
+	@param path: a file written by save_tree (or AVLTree.save)
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, count = HEADER.unpack_from(self._map, 0)
+		if magic != MAGIC or version != VERSION:
+			self._map.close()
+			raise ValueError("%s is not an AVLTree file" % path)
+		if sys.byteorder != 'little':
+			self._map.close()
+			raise ValueError("memory-mapped loading needs a little-endian machine")
+
+		self._count = count
+		view = memoryview(self._map)
+		keys_start = HEADER.size
+		offsets_start = keys_start + 8 * count
+		self._values_start = offsets_start + 8 * (count + 1)
+		self._keys = view[keys_start:offsets_start].cast('q')
+		self._offsets = view[offsets_start:self._values_start].cast('Q')
+		self._view = view
+
+	"""releases the memory map, nodes returned earlier stay valid
+	"""
+	def close(self):
+		if self._map is None:
+			return None
+		self._keys.release()
+		self._offsets.release()
+		self._view.release()
+		self._map.close()
+		self._map = None
+		return None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+		return False
+
+	"""creates a detached node for the item at position i of the in-order layout
+	@rtype: AVLNode
+	"""
+	def _node(self, i):
+		start = self._values_start + self._offsets[i]
+		end = self._values_start + self._offsets[i + 1]
+		return AVLNode(self._keys[i], _decode(self._view[start:end]))
+
+	"""searches for a node in the dictionary corresponding to the key (starting at the root)
+
+	@rtype: (AVLNode,int)
+	@returns: a tuple (x,e) as in AVLTree.search, for the tree AVLTree.from_sorted would build
+	"""
+	def search(self, key):
+		keys = self._keys
+		lo, hi = 0, self._count - 1
+		edges = 1
+		while lo <= hi:
+			mid = (lo + hi) // 2
+			if key == keys[mid]:
+				return self._node(mid), edges
+			elif key < keys[mid]:
+				hi = mid - 1
+			else:
+				lo = mid + 1
+			edges += 1
+		return None, edges
+
+	"""searches for a node in the dictionary corresponding to the key, starting at the max
+
+	@rtype: (AVLNode,int)
+	@returns: a tuple (x,e) where e counts the probes: a galloping search from the max
+	followed by a binary search, O(log d) for a key d positions below the max
+	"""
+	def finger_search(self, key):
+		keys = self._keys
+		if self._count == 0:
+			return None, 1
+		last = self._count - 1
+		lo = hi = last
+		edges = 1
+		if key < keys[last]:
+			# gallop down from the max until a key <= search key is passed
+			step = 1
+			hi = last - 1
+			while True:
+				probe = last - step
+				edges += 1
+				if probe < 0:
+					lo = 0
+					break
+				if not key < keys[probe]:
+					lo = probe
+					break
+				hi = probe - 1
+				step *= 2
+		while lo <= hi:
+			mid = (lo + hi) // 2
+			edges += 1
+			if key == keys[mid]:
+				return self._node(mid), edges
+			elif key < keys[mid]:
+				hi = mid - 1
+			else:
+				lo = mid + 1
+		return None, edges
+
+	"""lazily iterates over the items of the dictionary in increasing order of key
+
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi
+	"""
+	def items(self, lo=None, hi=None):
+		keys, offsets, view, base = self._keys, self._offsets, self._view, self._values_start
+		i = 0 if lo is None else bisect_left(keys, lo)
+		end = self._count if hi is None else bisect_right(keys, hi)
+		while i < end:
+			yield keys[i], _decode(view[base + offsets[i]:base + offsets[i + 1]])
+			i += 1
+
+	"""lazily iterates over the keys of the dictionary in increasing order
+
+	@rtype: generator
+	"""
+	def keys(self, lo=None, hi=None):
+		keys = self._keys
+		i = 0 if lo is None else bisect_left(keys, lo)
+		end = self._count if hi is None else bisect_right(keys, hi)
+		while i < end:
+			yield keys[i]
+			i += 1
+
+	def __iter__(self):
+		return self.keys()
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	@returns: a sorted list according to key of touples (key, value)
+	"""
+	def avl_to_array(self):
+		return list(self.items())
+
+	"""returns the number of keys in the dictionary that are smaller than or equal to key
+	@rtype: int
+	"""
+	def rank(self, key):
+		return bisect_right(self._keys, key)
+
+	"""finds the node holding the k-th smallest key in the dictionary
+
+	@rtype: AVLNode
+	@returns: the node of rank k, None if k is out of range
+	"""
+	def select(self, k):
+		if k < 1 or k > self._count:
+			return None
+		return self._node(k - 1)
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: AVLNode
+	@returns: the maximal node, None if the dictionary is empty
+	"""
+	def max_node(self):
+		return self.select(self._count)
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		return self._count
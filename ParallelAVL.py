@@ -0,0 +1,191 @@
+"""
+Parallel set operations for AVLTree.
+
+Large inputs are cut into key ranges that are independent of each other.
+Every range is merged on a concurrent.futures process pool, the resulting
+sorted runs are built into subtrees configured like the input tree and the
+subtrees are joined back together in key order. Items travel as (sort key,
+key, value) triples, so trees ordered by a key function are merged by that
+order. Inputs smaller than PARALLEL_THRESHOLD, and trees ordered by a cmp
+function (whose sort keys cannot be sent to a worker), are handled in-process
+with the split/join algorithms. parallel_build is kept as an entry point but
+builds in-process, since a pool does not pay off for a bulk build.
+"""
+
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from AVLTree import AVLTree
+
+
+# below this many items a process pool costs more than it saves
+PARALLEL_THRESHOLD = 100000
+
+
+"""builds an AVLTree from (key, value) pairs in any order, in this process.
+the build is not spread over a pool: from_iterable detects sorted input in O(n), and for
+shuffled input only its sort could move to the workers, while the sort keys, the pickling and
+the merge of the sorted runs that this takes in this process cost more than the whole sort
+
+@type pairs: iterable
+@pre: keys are distinct, unless the tree is a multimap
+@type workers: int
+@param workers: accepted like in the set operations, the build always runs in this process
+@param options: keyword arguments for the constructor of the new tree, as for AVLTree.from_iterable
+@rtype: AVLTree
+"""
+def parallel_build(pairs, workers=None, **options):
+	return AVLTree.from_iterable(pairs, **options)
+
+"""returns the union of tree1 and tree2, keeping tree1's value for keys found in both
+(in a multimap, the bucket of tree1 followed by the values of tree2)
+
+@type tree1: AVLTree
+@type tree2: AVLTree
+@pre: tree2 is ordered like tree1 (the result is configured like tree1)
+@type workers: int
+@param workers: number of worker processes, os.cpu_count() if None
+@rtype: AVLTree
+@returns: a new tree, tree1 and tree2 are left unchanged
+"""
+def parallel_union(tree1, tree2, workers=None):
+	merge = _merge_union_buckets if tree1.multimap else _merge_union
+	return _parallel_merge(tree1, tree2, merge, AVLTree.union, workers)
+
+"""returns the intersection of tree1 and tree2, with tree1's values
+
+@rtype: AVLTree
+@returns: a new tree, tree1 and tree2 are left unchanged
+"""
+def parallel_intersection(tree1, tree2, workers=None):
+	return _parallel_merge(tree1, tree2, _merge_intersection, AVLTree.intersection, workers)
+
+"""returns the keys of tree1 that are not in tree2
+
+@rtype: AVLTree
+@returns: a new tree, tree1 and tree2 are left unchanged
+"""
+def parallel_difference(tree1, tree2, workers=None):
+	return _parallel_merge(tree1, tree2, _merge_difference, AVLTree.difference, workers)
+
+
+"""runs a merge of the items of two trees, one key range per worker, and joins the pieces
+@rtype: AVLTree
+"""
+def _parallel_merge(tree1, tree2, merge, sequential, workers):
+	workers = workers or os.cpu_count() or 1
+	items1 = _triples(tree1, tree1.avl_to_array())
+	items2 = _triples(tree1, tree2.avl_to_array())
+	if workers == 1 or len(items1) + len(items2) < PARALLEL_THRESHOLD or tree1.cmp is not None:
+		return sequential(_build_like(tree1, items1, True), _build_like(tree1, items2, True))
+
+	# cut both inputs at the same sort keys so that the ranges are independent
+	longer = items1 if len(items1) >= len(items2) else items2
+	bounds = [longer[len(longer) * i // workers][0] for i in range(1, workers)]
+	skeys1 = [item[0] for item in items1]
+	skeys2 = [item[0] for item in items2]
+	cuts1 = [0] + [bisect_left(skeys1, skey) for skey in bounds] + [len(items1)]
+	cuts2 = [0] + [bisect_left(skeys2, skey) for skey in bounds] + [len(items2)]
+	pieces1 = [items1[cuts1[i]:cuts1[i + 1]] for i in range(workers)]
+	pieces2 = [items2[cuts2[i]:cuts2[i + 1]] for i in range(workers)]
+
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		runs = list(pool.map(merge, pieces1, pieces2))
+	return _join_runs(runs, tree1)
+
+"""builds every sorted run into a subtree configured like tree and joins the subtrees in order
+@type runs: list
+@pre: every sort key of runs[i] is smaller than every sort key of runs[i + 1]
+@rtype: AVLTree
+"""
+def _join_runs(runs, tree):
+	result = tree._spawn()
+	for run in runs:
+		if not run:
+			continue
+		# the first item of every run separates it from everything before it
+		skey, key, val = run[0]
+		result.join(_build_like(tree, run[1:], True), key, val)
+	return result
+
+"""returns (sort key, key, value) triples for pairs, with the sort keys of tree
+@rtype: list
+"""
+def _triples(tree, pairs):
+	skeys = tree._sort_keys([pair[0] for pair in pairs])
+	return [(skey, key, val) for skey, (key, val) in zip(skeys, pairs)]
+
+"""builds a new tree configured like tree from triples sorted by sort key
+@type buckets: bool
+@param buckets: if True and tree is a multimap, the values of items are whole buckets,
+which are copied value by value into the new buckets
+@rtype: AVLTree
+"""
+def _build_like(tree, items, buckets=False):
+	result = tree._spawn()
+	if buckets and tree.multimap:
+		items = [(skey, key, val) for skey, key, bucket in items for val in bucket]
+	result._build([(key, val) for skey, key, val in items], [item[0] for item in items])
+	return result
+
+def _merge_union(items1, items2):
+	result = []
+	i = j = 0
+	while i < len(items1) and j < len(items2):
+		if items1[i][0] < items2[j][0]:
+			result.append(items1[i])
+			i += 1
+		elif items2[j][0] < items1[i][0]:
+			result.append(items2[j])
+			j += 1
+		else:
+			result.append(items1[i])
+			i += 1
+			j += 1
+	result.extend(items1[i:])
+	result.extend(items2[j:])
+	return result
+
+def _merge_union_buckets(items1, items2):
+	result = []
+	i = j = 0
+	while i < len(items1) and j < len(items2):
+		if items1[i][0] < items2[j][0]:
+			result.append(items1[i])
+			i += 1
+		elif items2[j][0] < items1[i][0]:
+			result.append(items2[j])
+			j += 1
+		else:
+			skey, key, bucket = items1[i]
+			result.append((skey, key, bucket + items2[j][2]))
+			i += 1
+			j += 1
+	result.extend(items1[i:])
+	result.extend(items2[j:])
+	return result
+
+def _merge_intersection(items1, items2):
+	result = []
+	i = j = 0
+	while i < len(items1) and j < len(items2):
+		if items1[i][0] < items2[j][0]:
+			i += 1
+		elif items2[j][0] < items1[i][0]:
+			j += 1
+		else:
+			result.append(items1[i])
+			i += 1
+			j += 1
+	return result
+
+def _merge_difference(items1, items2):
+	result = []
+	j = 0
+	for item in items1:
+		while j < len(items2) and items2[j][0] < item[0]:
+			j += 1
+		if j == len(items2) or item[0] < items2[j][0]:
+			result.append(item)
+	return result
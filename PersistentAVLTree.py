@@ -0,0 +1,303 @@
+"""
+A persistent (copy-on-write) AVL tree.
+
+Nodes are never changed after they are created and have no parent pointers.
+insert, delete, join and split copy only the nodes on the path they touch and
+return a new PersistentAVLTree that shares every other subtree with the old
+version, so any version can be kept as a snapshot for free.
+"""
+
+
+"""An immutable node of a PersistentAVLTree"""
+
+class PersistentNode(object):
+	__slots__ = ('key', 'value', 'left', 'right', 'height', 'size')
+
+	"""Constructor
+
+	@type left: PersistentNode
+	@param left: the left subtree, None if empty
+	@type right: PersistentNode
+	@param right: the right subtree, None if empty
+	"""
+	def __init__(self, key, value, left, right):
+		self.key = key
+		self.value = value
+		self.left = left
+		self.right = right
+		self.height = 1 + max(_height(left), _height(right))
+		self.size = 1 + _size(left) + _size(right)
+
+	def __repr__(self):
+		return f"Node(k={self.key}, v={self.value}, h={self.height})"
+
+
+def _height(node):
+	return node.height if node is not None else -1
+
+def _size(node):
+	return node.size if node is not None else 0
+
+"""creates a node over left and right, rotating once or twice if their heights differ by 2
+@rtype: PersistentNode
+"""
+def _balance(key, value, left, right):
+	left_height, right_height = _height(left), _height(right)
+	if left_height > right_height + 1:
+		if _height(left.left) >= _height(left.right):
+			return PersistentNode(left.key, left.value, left.left,
+				PersistentNode(key, value, left.right, right))
+		inner = left.right
+		return PersistentNode(inner.key, inner.value,
+			PersistentNode(left.key, left.value, left.left, inner.left),
+			PersistentNode(key, value, inner.right, right))
+	if right_height > left_height + 1:
+		if _height(right.right) >= _height(right.left):
+			return PersistentNode(right.key, right.value,
+				PersistentNode(key, value, left, right.left), right.right)
+		inner = right.left
+		return PersistentNode(inner.key, inner.value,
+			PersistentNode(key, value, left, inner.left),
+			PersistentNode(right.key, right.value, inner.right, right.right))
+	return PersistentNode(key, value, left, right)
+
+def _insert(node, key, value):
+	if node is None:
+		return PersistentNode(key, value, None, None)
+	if key < node.key:
+		return _balance(node.key, node.value, _insert(node.left, key, value), node.right)
+	if node.key < key:
+		return _balance(node.key, node.value, node.left, _insert(node.right, key, value))
+	return PersistentNode(key, value, node.left, node.right)
+
+def _delete_min(node):
+	if node.left is None:
+		return node.right
+	return _balance(node.key, node.value, _delete_min(node.left), node.right)
+
+def _delete(node, key):
+	if node is None:
+		return None
+	if key < node.key:
+		return _balance(node.key, node.value, _delete(node.left, key), node.right)
+	if node.key < key:
+		return _balance(node.key, node.value, node.left, _delete(node.right, key))
+	if node.left is None:
+		return node.right
+	if node.right is None:
+		return node.left
+	succ = node.right
+	while succ.left is not None:
+		succ = succ.left
+	return _balance(succ.key, succ.value, node.left, _delete_min(node.right))
+
+"""joins left, the item (key, value) and right, going down the spine of the taller side
+@pre: keys(left) < key < keys(right)
+@rtype: PersistentNode
+"""
+def _join(left, key, value, right):
+	left_height, right_height = _height(left), _height(right)
+	if left_height > right_height + 1:
+		return _balance(left.key, left.value, left.left, _join(left.right, key, value, right))
+	if right_height > left_height + 1:
+		return _balance(right.key, right.value, _join(left, key, value, right.left), right.right)
+	return PersistentNode(key, value, left, right)
+
+"""splits the subtree of node around key
+@rtype: (PersistentNode, PersistentNode, PersistentNode)
+@returns: (left, x, right) where x is the node of key, None if key is not in the subtree
+"""
+def _split(node, key):
+	if node is None:
+		return None, None, None
+	if key < node.key:
+		left, found, right = _split(node.left, key)
+		return left, found, _join(right, node.key, node.value, node.right)
+	if node.key < key:
+		left, found, right = _split(node.right, key)
+		return _join(node.left, node.key, node.value, left), found, right
+	return node.left, node, node.right
+
+
+"""
+A class implementing a persistent AVL tree. Every update returns a new version.
+"""
+
+class PersistentAVLTree(object):
+
+	"""Constructor
+
+	@type root: PersistentNode
+	@param root: the root of an existing version, None for an empty tree
+	"""
+	def __init__(self, root=None):
+		self.root = root
+
+	"""builds a perfectly balanced tree from (key, value) pairs sorted by key, in O(n)
+
+	@pre: keys appear in strictly increasing order
+	@rtype: PersistentAVLTree
+	"""
+	@classmethod
+	def from_sorted(cls, pairs):
+		pairs = pairs if isinstance(pairs, list) else list(pairs)
+
+		def build(lo, hi):
+			if lo > hi:
+				return None
+			mid = (lo + hi) // 2
+			key, val = pairs[mid]
+			return PersistentNode(key, val, build(lo, mid - 1), build(mid + 1, hi))
+
+		return cls(build(0, len(pairs) - 1))
+
+	"""returns a version that will not change, in O(1)
+
+	@rtype: PersistentAVLTree
+	"""
+	def snapshot(self):
+		return self
+
+	"""searches for a node in the dictionary corresponding to the key (starting at the root)
+
+	@rtype: (PersistentNode,int)
+	@returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+	and e is the number of edges on the path between the starting node and ending node+1.
+	"""
+	def search(self, key):
+		node = self.root
+		edges = 1
+		while node is not None:
+			if key == node.key:
+				return node, edges
+			node = node.left if key < node.key else node.right
+			edges += 1
+		return None, edges
+
+	"""searches for a node in the dictionary corresponding to the key, starting at the max
+
+	without parent pointers the walk goes down the right spine until it passes a key
+	smaller than the search key, and continues as a regular search from there
+
+	@rtype: (PersistentNode,int)
+	@returns: a tuple (x,e) as in search
+	"""
+	def finger_search(self, key):
+		node = self.root
+		edges = 1
+		while node is not None and node.key < key and node.right is not None:
+			node = node.right
+			edges += 1
+		while node is not None:
+			if key == node.key:
+				return node, edges
+			node = node.left if key < node.key else node.right
+			edges += 1
+		return None, edges
+
+	"""returns a new version with the item added, or with its value replaced if key is present
+
+	allocates O(log n) nodes, self is not changed
+	@rtype: PersistentAVLTree
+	"""
+	def insert(self, key, val):
+		return PersistentAVLTree(_insert(self.root, key, val))
+
+	"""returns a new version without key (the same version if key is missing)
+
+	@type key: int
+	@param key: the key to remove (a node returned by search is accepted too)
+	@rtype: PersistentAVLTree
+	"""
+	def delete(self, key):
+		if isinstance(key, PersistentNode):
+			key = key.key
+		return PersistentAVLTree(_delete(self.root, key))
+
+	"""returns a new version joining self, the item and tree2
+
+	@type tree2: PersistentAVLTree
+	@pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+	or the opposite way
+	@rtype: PersistentAVLTree
+	"""
+	def join(self, tree2, key, val):
+		left, right = self.root, tree2.root
+		if (left is not None and key < left.key) or (right is not None and right.key < key):
+			left, right = right, left
+		return PersistentAVLTree(_join(left, key, val, right))
+
+	"""splits the dictionary around a key that does not have to appear in it
+
+	@type key: int
+	@param key: the key to split at (a node returned by search is accepted too)
+	@rtype: (PersistentAVLTree, PersistentAVLTree)
+	@returns: a tuple (left, right) holding the keys smaller and larger than key.
+	self is not changed.
+	"""
+	def split(self, key):
+		if isinstance(key, PersistentNode):
+			key = key.key
+		left, found, right = _split(self.root, key)
+		return PersistentAVLTree(left), PersistentAVLTree(right)
+
+	"""lazily iterates over the items of the dictionary in increasing order of key
+
+	@rtype: generator
+	@returns: (key, value) tuples with lo <= key <= hi
+	"""
+	def items(self, lo=None, hi=None):
+		stack = []
+		node = self.root
+		while stack or node is not None:
+			while node is not None:
+				if lo is not None and node.key < lo:
+					node = node.right
+				else:
+					stack.append(node)
+					node = node.left
+			if not stack:
+				return
+			node = stack.pop()
+			if hi is not None and hi < node.key:
+				return
+			yield node.key, node.value
+			node = node.right
+
+	def __iter__(self):
+		for key, val in self.items():
+			yield key
+
+	"""returns an array representing dictionary
+
+	@rtype: list
+	@returns: a sorted list according to key of touples (key, value)
+	"""
+	def avl_to_array(self):
+		return list(self.items())
+
+	"""returns the node with the maximal key in the dictionary
+
+	@rtype: PersistentNode
+	@returns: the maximal node, None if the dictionary is empty
+	"""
+	def max_node(self):
+		node = self.root
+		while node is not None and node.right is not None:
+			node = node.right
+		return node
+
+	"""returns the number of items in dictionary
+
+	@rtype: int
+	"""
+	def size(self):
+		return _size(self.root)
+
+	"""returns the root of the tree representing the dictionary
+
+	@rtype: PersistentNode
+	@returns: the root, None if the dictionary is empty
+	"""
+	def get_root(self):
+		return self.root
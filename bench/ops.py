@@ -0,0 +1,787 @@
+"""
+The benchmarked operations.
+
+Every benchmark takes (keys, queries, options), builds what it needs outside
+of the timed region, and returns a list of Result records. The groups below
+are selected with --groups on the command line.
+"""
+
+import asyncio
+import bisect
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from AVLTree import AVLTree, VALUE_SUM
+from ArrayAVLTree import ArrayAVLTree
+from AsyncAVLTree import AsyncAVLTree
+from ConcurrentAVLTree import ConcurrentAVLTree
+from DurableAVLTree import DurableAVLTree, read_frames
+from FatAVLTree import FatAVLTree
+from IntervalTree import IntervalTree
+from PersistentAVLTree import PersistentAVLTree
+import ParallelAVL
+
+
+SPLIT_JOIN_ROUNDS = 200
+ARRAY_SCAN_ROUNDS = 20
+RANGE_LENGTH = 100
+SNAPSHOT_EVERY = 100
+INTERVAL_LENGTH = 50
+RANGE_FRACTION = 10  # range operations remove 1/RANGE_FRACTION of the keys
+EVENTS_PER_STAMP = 10
+DURABLE_SYNCED_OPS = 2000
+DURABLE_GROUP = 256  # operations per group commit
+
+
+class Result(object):
+
+	def __init__(self, op, ops, seconds, height=None, **extra):
+		self.op = op
+		self.ops = ops
+		self.seconds = seconds
+		self.height = height
+		self.extra = extra
+
+	def as_dict(self):
+		record = {
+			'op': self.op,
+			'ops': self.ops,
+			'seconds': self.seconds,
+			'ops_per_sec': self.ops / self.seconds if self.seconds > 0 else float('inf'),
+			'height': self.height,
+		}
+		record.update(self.extra)
+		return record
+
+
+def _height(tree):
+	return tree.root.height if tree.root.is_real_node() else -1
+
+def _build(keys):
+	return AVLTree.from_iterable((key, key) for key in keys)
+
+
+# core operations
+
+def bench_insert(keys, queries, options):
+	tree = AVLTree()
+	start = time.perf_counter()
+	for key in keys:
+		tree.insert(key, key)
+	return [Result('insert', len(keys), time.perf_counter() - start, _height(tree))]
+
+def bench_finger_insert(keys, queries, options):
+	tree = AVLTree()
+	start = time.perf_counter()
+	for key in keys:
+		tree.finger_insert(key, key)
+	return [Result('finger_insert', len(keys), time.perf_counter() - start, _height(tree))]
+
+def bench_search(keys, queries, options):
+	tree = _build(keys)
+	start = time.perf_counter()
+	for key in queries:
+		tree.search(key)
+	return [Result('search', len(queries), time.perf_counter() - start, _height(tree))]
+
+def bench_finger_search(keys, queries, options):
+	tree = _build(keys)
+	start = time.perf_counter()
+	for key in queries:
+		tree.finger_search(key)
+	return [Result('finger_search', len(queries), time.perf_counter() - start, _height(tree))]
+
+def bench_delete(keys, queries, options):
+	tree = _build(keys)
+	nodes = [tree.search(key)[0] for key in dict.fromkeys(queries)]
+	height = _height(tree)
+	start = time.perf_counter()
+	for node in nodes:
+		tree.delete(node)
+	return [Result('delete', len(nodes), time.perf_counter() - start, height)]
+
+# a delete-heavy churn: every query key is deleted and a new key inserted next to it,
+# with AVL and with weak AVL rebalancing of the deletes
+
+def _churn(tree, pairs):
+	for node, key in pairs:
+		tree.delete(node)
+		tree.insert(key, key)
+
+def bench_churn(keys, queries, options):
+	churn = list(dict.fromkeys(queries))
+	results = []
+	counted = {}
+	for name, wavl in (('churn_avl', False), ('churn_wavl', True)):
+		tree = AVLTree.from_iterable(((key, key) for key in keys), wavl=wavl)
+		pairs = [(tree.search(key)[0], key + 1) for key in churn]
+		start = time.perf_counter()
+		_churn(tree, pairs)
+		elapsed = time.perf_counter() - start
+		height = _height(tree)
+
+		# the same churn again, counting the rebalancing work of the deletes
+		tree = AVLTree.from_iterable(((key, key) for key in keys), wavl=wavl)
+		pairs = [(tree.search(key)[0], key + 1) for key in churn]
+		stats = tree.enable_stats()
+		_churn(tree, pairs)
+		counted[wavl] = stats
+		extra = {
+			'delete_rotations': stats.delete_rotations,
+			'delete_rotations_max': max(stats.delete_rotation_counts, default=0),
+			'delete_height_changes': stats.delete_height_changes,
+		}
+		if wavl:
+			# negative when the weak AVL rules did more work
+			extra['delete_rotations_saved'] = counted[False].delete_rotations - stats.delete_rotations
+			extra['delete_height_changes_saved'] = counted[False].delete_height_changes - stats.delete_height_changes
+		results.append(Result(name, len(pairs), elapsed, height, **extra))
+	return results
+
+def bench_split_join(keys, queries, options):
+	rng = random.Random(options.seed)
+	tree = _build(keys)
+	height = _height(tree)
+	split_time = join_time = 0.0
+	rounds = min(SPLIT_JOIN_ROUNDS, len(keys))
+	for i in range(rounds):
+		node, edges = tree.search(rng.choice(keys))
+		key, val = node.key, node.value
+		start = time.perf_counter()
+		left, right = tree.split(node)
+		middle = time.perf_counter()
+		left.join(right, key, val)
+		split_time += middle - start
+		join_time += time.perf_counter() - middle
+		tree = left
+	return [Result('split', rounds, split_time, height), Result('join', rounds, join_time, _height(tree))]
+
+def bench_successor(keys, queries, options):
+	tree = _build(keys)
+	node = tree.select(1)
+	count = 0
+	start = time.perf_counter()
+	while node is not None:
+		node = tree.successor(node)
+		count += 1
+	return [Result('successor', count, time.perf_counter() - start, _height(tree))]
+
+def bench_avl_to_array(keys, queries, options):
+	tree = _build(keys)
+	start = time.perf_counter()
+	tree.avl_to_array()
+	return [Result('avl_to_array', len(keys), time.perf_counter() - start, _height(tree))]
+
+
+# bulk loading and batches
+
+def bench_from_iterable(keys, queries, options):
+	pairs = [(key, key) for key in keys]
+	start = time.perf_counter()
+	tree = AVLTree.from_iterable(pairs)
+	return [Result('from_iterable', len(keys), time.perf_counter() - start, _height(tree))]
+
+def bench_batches(keys, queries, options):
+	half = len(keys) // 2
+	tree = _build(keys[:half])
+	batch = [(key, key) for key in keys[half:]]
+	start = time.perf_counter()
+	tree.insert_many(batch)
+	insert_time = time.perf_counter() - start
+	start = time.perf_counter()
+	tree.search_many(queries)
+	search_time = time.perf_counter() - start
+	start = time.perf_counter()
+	tree.delete_many(keys[half:])
+	delete_time = time.perf_counter() - start
+	return [
+		Result('insert_many', len(batch), insert_time, _height(tree)),
+		Result('search_many', len(queries), search_time, _height(tree)),
+		Result('delete_many', len(batch), delete_time, _height(tree)),
+	]
+
+def bench_range_delete(keys, queries, options):
+	ordered = sorted(keys)
+	width = max(len(ordered) // RANGE_FRACTION, 1)
+	mid = len(ordered) // 2
+	lo, hi = ordered[mid], ordered[min(mid + width, len(ordered)) - 1]
+	watermark = ordered[min(width, len(ordered) - 1)]
+
+	tree = _build(keys)
+	height = _height(tree)
+	start = time.perf_counter()
+	tree.delete_range(lo, hi)
+	range_time = time.perf_counter() - start
+
+	tree = _build(keys)
+	nodes = [tree.search(key)[0] for key in ordered if lo <= key <= hi]
+	start = time.perf_counter()
+	for node in nodes:
+		tree.delete(node)
+	per_key_time = time.perf_counter() - start
+
+	tree = _build(keys)
+	start = time.perf_counter()
+	removed = tree.truncate_below(watermark)
+	truncate_time = time.perf_counter() - start
+
+	tree = _build(keys)
+	start = time.perf_counter()
+	extracted = tree.extract_range(lo, hi)
+	extract_time = time.perf_counter() - start
+
+	# ops are counted as removed keys, so the rows compare directly
+	return [
+		Result('delete_range', len(nodes), range_time, height),
+		Result('delete_range_per_key', len(nodes), per_key_time, height),
+		Result('truncate_below', removed, truncate_time, height),
+		Result('extract_range', extracted.size(), extract_time, height),
+	]
+
+# many values per key: one node per value against one bucket per key
+
+def bench_multimap(keys, queries, options):
+	stamps = max(len(keys) // EVENTS_PER_STAMP, 1)
+	events = [(key % stamps, key) for key in keys]
+	lookups = [key % stamps for key in queries]
+	results = []
+
+	# the usual workaround, keys made unique by the event
+	tree = AVLTree()
+	start = time.perf_counter()
+	for stamp, event in events:
+		tree.insert((stamp, event), event)
+	insert_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for stamp in lookups:
+		list(tree.items((stamp,), (stamp, float('inf'))))
+	lookup_time = time.perf_counter() - start
+	results += [
+		Result('events_insert_unique_keys', len(events), insert_time, _height(tree), nodes=tree.size()),
+		Result('events_get_all_unique_keys', len(lookups), lookup_time, _height(tree)),
+	]
+
+	for suffix, typecode in (('', None), ('_array', 'q')):
+		tree = AVLTree(multimap=True, typecode=typecode)
+		start = time.perf_counter()
+		for stamp, event in events:
+			tree.insert(stamp, event)
+		insert_time = time.perf_counter() - start
+		start = time.perf_counter()
+		for stamp in lookups:
+			tree.get_all(stamp)
+		lookup_time = time.perf_counter() - start
+		results += [
+			Result('events_insert_multimap' + suffix, len(events), insert_time, _height(tree), nodes=tree.size()),
+			Result('events_get_all_multimap' + suffix, len(lookups), lookup_time, _height(tree)),
+		]
+	return results
+
+
+# order statistics and iteration, against the array scan they replace
+
+def bench_order_statistics(keys, queries, options):
+	tree = _build(keys)
+	n = len(keys)
+	start = time.perf_counter()
+	for key in queries:
+		tree.rank(key)
+	rank_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for k in range(1, n + 1):
+		tree.select(k)
+	select_time = time.perf_counter() - start
+	rounds = min(ARRAY_SCAN_ROUNDS, n)
+	start = time.perf_counter()
+	for i in range(rounds):
+		tree.avl_to_array()[(n - 1) // 2]
+	scan_time = time.perf_counter() - start
+	return [
+		Result('rank', len(queries), rank_time, _height(tree)),
+		Result('select', n, select_time, _height(tree)),
+		Result('median_by_array_scan', rounds, scan_time, _height(tree)),
+	]
+
+def bench_range_scan(keys, queries, options):
+	tree = _build(keys)
+	rounds = min(ARRAY_SCAN_ROUNDS, len(queries))
+	start = time.perf_counter()
+	for key in queries[:rounds]:
+		for item in tree.items(lo=key):
+			pass
+	full_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for key in queries:
+		count = 0
+		for item in tree.items(lo=key):
+			count += 1
+			if count == RANGE_LENGTH:
+				break
+	short_time = time.perf_counter() - start
+	return [
+		Result('items_to_end', rounds, full_time, _height(tree)),
+		Result('items_first_%d' % RANGE_LENGTH, len(queries), short_time, _height(tree)),
+	]
+
+def bench_bounds(keys, queries, options):
+	tree = _build(keys)
+	# the workload keys are even, so odd probes miss and exercise the bounds
+	probes = [key + 1 for key in queries]
+	start = time.perf_counter()
+	for key in probes:
+		tree.floor(key)
+	floor_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for key in probes:
+		tree.nearest(key)
+	nearest_time = time.perf_counter() - start
+	ordered = sorted(probes)
+	start = time.perf_counter()
+	tree.floor_many(ordered)
+	many_time = time.perf_counter() - start
+	rounds = min(ARRAY_SCAN_ROUNDS, len(probes))
+	start = time.perf_counter()
+	for key in probes[:rounds]:
+		items = tree.avl_to_array()
+		items[bisect.bisect_right(items, (key, float('inf'))) - 1]
+	scan_time = time.perf_counter() - start
+	return [
+		Result('floor', len(probes), floor_time, _height(tree)),
+		Result('nearest', len(probes), nearest_time, _height(tree)),
+		Result('floor_many_sorted', len(ordered), many_time, _height(tree)),
+		Result('floor_by_array_scan', rounds, scan_time, _height(tree)),
+	]
+
+def bench_range_aggregate(keys, queries, options):
+	tree = AVLTree.from_iterable(((key, key) for key in keys), augment=VALUE_SUM)
+	start = time.perf_counter()
+	for key in queries:
+		tree.range_aggregate(key, key + RANGE_LENGTH * 2)
+	aggregate_time = time.perf_counter() - start
+	rounds = min(ARRAY_SCAN_ROUNDS, len(queries))
+	start = time.perf_counter()
+	for key in queries[:rounds]:
+		hi = key + RANGE_LENGTH * 2
+		sum(val for k, val in tree.avl_to_array() if key <= k <= hi)
+	scan_time = time.perf_counter() - start
+	return [
+		Result('range_aggregate_sum', len(queries), aggregate_time, _height(tree)),
+		Result('range_sum_by_array_scan', rounds, scan_time, _height(tree)),
+	]
+
+def bench_intervals(keys, queries, options):
+	rng = random.Random(options.seed)
+	intervals = {(key, key + rng.randrange(INTERVAL_LENGTH)): key for key in keys}
+	start = time.perf_counter()
+	tree = IntervalTree((lo, hi, val) for (lo, hi), val in intervals.items())
+	build_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for key in queries:
+		tree.stabbing(key)
+	stabbing_time = time.perf_counter() - start
+	rounds = min(ARRAY_SCAN_ROUNDS, len(queries))
+	start = time.perf_counter()
+	for key in queries[:rounds]:
+		[item for item in tree.tree.avl_to_array() if item[0][0] <= key <= item[0][1]]
+	scan_time = time.perf_counter() - start
+	return [
+		Result('interval_build', len(intervals), build_time, _height(tree.tree)),
+		Result('interval_stabbing', len(queries), stabbing_time, _height(tree.tree)),
+		Result('stabbing_by_array_scan', rounds, scan_time, _height(tree.tree)),
+	]
+
+
+# finger search from the last accessed node
+
+def bench_tracked_finger(keys, queries, options):
+	tree = AVLTree.from_iterable((key, key) for key in keys)
+	tree.track_finger = True
+	start = time.perf_counter()
+	for key in queries:
+		tree.finger_search(key)
+	return [Result('tracked_finger_search', len(queries), time.perf_counter() - start, _height(tree))]
+
+def bench_deque(keys, queries, options):
+	# a queue: produce at the max end, consume from the min end
+	ordered = sorted(keys)
+	half = len(ordered) // 2
+	tree = AVLTree.from_sorted([(key, key) for key in ordered[:half]])
+	start = time.perf_counter()
+	for key in ordered[half:]:
+		tree.finger_insert(key, key)
+		tree.pop_min()
+	pop_time = time.perf_counter() - start
+
+	# the same queue, consuming by searching for the smallest key from the root
+	tree = AVLTree.from_sorted([(key, key) for key in ordered[:half]])
+	start = time.perf_counter()
+	for key in ordered[half:]:
+		tree.finger_insert(key, key)
+		tree.delete(tree.select(1))
+	select_time = time.perf_counter() - start
+
+	tree = AVLTree.from_sorted([(key, key) for key in ordered])
+	start = time.perf_counter()
+	for key in ordered[:len(queries) // 2]:
+		tree.finger_search(key, nearest_end=True)
+	near_min_time = time.perf_counter() - start
+	return [
+		Result('queue_insert_pop_min', len(ordered) - half, pop_time, _height(tree)),
+		Result('queue_insert_delete_select', len(ordered) - half, select_time, _height(tree)),
+		Result('finger_search_near_min', len(queries) // 2, near_min_time, _height(tree)),
+	]
+
+
+# in-order links against parent-pointer walks
+
+def bench_threaded(keys, queries, options):
+	results = []
+	for threaded in (False, True):
+		tree = AVLTree.from_iterable(((key, key) for key in keys), threaded=threaded)
+		suffix = '_threaded' if threaded else ''
+		start = time.perf_counter()
+		for item in tree.items():
+			pass
+		scan_time = time.perf_counter() - start
+		nodes = [tree.search(key)[0] for key in queries]
+		start = time.perf_counter()
+		for node in nodes:
+			tree.successor(node)
+			tree.predecessor(node)
+		neighbour_time = time.perf_counter() - start
+		start = time.perf_counter()
+		for key in keys:
+			tree.insert(key + 1, key)
+		insert_time = time.perf_counter() - start
+		results += [
+			Result('full_scan' + suffix, len(keys), scan_time, _height(tree)),
+			Result('successor_predecessor' + suffix, 2 * len(nodes), neighbour_time, _height(tree)),
+			Result('insert' + suffix, len(keys), insert_time, _height(tree)),
+		]
+	return results
+
+
+# key functions against keys that transform themselves on every comparison
+
+class _PerCompareKey(object):
+	__slots__ = ('value', 'key')
+
+	def __init__(self, value, key):
+		self.value = value
+		self.key = key
+
+	def __lt__(self, other):
+		return self.key(self.value) < other.key(other.value)
+
+	def __gt__(self, other):
+		return self.key(self.value) > other.key(other.value)
+
+	def __eq__(self, other):
+		return self.key(self.value) == other.key(other.value)
+
+def _record_order(record):
+	return (record[0], record[2])
+
+def bench_key_function(keys, queries, options):
+	rng = random.Random(options.seed)
+	flip = [rng.random() < 0.5 for i in range(16)]
+	def text(key):
+		return ''.join(c.upper() if flip[i] else c for i, c in enumerate('item%d' % key))
+	def record(key):
+		return (key % 101, 'name%d' % key, key)
+	results = []
+	for name, make, order in (('casefold', text, str.casefold), ('tuple', record, _record_order)):
+		inserted = [make(key) for key in keys]
+		searched = [make(key) for key in queries]
+		for suffix in ('_per_compare', '_key'):
+			if suffix == '_key':
+				tree = AVLTree(key=order)
+				wrapped, lookups = inserted, searched
+			else:
+				tree = AVLTree()
+				wrapped = [_PerCompareKey(key, order) for key in inserted]
+				lookups = [_PerCompareKey(key, order) for key in searched]
+			start = time.perf_counter()
+			for key in wrapped:
+				tree.insert(key, None)
+			insert_time = time.perf_counter() - start
+			start = time.perf_counter()
+			for key in lookups:
+				tree.search(key)
+			search_time = time.perf_counter() - start
+			results += [
+				Result(name + '_insert' + suffix, len(keys), insert_time, _height(tree)),
+				Result(name + '_search' + suffix, len(queries), search_time, _height(tree)),
+			]
+	# plain int keys take the path without a key function call
+	for suffix, order in (('', None), ('_identity_key', int)):
+		tree = AVLTree(key=order)
+		start = time.perf_counter()
+		for key in keys:
+			tree.insert(key, key)
+		results.append(Result('int_insert' + suffix, len(keys), time.perf_counter() - start, _height(tree)))
+	return results
+
+
+# alternative backends
+
+def bench_array_backend(keys, queries, options):
+	tree = ArrayAVLTree(key_type='q')
+	start = time.perf_counter()
+	for key in keys:
+		tree.insert(key, None)
+	insert_time = time.perf_counter() - start
+	start = time.perf_counter()
+	for key in queries:
+		tree.search(key)
+	search_time = time.perf_counter() - start
+	height = tree.pool.height[tree.root]
+	per_entry = tree.pool.nbytes() / max(len(keys), 1)
+	return [
+		Result('array_insert', len(keys), insert_time, height, buffer_bytes_per_entry=per_entry),
+		Result('array_search', len(queries), search_time, height),
+	]
+
+def bench_fat_nodes(keys, queries, options):
+	ordered = sorted(keys)
+	pairs = [(key, key) for key in ordered]
+	results = []
+	# every backend is bulk loaded, the workloads leave the odd keys free for inserts
+	for name, key_type in (('node', None), ('fat', None), ('fat_array', 'q')):
+		if name == 'node':
+			tree = AVLTree.from_sorted(pairs)
+			height = _height(tree)
+		else:
+			tree = FatAVLTree.from_sorted(pairs, key_type=key_type)
+			height = _height(tree.spine)
+		start = time.perf_counter()
+		for key in queries:
+			tree.search(key)
+		search_time = time.perf_counter() - start
+		start = time.perf_counter()
+		for key in queries:
+			tree.finger_search(key)
+		finger_time = time.perf_counter() - start
+		start = time.perf_counter()
+		for key in keys:
+			tree.insert(key + 1, key)
+		insert_time = time.perf_counter() - start
+		nodes = [tree.search(key + 1)[0] for key in keys]
+		start = time.perf_counter()
+		for node in nodes:
+			tree.delete(node)
+		delete_time = time.perf_counter() - start
+		start = time.perf_counter()
+		tree.avl_to_array()
+		scan_time = time.perf_counter() - start
+		results += [
+			Result(name + '_search', len(queries), search_time, height),
+			Result(name + '_finger_search', len(queries), finger_time, height),
+			Result(name + '_insert', len(keys), insert_time, height),
+			Result(name + '_delete', len(nodes), delete_time, height),
+			Result(name + '_avl_to_array', len(keys), scan_time, height),
+		]
+	return results
+
+def bench_snapshots(keys, queries, options):
+	persistent = PersistentAVLTree()
+	snapshots = []
+	start = time.perf_counter()
+	for i, key in enumerate(keys):
+		persistent = persistent.insert(key, key)
+		if i % SNAPSHOT_EVERY == 0:
+			snapshots.append(persistent.snapshot())
+	persistent_time = time.perf_counter() - start
+
+	# the same snapshots taken as full copies of a mutable tree
+	rounds = min(len(keys), SNAPSHOT_EVERY * ARRAY_SCAN_ROUNDS)
+	tree = AVLTree()
+	copies = []
+	start = time.perf_counter()
+	for i, key in enumerate(keys[:rounds]):
+		tree.insert(key, key)
+		if i % SNAPSHOT_EVERY == 0:
+			copies.append(AVLTree.from_sorted(tree.avl_to_array()))
+	copy_time = time.perf_counter() - start
+	return [
+		Result('persistent_insert_with_snapshots', len(keys), persistent_time, persistent.root.height),
+		Result('insert_with_full_copy_snapshots', rounds, copy_time, _height(tree)),
+	]
+
+def bench_mapped(keys, queries, options):
+	tree = _build(keys)
+	fd, path = tempfile.mkstemp(suffix='.avl')
+	os.close(fd)
+	try:
+		start = time.perf_counter()
+		tree.save(path)
+		save_time = time.perf_counter() - start
+		start = time.perf_counter()
+		mapped = AVLTree.load(path, mmap=True)
+		load_time = time.perf_counter() - start
+		start = time.perf_counter()
+		for key in queries:
+			mapped.search(key)
+		search_time = time.perf_counter() - start
+		mapped.close()
+	finally:
+		os.remove(path)
+	return [
+		Result('save', len(keys), save_time, _height(tree)),
+		Result('mmap_load', 1, load_time),
+		Result('mmap_search', len(queries), search_time, _height(tree)),
+	]
+
+# the operation log and snapshots of DurableAVLTree
+
+def _persistent_height(tree):
+	return tree.root.height if tree.root is not None else -1
+
+def bench_durable(keys, queries, options):
+	directory = tempfile.mkdtemp(suffix='.durable')
+	results = []
+	try:
+		# fsync per operation is slow on real disks, so it runs on a prefix of the keys
+		synced = keys[:DURABLE_SYNCED_OPS]
+		for name, ops, config in (
+				('durable_insert_sync_each', synced, dict(sync='always', group_size=1)),
+				('durable_insert_group_commit', keys, dict(sync='always', group_size=DURABLE_GROUP)),
+				('durable_insert_no_sync', keys, dict(sync='never', group_size=DURABLE_GROUP))):
+			for old in os.listdir(directory):
+				os.remove(os.path.join(directory, old))
+			tree = DurableAVLTree(directory, **config)
+			start = time.perf_counter()
+			for key in ops:
+				tree.insert(key, key)
+			tree.commit(sync=True)
+			elapsed = time.perf_counter() - start
+			results.append(Result(name, len(ops), elapsed, _persistent_height(tree.tree),
+				commits=tree.commits, syncs=tree.syncs))
+			tree.close()
+
+		# recovery of the last log: folded and bulk loaded, against one insert per entry
+		start = time.perf_counter()
+		tree = DurableAVLTree(directory)
+		replay_time = time.perf_counter() - start
+		replayed = tree.replayed
+		tree.close()
+		log_path = os.path.join(directory, 'log.0')
+		start = time.perf_counter()
+		persistent = PersistentAVLTree()
+		frames, end = read_frames(log_path)
+		for group in frames:
+			for op in group:
+				persistent = persistent.insert(op[1], op[2])
+		per_entry_time = time.perf_counter() - start
+		results += [
+			Result('durable_replay_bulk_load', replayed, replay_time, _persistent_height(persistent)),
+			Result('durable_replay_per_insert', replayed, per_entry_time, _persistent_height(persistent)),
+		]
+
+		# how long updates are held up by a snapshot, against writing it in the foreground
+		tree = DurableAVLTree(directory, sync='never', group_size=DURABLE_GROUP)
+		start = time.perf_counter()
+		tree.snapshot()
+		pause = time.perf_counter() - start
+		tree.wait_snapshot()
+		start = time.perf_counter()
+		tree.snapshot(wait=True)
+		foreground = time.perf_counter() - start
+		results += [
+			Result('durable_snapshot_pause', tree.size(), pause, _persistent_height(tree.tree)),
+			Result('durable_snapshot_foreground', tree.size(), foreground, _persistent_height(tree.tree)),
+		]
+		tree.close()
+	finally:
+		shutil.rmtree(directory)
+	return results
+
+
+# scaling with worker processes, threads and coroutines
+
+def bench_parallel_union(keys, queries, options):
+	results = []
+	left = _build(keys[0::2])
+	right = _build(keys[1::2] + keys[0::4])
+	for workers in options.workers:
+		start = time.perf_counter()
+		union = ParallelAVL.parallel_union(left, right, workers=workers)
+		results.append(Result('parallel_union[w=%d]' % workers, left.size() + right.size(),
+			time.perf_counter() - start, _height(union)))
+	return results
+
+def bench_concurrent(keys, queries, options):
+	results = []
+	threads = 4
+	for read_ratio in options.read_ratios:
+		tree = ConcurrentAVLTree(_build(keys), optimistic=True)
+		per_thread = len(queries) // threads
+
+		def worker(seed):
+			rng = random.Random(seed)
+			# every thread toggles its own keys, so a delete_key/insert pair never races
+			for key in queries[seed::threads][:per_thread]:
+				if rng.random() < read_ratio:
+					tree.search(key)
+				else:
+					# odd keys are never in the workload, toggle one of them
+					if not tree.delete_key(key + 1):
+						tree.insert(key + 1, key)
+
+		pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+		start = time.perf_counter()
+		for thread in pool:
+			thread.start()
+		for thread in pool:
+			thread.join()
+		results.append(Result('concurrent_mixed[read=%g]' % read_ratio, threads * per_thread,
+			time.perf_counter() - start, _height(tree.tree), optimistic_retries=tree.optimistic_retries))
+	return results
+
+def bench_async(keys, queries, options):
+	tree = AsyncAVLTree(_build(keys))
+	latencies = []
+	clients = 64
+
+	async def client(seed):
+		rng = random.Random(seed)
+		for key in queries[seed::clients]:
+			start = time.perf_counter()
+			if rng.random() < 0.5:
+				await tree.get(key)
+			else:
+				await tree.put(key + 1, key)
+			latencies.append(time.perf_counter() - start)
+
+	async def main():
+		await asyncio.gather(*(client(i) for i in range(clients)))
+
+	start = time.perf_counter()
+	asyncio.run(main())
+	elapsed = time.perf_counter() - start
+	latencies.sort()
+
+	def percentile(p):
+		return latencies[min(int(p * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+	return [Result('async_get_put', len(latencies), elapsed, _height(tree.tree),
+		p50_latency=percentile(0.50), p99_latency=percentile(0.99), p999_latency=percentile(0.999),
+		batches=tree.batches, coalesced=tree.coalesced)]
+
+
+GROUPS = {
+	'core': [bench_insert, bench_finger_insert, bench_search, bench_finger_search, bench_delete,
+		bench_churn, bench_split_join, bench_successor, bench_avl_to_array],
+	'bulk': [bench_from_iterable, bench_batches, bench_range_delete, bench_multimap],
+	'order': [bench_order_statistics, bench_range_scan, bench_bounds, bench_range_aggregate,
+		bench_intervals, bench_key_function],
+	'finger': [bench_tracked_finger, bench_deque, bench_threaded],
+	'backends': [bench_array_backend, bench_fat_nodes, bench_snapshots, bench_mapped,
+		bench_durable],
+	'parallel': [bench_parallel_union],
+	'concurrency': [bench_concurrent, bench_async],
+}
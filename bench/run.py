@@ -0,0 +1,146 @@
+"""
+Benchmark harness for AVLTree and its variants.
+
+	python bench/run.py --sizes 1e3 1e4 1e5 --out results.json
+	python bench/run.py --sizes 1e6 1e7 --dists random zipf --groups core
+	python bench/run.py --out new.json --baseline results.json --threshold 0.10
+
+Every (group, distribution, size) combination is run --repeat times and the
+fastest run of every op is kept. Results record ops/sec and tree height, plus
+the peak traced memory with --memory (the op is then run once more under
+tracemalloc, so timings stay unaffected). With
+--baseline, every op that got slower than baseline * (1 - threshold) is
+reported and the exit status is 1.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.setrecursionlimit(10000)
+
+from ops import GROUPS
+from workloads import DISTRIBUTIONS, make_workload
+
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--sizes', nargs='+', default=['1e3', '1e4', '1e5'],
+		help='tree sizes, e.g. 1e3 1e7 (default: 1e3 1e4 1e5)')
+	parser.add_argument('--dists', nargs='+', default=list(DISTRIBUTIONS), choices=DISTRIBUTIONS)
+	parser.add_argument('--groups', nargs='+', default=['core'], choices=sorted(GROUPS) + ['all'])
+	parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4],
+		help='process counts for the parallel group')
+	parser.add_argument('--read-ratios', nargs='+', type=float, default=[0.5, 0.9, 0.99],
+		help='read fractions for the concurrency group')
+	parser.add_argument('--memory', action='store_true', help='also record peak memory with tracemalloc')
+	parser.add_argument('--repeat', type=int, default=1, help='runs per benchmark, the best one is kept')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--out', help='write the results to this JSON file')
+	parser.add_argument('--baseline', help='compare against the results in this JSON file')
+	parser.add_argument('--threshold', type=float, default=0.10,
+		help='relative ops/sec drop that counts as a regression (default: 0.10)')
+	options = parser.parse_args(argv)
+	options.sizes = [int(float(size)) for size in options.sizes]
+	if 'all' in options.groups:
+		options.groups = sorted(GROUPS)
+	return options
+
+
+def run(options):
+	records = []
+	for group in options.groups:
+		for dist in options.dists:
+			for size in options.sizes:
+				keys, queries = make_workload(dist, size, options.seed)
+				for bench in GROUPS[group]:
+					results = None
+					for i in range(options.repeat):
+						gc.collect()
+						run_results = bench(keys, queries, options)
+						if results is None:
+							results = run_results
+						else:
+							results = [min(old, new, key=lambda result: result.seconds)
+								for old, new in zip(results, run_results)]
+					peaks = {}
+					if options.memory:
+						peaks = _peak_memory(bench, keys, queries, options)
+					for result in results:
+						record = result.as_dict()
+						record.update(group=group, dist=dist, size=size)
+						if peaks:
+							record['peak_bytes'] = peaks
+						records.append(record)
+						print('%-12s %-9s %9d  %-36s %14.0f ops/s  h=%s%s' % (
+							group, dist, size, record['op'], record['ops_per_sec'], record['height'],
+							''.join('  %s=%s' % (name, _format(value)) for name, value in sorted(result.extra.items()))))
+						sys.stdout.flush()
+	return records
+
+def _format(value):
+	return '%.3g' % value if isinstance(value, float) else value
+
+def _peak_memory(bench, keys, queries, options):
+	gc.collect()
+	tracemalloc.start()
+	try:
+		bench(keys, queries, options)
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def _key(record):
+	return (record['group'], record['op'], record['dist'], record['size'])
+
+def compare(records, baseline, threshold):
+	base = {_key(record): record for record in baseline['results']}
+	regressions = []
+	for record in records:
+		old = base.get(_key(record))
+		if old is None or not old['ops_per_sec']:
+			continue
+		ratio = record['ops_per_sec'] / old['ops_per_sec']
+		line = '%-12s %-36s %-9s %9d  %6.2fx' % (record['group'], record['op'], record['dist'], record['size'], ratio)
+		if ratio < 1 - threshold:
+			regressions.append(line)
+			print('REGRESSION ' + line)
+		else:
+			print('           ' + line)
+	return regressions
+
+
+def main(argv=None):
+	options = parse_args(argv)
+	records = run(options)
+	if options.out:
+		document = {
+			'meta': {
+				'python': platform.python_version(),
+				'implementation': platform.python_implementation(),
+				'machine': platform.machine(),
+				'date': datetime.datetime.now().isoformat(timespec='seconds'),
+				'seed': options.seed,
+			},
+			'results': records,
+		}
+		with open(options.out, 'w') as f:
+			json.dump(document, f, indent=1)
+	if options.baseline:
+		with open(options.baseline) as f:
+			baseline = json.load(f)
+		if compare(records, baseline, options.threshold):
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
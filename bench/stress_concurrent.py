@@ -0,0 +1,158 @@
+"""
+Stress test for ConcurrentAVLTree.
+
+	python bench/stress_concurrent.py
+	python bench/stress_concurrent.py --size 100000 --readers 8 --seconds 30
+
+Optimistic readers search a fixed set of stable (even) keys while a writer
+churns odd keys with insert, delete_key and apply_batch. The thread switch
+interval is cut to a microsecond so that reads land inside writes. Every
+search for a stable key must find it, and the tree invariants (order, parent
+links, heights, balance, sizes, min and max) are checked under the write lock
+during the run and at the end. The exit status is 1 on any failure.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AVLTree import AVLTree
+from ConcurrentAVLTree import ConcurrentAVLTree
+
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--size', type=int, default=20000, help='number of stable keys (default: 20000)')
+	parser.add_argument('--readers', type=int, default=4)
+	parser.add_argument('--seconds', type=float, default=5.0)
+	parser.add_argument('--switch-interval', type=float, default=1e-6,
+		help='sys.setswitchinterval during the run (default: 1e-6)')
+	parser.add_argument('--seed', type=int, default=0)
+	return parser.parse_args(argv)
+
+
+"""checks the invariants of an AVLTree that no thread is writing to
+
+@rtype: list
+@returns: a description of every violation found, empty if the tree is valid
+"""
+def check_tree(tree):
+	errors = []
+	virtual = tree.virtual_node
+	count = 0
+	previous = None
+	stack = []
+	node = tree.root
+	if node is not virtual and node.parent is not virtual:
+		errors.append('the root has a parent')
+	while stack or node is not virtual:
+		while node is not virtual:
+			stack.append(node)
+			node = node.left
+		node = stack.pop()
+		count += 1
+		if previous is not None and not previous.skey < node.skey:
+			errors.append('keys out of order at %r' % (node.key,))
+		for child in (node.left, node.right):
+			if child is not virtual and child.parent is not node:
+				errors.append('bad parent link under %r' % (node.key,))
+		left, right = node.left, node.right
+		if node.height != 1 + max(left.height, right.height) or abs(left.height - right.height) > 1:
+			errors.append('bad height or balance at %r' % (node.key,))
+		if node.size != 1 + left.size + right.size:
+			errors.append('bad size at %r' % (node.key,))
+		if len(errors) > 10:
+			return errors
+		previous = node
+		node = node.right
+	if count != tree.size():
+		errors.append('size() is %d, the tree holds %d nodes' % (tree.size(), count))
+	if count and (tree._min_node is not _first(tree) or tree._max_node is not previous):
+		errors.append('stale min or max node')
+	return errors
+
+def _first(tree):
+	node = tree.root
+	while node.left is not tree.virtual_node:
+		node = node.left
+	return node
+
+
+def run(options):
+	rng = random.Random(options.seed)
+	stable = list(range(0, 2 * options.size, 2))
+	tree = ConcurrentAVLTree(AVLTree.from_sorted([(key, key) for key in stable]), optimistic=True)
+	stop = threading.Event()
+	failures = []
+	searches = [0] * options.readers
+
+	def reader(i):
+		local = random.Random(options.seed + i + 1)
+		while not stop.is_set():
+			key = local.choice(stable)
+			node, edges = tree.search(key)
+			searches[i] += 1
+			if node is None or node.key != key:
+				failures.append('stable key %d not found' % key)
+				stop.set()
+
+	def writer():
+		local = random.Random(options.seed)
+		while not stop.is_set():
+			key = 2 * local.randrange(options.size) + 1
+			choice = local.random()
+			if choice < 0.45:
+				if not tree.delete_key(key):
+					tree.insert(key, key)
+			elif choice < 0.9:
+				if tree.search(key)[0] is None:
+					tree.finger_insert(key, key)
+				else:
+					tree.delete_key(key)
+			else:
+				batch = [('delete', 2 * local.randrange(options.size) + 1) for i in range(20)]
+				tree.apply_batch(batch)
+
+	threads = [threading.Thread(target=reader, args=(i,)) for i in range(options.readers)]
+	threads.append(threading.Thread(target=writer))
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(options.switch_interval)
+	try:
+		for thread in threads:
+			thread.start()
+		deadline = time.monotonic() + options.seconds
+		while time.monotonic() < deadline and not stop.is_set():
+			time.sleep(min(0.5, options.seconds / 10))
+			with tree.lock.write_locked():
+				errors = check_tree(tree.tree)
+			if errors:
+				failures.extend(errors)
+				break
+		stop.set()
+		for thread in threads:
+			thread.join()
+	finally:
+		sys.setswitchinterval(interval)
+	failures.extend(check_tree(tree.tree))
+	for key in rng.sample(stable, min(1000, len(stable))):
+		if tree.search(key)[0] is None:
+			failures.append('stable key %d lost' % key)
+
+	print('%d searches, %d optimistic hits, %d retries, %d nodes at the end' % (
+		sum(searches), tree.optimistic_hits, tree.optimistic_retries, tree.size()))
+	for failure in failures[:20]:
+		print('FAIL ' + failure)
+	return failures
+
+
+def main(argv=None):
+	return 1 if run(parse_args(argv)) else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Key distributions for the benchmarks.
+
+Every workload returns (keys, queries): keys is the list of distinct keys in
+the order they are inserted, queries is the order in which they are searched.
+"""
+
+from bisect import bisect_left
+from itertools import accumulate
+import random
+
+
+DISTRIBUTIONS = ('sorted', 'reverse', 'random', 'zipf', 'clustered')
+
+CLUSTER_SIZE = 64
+ZIPF_EXPONENT = 1.1
+
+
+def make_workload(dist, n, seed=0):
+	rng = random.Random(seed)
+	keys = list(range(0, 2 * n, 2))  # even keys, odd ones are free for misses and new inserts
+	if dist == 'sorted':
+		queries = list(keys)
+	elif dist == 'reverse':
+		keys.reverse()
+		queries = list(keys)
+	elif dist == 'random':
+		rng.shuffle(keys)
+		queries = list(keys)
+		rng.shuffle(queries)
+	elif dist == 'zipf':
+		# random insertion order, searches skewed towards a few hot keys
+		rng.shuffle(keys)
+		weights = list(accumulate(1.0 / (rank + 1) ** ZIPF_EXPONENT for rank in range(n)))
+		total = weights[-1]
+		queries = [keys[min(bisect_left(weights, rng.random() * total), n - 1)] for i in range(n)]
+	elif dist == 'clustered':
+		# runs of consecutive keys, the runs themselves in random order
+		runs = [keys[i:i + CLUSTER_SIZE] for i in range(0, n, CLUSTER_SIZE)]
+		rng.shuffle(runs)
+		keys = [key for run in runs for key in run]
+		rng.shuffle(runs)
+		queries = [key for run in runs for key in run]
+	else:
+		raise ValueError("unknown distribution %r" % (dist,))
+	return keys, queries
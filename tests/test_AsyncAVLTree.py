@@ -0,0 +1,80 @@
+"""
+Tests for AsyncAVLTree.
+
+	python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AVLTree import AVLTree, VALUE_SUM
+from AsyncAVLTree import AsyncAVLTree
+
+
+async def _settle(*coroutines):
+	return await asyncio.gather(*coroutines, return_exceptions=True)
+
+
+class TestAsyncAVLTree(unittest.TestCase):
+
+	def test_bad_write_fails_alone(self):
+		tree = AsyncAVLTree(AVLTree.from_sorted([(5, 'five')]))
+
+		async def run():
+			results = await _settle(tree.put(1, 'one'), tree.put('x', 'bad'), tree.remove(5))
+			return results, await tree.range()
+
+		results, items = asyncio.run(run())
+		self.assertIsNone(results[0])
+		self.assertIsInstance(results[1], TypeError)
+		self.assertIs(results[2], True)
+		self.assertEqual(items, [(1, 'one')])
+		self.assertEqual(tree.batches, 1)
+
+	def test_results_follow_the_batch(self):
+		tree = AsyncAVLTree()
+
+		async def run():
+			results = await _settle(tree.put(1, 'a'), tree.remove(1), tree.remove(1), tree.put(1, 'b'))
+			return results, await tree.get(1)
+
+		results, value = asyncio.run(run())
+		self.assertEqual(results, [None, True, False, None])
+		self.assertEqual(value, 'b')
+		self.assertEqual(tree.coalesced, 3)
+
+	def test_writes_merge_by_sort_key(self):
+		tree = AsyncAVLTree(AVLTree(key=str.lower))
+
+		async def run():
+			await _settle(tree.put('A', 1), tree.put('a', 2), tree.put('b', 3))
+			first = await tree.range()
+			removed = await _settle(tree.remove('B'), tree.put('B', 4))
+			return first, removed, await tree.range()
+
+		first, removed, items = asyncio.run(run())
+		self.assertEqual(first, [('A', 2), ('b', 3)])
+		self.assertEqual(removed, [True, None])
+		self.assertEqual(items, [('A', 2), ('B', 4)])
+		self.assertEqual(tree.tree.size(), 2)
+
+	def test_put_updates_the_augmentation(self):
+		tree = AsyncAVLTree(AVLTree.from_sorted([(1, 10), (2, 20), (3, 30)], augment=VALUE_SUM))
+
+		async def run():
+			await tree.put(1, 5)
+
+		asyncio.run(run())
+		self.assertEqual(tree.tree.root.agg, 55)
+
+	def test_cmp_tree_is_rejected(self):
+		with self.assertRaises(ValueError):
+			AsyncAVLTree(AVLTree(cmp=lambda a, b: (a > b) - (a < b)))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,51 @@
+"""
+Tests for the on-disk format of MappedAVLTree.
+
+	python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AVLTree import AVLTree
+
+
+class TestMappedAVLTree(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'tree.avl')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_round_trip(self):
+		pairs = [(key, str(key)) for key in range(-5, 50, 3)]
+		AVLTree.from_sorted(pairs).save(self.path)
+		mapped = AVLTree.load(self.path)
+		try:
+			self.assertEqual(mapped.search(4)[0].value, '4')
+			self.assertIsNone(mapped.search(5)[0])
+		finally:
+			mapped.close()
+		self.assertEqual(AVLTree.load(self.path, mmap=False).avl_to_array(), pairs)
+
+	def test_ordered_trees_are_rejected(self):
+		trees = [
+			AVLTree.from_iterable([(1, 'a'), (2, 'b')], key=lambda k: -k),
+			AVLTree.from_iterable([(1, 'a'), (2, 'b')], cmp=lambda a, b: (a > b) - (a < b)),
+			AVLTree.from_iterable([(1, 'a'), (1, 'b')], multimap=True),
+		]
+		for tree in trees:
+			with self.assertRaises(ValueError):
+				tree.save(self.path)
+		self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+	unittest.main()